@@ -0,0 +1,423 @@
+""" Benchmarks of XY model code
+
+Run from the top of the repository with
+
+    python benchmarks/run_benchmarks.py [--quick] [--backend numba] [--out results.json]
+
+Results are written as JSON together with the commit and versions they
+were taken with. Passing --compare <old results.json> prints the ratio
+of every timing to the one in the old file, so runs on two commits can
+be compared directly.
+"""
+
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+# For parsing command line
+import argparse
+
+# For writing results
+import json
+
+# For temporary save directories
+import tempfile
+
+# For timing
+import time
+
+# For peak memory
+import tracemalloc
+
+# For paths, versions and commit
+import os, sys, platform, subprocess
+
+""" Local modules """
+# Make simulation code importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# For simulations
+from xy_model import XYSimulation
+
+# For reading trajectories
+from trajectory import XYTrajectory
+
+""" Helpers """
+def best_time(func, repeat):
+    """Best time
+
+    Best wall time of repeat calls of func
+
+    Attributes:
+        func (callable): Function to time
+        repeat (int): Number of calls
+    """
+
+    # Initialize times
+    times = []
+
+    # Cycle through calls
+    for _ in range(repeat):
+        # Time call
+        start = time.perf_counter(); func(); times.append(time.perf_counter() - start);
+
+    # Return best time
+    return min(times)
+
+def metadata():
+    """Metadata
+
+    Commit, versions and machine results were taken with
+
+    Attributes:
+        commit (str or None): Commit of repository
+    """
+
+    # Try to get commit
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output = True, text = True,
+                                cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    # Try to get numba version
+    try:
+        import numba; numba_version = numba.__version__;
+    except ImportError:
+        numba_version = None
+
+    # Return metadata
+    return {'commit' : commit, 'time' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python' : platform.python_version(), 'numpy' : np.__version__,
+            'numba' : numba_version, 'machine' : platform.machine(),
+            'processor' : platform.processor(), 'system' : platform.system()}
+
+""" Benchmarks """
+def bench_construction(Ns, backend, repeat):
+    """Lattice construction
+
+    Time to create a simulation with a hot and a cold start
+
+    Attributes:
+        Ns (list): Linear dimensions of lattice
+        backend (str): Kernels of simulation
+        repeat (int): Number of timed calls
+    """
+
+    # Initialize results
+    results = []
+
+    # Cycle through lattice sizes and starts
+    for N in Ns:
+        for start in ({'start' : 'hot'}, {'start' : 'cold', 'angle' : 0.}):
+            # Time construction
+            t = best_time(lambda: XYSimulation(1., N, start = start, backend = backend), repeat)
+
+            # Save result
+            results.append({'name' : 'construction', 'params' : {'N' : N, 'start' : start['start']},
+                            'metrics' : {'seconds' : t}})
+
+    # Return results
+    return results
+
+def bench_updates(Ns, Js, n_updates, n_therm, backend, alg = 'cluster', n_procs = None,
+                  storage = 'float64', growth = 'depth'):
+    """Update throughput
+
+    Updates and flipped sites per second after thermalization
+
+    Attributes:
+        Ns (list): Linear dimensions of lattice
+        Js (list): Couplings
+        n_updates (int): Number of timed updates
+        n_therm (int): Number of untimed updates first
+        backend (str): Kernels of simulation
+        alg (str): Updating algorithm
+        n_procs (int or None): Worker processes of sweeps (None for serial sweeps)
+        storage (str): Storage of angles
+        growth (str): Growth of Wolff clusters
+        n_flipped (int): Number of sites flipped in timed updates
+        procs (int or None): Worker processes of sweeps actually used
+    """
+
+    # Initialize results
+    results = []
+
+    # Cycle through lattice sizes and couplings
+    for N in Ns:
+        for J in Js:
+            # Create thermalized simulation
+            sim = XYSimulation(J, N, alg = alg, backend = backend, storage = storage,
+                               growth = growth)
+            sim.set_parallel(n_procs) if (n_procs is not None) and (alg not in ('cluster', 'sw')) else None
+            [sim.update() for _ in range(n_therm)]
+
+            # Time updates and count flipped sites (every site for sweeps)
+            n_flipped = 0; start = time.perf_counter();
+            for _ in range(n_updates):
+                # Do update
+                sim.update(); n_flipped += len(sim.cluster_sites) if alg in ('cluster', 'sw') else sim.size;
+            t = time.perf_counter() - start
+
+            # Get worker processes actually used (None if sweeps were serial)
+            procs = n_procs if sim.parallel is not None else None
+
+            # Stop workers of parallel sweeps
+            sim.set_serial()
+
+            # Save result
+            results.append({'name' : 'update', 'params' : {'alg' : alg, 'N' : N, 'J' : J,
+                                                          'backend' : sim.backend,
+                                                          'n_procs' : procs,
+                                                          'storage' : storage,
+                                                          'growth' : growth},
+                            'metrics' : {'seconds' : t, 'updates_per_sec' : n_updates / t,
+                                         'sites_per_sec' : n_flipped / t,
+                                         'mean_flipped' : n_flipped / n_updates}})
+
+    # Return results
+    return results
+
+def bench_meas(Ns, backend, repeat):
+    """Measurement cost
+
+    Time of full energy and magnetization measurements, and of
+    the BKT observables and correlator for reference
+
+    Attributes:
+        Ns (list): Linear dimensions of lattice
+        backend (str): Kernels of simulation
+        repeat (int): Number of timed calls
+    """
+
+    # Initialize results
+    results = []
+
+    # Cycle through lattice sizes
+    for N in Ns:
+        # Create simulation
+        sim = XYSimulation(1., N, backend = backend)
+
+        # Compile kernels before timing
+        sim.energ(); sim.magn();
+
+        # Cycle through measurements
+        for name, func in (('energ', sim.energ), ('magn', sim.magn),
+                           ('bkt_meas', sim.bkt_meas), ('correlation', sim.correlation)):
+            # Save result
+            results.append({'name' : 'meas', 'params' : {'obs' : name, 'N' : N,
+                                                        'backend' : sim.backend},
+                            'metrics' : {'seconds' : best_time(func, repeat)}})
+
+    # Return results
+    return results
+
+def bench_checkpoint(Ns, n_saves, backend):
+    """Checkpoint cost
+
+    Time to append a configuration to the trajectory, to read one
+    back and to resume a simulation from one
+
+    Attributes:
+        Ns (list): Linear dimensions of lattice
+        n_saves (int): Number of saved configurations
+        backend (str): Kernels of simulation
+        loc (str): Temporary save directory
+    """
+
+    # Initialize results
+    results = []
+
+    # Cycle through lattice sizes
+    for N in Ns:
+        # Work in temporary directory
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Create simulation
+            loc = tmp_dir + '/'; sim = XYSimulation(1., N, save_loc = loc, backend = backend);
+
+            # Time saves
+            save_times = []
+            for _ in range(n_saves):
+                # Update without saving, then time save
+                sim.update(); start = time.perf_counter();
+                sim._save_conf(sim.alg, False); save_times.append(time.perf_counter() - start);
+
+            # Time reading records
+            traj = XYTrajectory(sim._get_traj(loc, sim.alg).path)
+            read = best_time(lambda: traj.read(sim.conf_num), n_saves)
+
+            # Time resuming simulation
+            resume = best_time(lambda: XYSimulation(1., N, config = sim.conf_num, load_loc = loc,
+                                                   save_loc = loc, backend = backend), 3)
+
+            # Get size of trajectory
+            n_bytes = os.path.getsize(traj.path)
+
+        # Save result
+        results.append({'name' : 'checkpoint', 'params' : {'N' : N, 'backend' : sim.backend},
+                        'metrics' : {'save_seconds' : min(save_times),
+                                     'save_seconds_median' : float(np.median(save_times)),
+                                     'read_seconds' : read, 'resume_seconds' : resume,
+                                     'bytes_per_conf' : n_bytes / n_saves}})
+
+    # Return results
+    return results
+
+def bench_memory(Ns, n_updates, backend, storage = 'float64'):
+    """Peak memory
+
+    Peak memory allocated while creating a simulation and doing
+    updates with it
+
+    Attributes:
+        Ns (list): Linear dimensions of lattice
+        n_updates (int): Number of updates
+        backend (str): Kernels of simulation
+        storage (str): Storage of angles
+    """
+
+    # Initialize results
+    results = []
+
+    # Cycle through lattice sizes
+    for N in Ns:
+        # Start tracing allocations
+        tracemalloc.start()
+
+        # Create simulation and update
+        sim = XYSimulation(1.12, N, backend = backend, storage = storage)
+        [sim.update() for _ in range(n_updates)]
+
+        # Get peak and stop tracing
+        current, peak = tracemalloc.get_traced_memory(); tracemalloc.stop();
+
+        # Save result
+        results.append({'name' : 'memory', 'params' : {'N' : N, 'backend' : sim.backend,
+                                                      'storage' : storage},
+                        'metrics' : {'peak_bytes' : peak, 'current_bytes' : current,
+                                     'peak_bytes_per_site' : peak / sim.size,
+                                     'spin_bytes_per_site' : sum(
+                                         getattr(sim.lattice, key).nbytes
+                                         for key in ('angles', 'cos', 'sin')
+                                         if getattr(sim.lattice, key) is not None) / sim.size}})
+
+        # Free simulation
+        del sim
+
+    # Return results
+    return results
+
+""" Comparison """
+def compare(results, old_results):
+    """Compare results
+
+    Print ratio of new to old value of every metric found in both
+    sets of results
+
+    Attributes:
+        results (dict): New results
+        old_results (dict): Old results
+    """
+
+    # Index old results by name and parameters
+    old = {(r['name'], json.dumps(r['params'], sort_keys = True)) : r['metrics']
+           for r in old_results['results']}
+
+    # Tell user which commits are compared
+    print('new / old (' + str(results['meta']['commit'])[:10] + ' vs '
+          + str(old_results['meta']['commit'])[:10] + ')')
+
+    # Cycle through new results
+    for r in results['results']:
+        # Get matching old metrics
+        old_metrics = old.get((r['name'], json.dumps(r['params'], sort_keys = True)))
+
+        # Skip results without match
+        if old_metrics is None:
+            continue
+
+        # Print ratio of each metric
+        print(r['name'], json.dumps(r['params'], sort_keys = True),
+              ', '.join(key + ' ' + format(value / old_metrics[key], '.3f')
+                        for key, value in r['metrics'].items()
+                        if old_metrics.get(key, 0) != 0))
+
+    # Return nothing
+    return None
+
+""" Main """
+def main(argv = None):
+    """Run benchmarks
+
+    Attributes:
+        args (Namespace): Command line arguments
+        size (dict): Sizes of benchmarks
+    """
+
+    # Parse command line
+    parser = argparse.ArgumentParser(description = 'Benchmarks of XY model code')
+    parser.add_argument('--quick', action = 'store_true', help = 'small sizes for a quick check')
+    parser.add_argument('--backend', default = 'numpy', help = "'numpy' or 'numba'")
+    parser.add_argument('--algs', nargs = '*', default = ['cluster'],
+                        help = 'updating algorithms of update benchmark')
+    parser.add_argument('--procs', type = int, default = None,
+                        help = 'worker processes of parallel sweeps (default serial sweeps)')
+    parser.add_argument('--storage', default = 'float64',
+                        help = "storage of angles ('float64', 'float32' or 'uint16')")
+    parser.add_argument('--growth', default = 'depth',
+                        help = "growth of Wolff clusters ('depth' or 'frontier')")
+    parser.add_argument('--out', default = None, help = 'JSON file for results (default stdout)')
+    parser.add_argument('--compare', default = None, help = 'JSON file of earlier results')
+    parser.add_argument('--only', nargs = '*', default = None,
+                        help = 'run only these benchmarks (construction, update, meas, '
+                               'checkpoint, memory)')
+    args = parser.parse_args(argv)
+
+    # Set sizes of benchmarks
+    if args.quick is True:
+        size = {'Ns' : [16, 32], 'Js' : [0.8, 1.12, 1.4], 'n_updates' : 200,
+                'n_therm' : 50, 'repeat' : 3, 'n_saves' : 20}
+    else:
+        size = {'Ns' : [32, 64, 128], 'Js' : [0.8, 1.0, 1.12, 1.2, 1.4], 'n_updates' : 1000,
+                'n_therm' : 200, 'repeat' : 5, 'n_saves' : 100}
+
+    # Define benchmarks
+    benchmarks = {'construction' : lambda: bench_construction(size['Ns'], args.backend,
+                                                              size['repeat']),
+                  'update' : lambda: sum([bench_updates(size['Ns'], size['Js'], size['n_updates'],
+                                                        size['n_therm'], args.backend, alg,
+                                                        args.procs, args.storage, args.growth)
+                                          for alg in args.algs], []),
+                  'meas' : lambda: bench_meas(size['Ns'], args.backend, size['repeat']),
+                  'checkpoint' : lambda: bench_checkpoint(size['Ns'], size['n_saves'],
+                                                          args.backend),
+                  'memory' : lambda: bench_memory(size['Ns'], size['n_therm'], args.backend,
+                                                  args.storage)}
+
+    # Run benchmarks
+    results = {'meta' : dict(metadata(), quick = args.quick, backend = args.backend),
+               'results' : []}
+    for name, bench in benchmarks.items():
+        # Run benchmark if selected
+        if (args.only is None) or (name in args.only):
+            # Tell user and run
+            print('Running ' + name + ' benchmarks', file = sys.stderr)
+            results['results'] += bench()
+
+    # Write results
+    if args.out is None:
+        print(json.dumps(results, indent = 1))
+    else:
+        with open(args.out, 'w') as out_file:
+            json.dump(results, out_file, indent = 1)
+
+    # Compare with earlier results if requested
+    if args.compare is not None:
+        with open(args.compare, 'r') as in_file:
+            compare(results, json.load(in_file))
+
+    # Return results
+    return results
+
+if __name__ == '__main__':
+    main()
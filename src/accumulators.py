@@ -0,0 +1,524 @@
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+""" Accumulator base class """
+class XYAccumulator(object):
+    """Online accumulator
+
+    Base class of online accumulators. An accumulator consumes one
+    observable (or a tuple of observables) from the dictionary of
+    observables measured after every update, uses constant memory,
+    and can be saved to and restored from a JSON-friendly state
+
+    Attributes:
+        obs (str or tuple): Name(s) of observable(s) consumed
+    """
+    def __init__(self, obs):
+        # Save name of observable
+        self.obs = obs
+
+        # Return nothing
+        return None
+
+    """ Public methods """
+    def push_obs(self, obs_dict):
+        """Push observables
+
+        Push value(s) of consumed observable(s) from dictionary
+
+        Attributes:
+            obs_dict (dict): Observables measured after an update
+        """
+
+        # Check if several observables are consumed
+        if isinstance(self.obs, (tuple, list)):
+            # Push vector of observables
+            self.push(np.array([obs_dict[key] for key in self.obs], dtype = np.float64))
+        else: # Otherwise, push single observable
+            # Push observable
+            self.push(np.asarray(obs_dict[self.obs], dtype = np.float64))
+
+        # Return nothing
+        return None
+
+    def get_state(self):
+        """Get state
+
+        Get JSON-friendly state, including class and arguments
+
+        Attributes:
+        """
+
+        # Get attributes as lists
+        state = {key : (val.tolist() if isinstance(val, np.ndarray) else val)
+                 for key, val in vars(self).items()}
+
+        # Save class name
+        state['class'] = type(self).__name__
+
+        # Return state
+        return state
+
+    def set_state(self, state):
+        """Set state
+
+        Set state saved by get_state
+
+        Attributes:
+            state (dict): State to restore
+        """
+
+        # Cycle through attributes
+        for key, val in state.items():
+            # Restore arrays as arrays
+            if isinstance(getattr(self, key, None), np.ndarray):
+                # Restore array
+                val = np.array(val, dtype = getattr(self, key).dtype)
+
+            # Set attribute
+            setattr(self, key, val) if key != 'class' else None
+
+        # Return nothing
+        return None
+
+""" Running mean class """
+class RunningMean(XYAccumulator):
+    """Running mean and variance
+
+    Running mean and variance by Welford's algorithm
+
+    Attributes:
+        n (int): Number of values pushed
+        mean (array): Running mean
+        m2 (array): Running sum of squared deviations
+    """
+    def __init__(self, obs):
+        # Initialize base class
+        XYAccumulator.__init__(self, obs)
+
+        # Initialize running values
+        self.n = 0; self.mean = np.zeros(()); self.m2 = np.zeros(());
+
+        # Return nothing
+        return None
+
+    """ Public methods """
+    def push(self, x):
+        """Push value
+
+        Push value
+
+        Attributes:
+            x (array): Value
+            delta (array): Deviation of value from old mean
+        """
+
+        # Update number of values
+        self.n += 1
+
+        # Get deviation from old mean
+        delta = x - self.mean
+
+        # Update mean
+        self.mean = self.mean + delta / self.n
+
+        # Update sum of squared deviations
+        self.m2 = self.m2 + delta * (x - self.mean)
+
+        # Return nothing
+        return None
+
+    def var(self):
+        """Get variance
+
+        Get sample variance
+
+        Attributes:
+        """
+
+        # Return variance
+        return self.m2 / max(self.n - 1, 1)
+
+    def summary(self):
+        """Get summary
+
+        Get mean, variance and naive error of mean
+
+        Attributes:
+        """
+
+        # Return summary
+        return {'mean' : self.mean, 'var' : self.var(),
+                'err' : np.sqrt(self.var() / max(self.n, 1))}
+
+""" Log binning class """
+class LogBinning(XYAccumulator):
+    """Logarithmic binning analysis
+
+    Online binning analysis with block sizes 1, 2, 4, ... Values are
+    paired up as they arrive, so only one pending value per level is
+    kept. The error of the mean estimated at each level grows with
+    block size until blocks are longer than the autocorrelation time,
+    and tau_int = err_k^2 / (2 err_0^2) at the plateau
+
+    Attributes:
+        n_levels (int): Number of binning levels
+        count (array): Number of blocks at each level
+        total (array): Sum of block means at each level
+        total_sq (array): Sum of squared block means at each level
+        pending (array): Value waiting for partner at each level
+        has_pending (array): Whether a value is waiting at each level
+    """
+    def __init__(self, obs, n_levels = 32):
+        # Initialize base class
+        XYAccumulator.__init__(self, obs)
+
+        # Save number of levels
+        self.n_levels = n_levels
+
+        # Initialize sums of block means
+        self.count = np.zeros(n_levels, dtype = np.int64)
+        self.total = np.zeros(n_levels); self.total_sq = np.zeros(n_levels);
+
+        # Initialize pending values
+        self.pending = np.zeros(n_levels); self.has_pending = np.zeros(n_levels, dtype = bool);
+
+        # Return nothing
+        return None
+
+    """ Public methods """
+    def push(self, x):
+        """Push value
+
+        Push value and carry pairs up through levels
+
+        Attributes:
+            x (float): Value
+        """
+
+        # Cycle through levels
+        for level in range(self.n_levels):
+            # Add block mean to level
+            self.count[level] += 1; self.total[level] += x; self.total_sq[level] += x * x;
+
+            # Check if no value is waiting at level
+            if not self.has_pending[level]:
+                # Wait for partner
+                self.pending[level] = x; self.has_pending[level] = True;
+
+                # Done
+                break
+
+            # Pair with waiting value
+            x = 0.5 * (self.pending[level] + x); self.has_pending[level] = False;
+
+        # Return nothing
+        return None
+
+    def errors(self):
+        """Get errors
+
+        Get error of mean estimated at each level with blocks
+
+        Attributes:
+            n (array): Number of blocks at each level
+            var (array): Variance of block means at each level
+        """
+
+        # Get levels with at least two blocks
+        n = self.count[self.count > 1].astype(np.float64)
+
+        # Get variance of block means
+        var = (self.total_sq[:len(n)] - self.total[:len(n)]**2 / n) / (n - 1)
+
+        # Return errors
+        return np.sqrt(np.maximum(var, 0.) / n)
+
+    def summary(self, min_blocks = 32):
+        """Get summary
+
+        Get mean, binned error and tau_int, using the highest
+        level with at least min_blocks blocks
+
+        Attributes:
+            min_blocks (int): Fewest blocks for a trustworthy level
+            errs (array): Error at each level
+            level (int): Level used
+        """
+
+        # Get errors
+        errs = self.errors()
+
+        # Get highest level with enough blocks
+        level = max(int(np.sum(self.count[:len(errs)] >= min_blocks)) - 1, 0)
+
+        # Check if there is anything to report
+        if len(errs) == 0:
+            # Return mean only
+            return {'mean' : self.total[0] / max(self.count[0], 1),
+                    'err' : np.nan, 'tau_int' : np.nan, 'errors' : errs}
+
+        # Return summary
+        return {'mean' : self.total[0] / self.count[0], 'err' : errs[level],
+                'tau_int' : 0.5 * (errs[level] / errs[0])**2 if errs[0] > 0. else np.nan,
+                'errors' : errs}
+
+""" Jackknife class """
+class JackknifeBins(XYAccumulator):
+    """Jackknife over bins
+
+    Keeps a fixed number of bins of one or more observables. When
+    every bin is full, neighboring bins are merged and the bin size
+    doubles, so memory stays constant. Jackknife estimates of any
+    function of the means are computed over the full bins
+
+    Attributes:
+        n_bins (int): Number of bins (even)
+        bin_size (int): Number of values per full bin
+        sums (array): Sum of values in each bin
+        counts (array): Number of values in each bin
+        current (int): Bin being filled
+    """
+    def __init__(self, obs, n_bins = 64):
+        # Initialize base class
+        XYAccumulator.__init__(self, obs)
+
+        # Save number of bins
+        self.n_bins = n_bins + n_bins % 2
+
+        # Initialize bins
+        self.bin_size = 1; self.current = 0;
+        self.sums = np.zeros((self.n_bins, len(obs) if isinstance(obs, (tuple, list)) else 1))
+        self.counts = np.zeros(self.n_bins, dtype = np.int64)
+
+        # Return nothing
+        return None
+
+    """ Public methods """
+    def push(self, x):
+        """Push value
+
+        Push value into current bin, merging bins when all are full
+
+        Attributes:
+            x (array): Value(s)
+        """
+
+        # Add value to current bin
+        self.sums[self.current] += x; self.counts[self.current] += 1;
+
+        # Check if current bin is full
+        if self.counts[self.current] == self.bin_size:
+            # Move on to next bin
+            self.current += 1
+
+        # Check if all bins are full
+        if self.current == self.n_bins:
+            # Merge neighboring bins
+            self.sums[:self.n_bins // 2] = self.sums[0::2] + self.sums[1::2]
+            self.counts[:self.n_bins // 2] = self.counts[0::2] + self.counts[1::2]
+
+            # Empty second half
+            self.sums[self.n_bins // 2:] = 0.; self.counts[self.n_bins // 2:] = 0;
+
+            # Double bin size
+            self.bin_size *= 2; self.current = self.n_bins // 2;
+
+        # Return nothing
+        return None
+
+    def jackknife(self, func = None):
+        """Jackknife estimate
+
+        Jackknife estimate and error of func of the means over
+        the full bins. func takes the array of means of the
+        observables (in the order of self.obs)
+
+        Attributes:
+            func (function or None): Function of means (None for means)
+            full (int): Number of full bins
+            loo (array): Means leaving out one bin at a time
+            f_loo (array): Function of leave-one-out means
+        """
+
+        # Default to means themselves
+        func = (lambda m: m) if func is None else func
+
+        # Get number of full bins
+        full = self.current
+
+        # Check if there are enough bins
+        if full < 2:
+            # Nothing to estimate from
+            return np.nan, np.nan
+
+        # Get means leaving out one bin at a time
+        loo = ((self.sums[:full].sum(axis = 0) - self.sums[:full])
+               / (self.counts[:full].sum() - self.counts[:full])[:, None])
+
+        # Get function of leave-one-out means
+        f_loo = np.array([func(np.squeeze(m)) for m in loo])
+
+        # Get function of all means
+        f_all = func(np.squeeze(self.sums[:full].sum(axis = 0) / self.counts[:full].sum()))
+
+        # Return bias-corrected estimate and error
+        return (full * f_all - (full - 1) * f_loo.mean(axis = 0),
+                np.sqrt((full - 1) * np.mean((f_loo - f_loo.mean(axis = 0))**2, axis = 0)))
+
+    def summary(self):
+        """Get summary
+
+        Get jackknife means and errors of observables
+
+        Attributes:
+        """
+
+        # Get jackknife means and errors
+        mean, err = self.jackknife()
+
+        # Return summary
+        return {'mean' : mean, 'err' : err, 'bin_size' : self.bin_size,
+                'n_bins' : self.current}
+
+""" Autocorrelation class """
+class AutoCorrelation(XYAccumulator):
+    """Integrated autocorrelation time
+
+    Online autocorrelation function up to a maximum lag, from a
+    ring buffer of the last max_lag values and running sums of
+    lagged products. The integrated autocorrelation time uses
+    Sokal's automatic window: the smallest W with W >= c tau_int(W)
+
+    Attributes:
+        max_lag (int): Largest lag measured
+        c (float): Window factor
+        n (int): Number of values pushed
+        total (float): Sum of values
+        lag_sums (array): Sum of x_i x_(i+t) for each lag t
+        lag_ends (array): Sum of values that start and end lagged pairs
+        buffer (array): Last max_lag values
+        head (int): Position of newest value in buffer
+    """
+    def __init__(self, obs, max_lag = 1000, c = 5.):
+        # Initialize base class
+        XYAccumulator.__init__(self, obs)
+
+        # Save largest lag and window factor
+        self.max_lag = max_lag; self.c = c;
+
+        # Initialize running sums
+        self.n = 0; self.total = 0.;
+        self.lag_sums = np.zeros(max_lag); self.lag_ends = np.zeros((2, max_lag));
+
+        # Initialize ring buffer
+        self.buffer = np.zeros(max_lag); self.head = 0;
+
+        # Return nothing
+        return None
+
+    """ Public methods """
+    def push(self, x):
+        """Push value
+
+        Push value and update lagged sums
+
+        Attributes:
+            x (float): Value
+            n_lags (int): Number of lags with a partner
+            past (array): Values at lags 0, 1, ... (newest first)
+        """
+
+        # Save value in ring buffer
+        self.head = (self.head + 1) % self.max_lag; self.buffer[self.head] = x;
+
+        # Update running sums
+        self.n += 1; self.total += x;
+
+        # Get number of lags with a partner
+        n_lags = min(self.n, self.max_lag)
+
+        # Get past values, newest first
+        past = self.buffer[(self.head - np.arange(n_lags)) % self.max_lag]
+
+        # Update lagged products
+        self.lag_sums[:n_lags] += x * past
+
+        # Update sums of pair ends
+        self.lag_ends[0, :n_lags] += past; self.lag_ends[1, :n_lags] += x;
+
+        # Return nothing
+        return None
+
+    def rho(self):
+        """Get autocorrelation function
+
+        Get normalized autocorrelation function at each lag
+
+        Attributes:
+            n_pairs (array): Number of pairs at each lag
+            cov (array): Autocovariance at each lag
+        """
+
+        # Get number of pairs at each lag
+        n_pairs = np.maximum(self.n - np.arange(self.max_lag), 0)[:min(self.n, self.max_lag)]
+
+        # Get autocovariance at each lag
+        cov = (self.lag_sums[:len(n_pairs)] / n_pairs
+               - self.lag_ends[0, :len(n_pairs)] * self.lag_ends[1, :len(n_pairs)] / n_pairs**2)
+
+        # Return autocorrelation function
+        return cov / cov[0] if (len(cov) > 0) and (cov[0] > 0.) else np.zeros(len(cov))
+
+    def tau_int(self):
+        """Get integrated autocorrelation time
+
+        Get integrated autocorrelation time with automatic window
+
+        Attributes:
+            taus (array): tau_int with window W for each W
+            ok (array): Whether W >= c tau_int(W)
+        """
+
+        # Get tau_int for each window
+        taus = 0.5 + np.cumsum(self.rho()[1:])
+
+        # Check which windows are long enough
+        ok = np.arange(1, len(taus) + 1) >= self.c * taus
+
+        # Return tau_int at smallest good window (largest if none is)
+        return taus[np.argmax(ok)] if ok.any() else (taus[-1] if len(taus) > 0 else np.nan)
+
+    def summary(self):
+        """Get summary
+
+        Get mean and integrated autocorrelation time
+
+        Attributes:
+        """
+
+        # Get integrated autocorrelation time
+        tau = self.tau_int()
+
+        # Return summary
+        return {'mean' : self.total / max(self.n, 1), 'tau_int' : tau}
+
+""" Accumulator helpers """
+def accumulator_from_state(state):
+    """Rebuild accumulator
+
+    Rebuild accumulator from state saved by get_state
+
+    Attributes:
+        state (dict): Saved state
+    """
+
+    # Create accumulator of right class
+    acc = globals()[state['class']](state['obs'])
+
+    # Restore state
+    acc.set_state(state)
+
+    # Return accumulator
+    return acc
@@ -0,0 +1,422 @@
+""" Offline analysis of saved configurations
+
+Measure observables on every saved configuration of an ensemble,
+spread over worker processes. Run from the top of the repository with
+
+    python src/analysis.py <save_loc> <ensemble name> [--meas meas bkt_meas] [--procs 8] [--out table.tsv]
+
+which prints ensemble averages with binning errors as JSON.
+"""
+
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+# For worker processes
+import multiprocessing as mp
+
+# For parsing command line
+import argparse
+
+# For parsing ensemble and file names
+import re
+
+# For finding files
+import glob
+
+# For reading legacy configurations
+import pickle
+
+# For printing summaries
+import json
+
+# For counting cores and paths
+import os
+
+""" Local modules """
+# For reading trajectories
+from trajectory import XYTrajectory
+
+# For lattice of configurations
+from xy_lattice import XYLattice
+
+# For measurements
+from xy_meas import XYMeas
+
+# For binning errors
+from accumulators import LogBinning
+
+""" Helpers """
+def parse_ens_name(ens_name):
+    """Parse ensemble name
+
+    Get lattice shape, coupling, boundary conditions and storage
+    from an ensemble name (see XYSimulation._set_ens_name)
+
+    Attributes:
+        ens_name (str): Ensemble name, e.g. xyl16t16J1p0, xyl16x16t16J1p0open2f32 or xyl16t16J1e-05
+        match (Match): Parts of ensemble name
+        shape (tuple): Extent of lattice along each axis
+        storage (str): Storage of angles
+    """
+
+    # Split ensemble name into parts
+    match = re.fullmatch(r'xyl([\dx]+)t(\d+)J(-?[\dp]+?(?:e[-+]?\d+)?)(open\d+)?(f32|q\d+)?_?', ens_name)
+
+    # Check that name is an ensemble name
+    if match is None:
+        # Tell user name is not understood
+        raise ValueError('Cannot parse ensemble name ' + repr(ens_name))
+
+    # Get shape of lattice
+    shape = tuple(int(L) for L in match.group(1).split('x')) + (int(match.group(2)),)
+
+    # Get storage of angles
+    storage = {None : 'float64', 'f32' : 'float32'}.get(match.group(5), 'uint16')
+
+    # Return parameters of ensemble
+    return {'shape' : shape, 'J' : float(match.group(3).replace('p', '.')),
+            'bc' : tuple('open' if (match.group(4) is not None) and (str(mu) in match.group(4)[4:])
+                         else 'periodic' for mu in range(len(shape))),
+            'storage' : storage, 'q' : int(match.group(5)[1:]) if storage == 'uint16' else None}
+
+def find_configs(loc, ens_name, alg = 'cluster', conf_min = 0):
+    """Find configurations
+
+    Find saved configurations of an ensemble and algorithm in
+    directory loc, in the trajectory file or else as legacy
+    pickled .lat files
+
+    Attributes:
+        loc (str): Directory of configurations
+        ens_name (str): Ensemble name
+        alg (str): MC algorithm that generated configurations
+        conf_min (int): Smallest configuration number to keep
+        path (str): Location of trajectory file
+        conf_nums (array): Configuration numbers found
+    """
+
+    # Get location of trajectory
+    path = os.path.join(loc, ens_name.rstrip('_') + '_' + alg + '.traj')
+
+    # Check if trajectory exists
+    if os.path.exists(path):
+        # Get configuration numbers of records
+        conf_nums = np.unique(XYTrajectory(path).conf_nums())
+    else: # Otherwise, look for legacy files
+        # Get configuration numbers from file names
+        path = os.path.join(loc, ens_name.rstrip('_') + '_' + alg + '.{}.lat')
+        conf_nums = np.unique([int(name.split('.')[-2]) for name in glob.glob(path.format('*'))
+                               if name.split('.')[-2].isdigit()]).astype(np.int64)
+
+    # Return source and number of every configuration
+    return [(path, int(conf_num)) for conf_num in conf_nums if conf_num >= conf_min]
+
+""" Measurement helpers """
+class _ConfMeas(XYMeas):
+    """Measurements of saved configurations
+
+    Holds one lattice whose angles are replaced by those of each
+    configuration read, so the neighbor structure is built once
+
+    Attributes:
+        J (float): Coupling
+        size (int): Number of lattice sites
+        backend (str): Backend of energy and magnetization sums
+        lattice (XYLattice): Lattice of current configuration
+        measures (list): Names of XYMeas methods or functions of this object
+        conf_num (int): Number of current configuration
+    """
+    def __init__(self, params, measures, backend = 'numpy'):
+        # Save coupling and backend
+        self.J = params['J']; self.backend = backend;
+
+        # Create lattice
+        self.lattice = XYLattice(np.zeros(int(np.prod(params['shape']))), params['shape'],
+                                 params['bc'], params['storage'], params['q'])
+
+        # Save number of lattice sites
+        self.size = self.lattice.size
+
+        # Save measurements
+        self.measures = list(measures)
+
+        # Initialize open trajectories
+        self._trajs = {}
+
+        # Return nothing
+        return None
+
+    def load(self, path, conf_num):
+        """Load configuration
+
+        Read angles of configuration into lattice
+
+        Attributes:
+            path (str): Trajectory file, or name pattern of legacy files
+            conf_num (int): Configuration number
+        """
+
+        # Check if configuration is in a trajectory
+        if path.endswith('.traj'):
+            # Open trajectory if necessary
+            self._trajs[path] = self._trajs.get(path) or XYTrajectory(path)
+
+            # Read stored angles
+            angles = self._trajs[path].read(conf_num, raw = True)[0]
+        else: # Otherwise, read legacy file
+            # Read angles
+            with open(path.format(conf_num), 'rb') as in_file:
+                angles = pickle.load(in_file)
+
+        # Set angles of lattice
+        self.lattice.set_angles(angles); self.conf_num = conf_num;
+
+        # Return nothing
+        return None
+
+    def measure(self, items):
+        """Measure configurations
+
+        Load each configuration and run every measurement,
+        keeping scalar results
+
+        Attributes:
+            items (list): Source and number of each configuration
+            rows (list): Results of each configuration
+        """
+
+        # Initialize results
+        rows = []
+
+        # Cycle through configurations
+        for path, conf_num in items:
+            # Load configuration
+            self.load(path, conf_num); row = {'conf_num' : conf_num};
+
+            # Cycle through measurements
+            for measure in self.measures:
+                # Run measurement
+                obs = getattr(self, measure)() if isinstance(measure, str) else measure(self)
+
+                # Keep scalar results
+                row.update({key : float(x) for key, x in obs.items() if np.ndim(x) == 0})
+
+            # Save results
+            rows.append(row)
+
+        # Return results
+        return rows
+
+# Measurements of worker process
+_worker_meas = None
+
+def _init_worker(params, measures, backend):
+    """Initialize worker
+
+    Create measurements of worker process
+
+    Attributes:
+        params (dict): Parameters of ensemble
+        measures (list): Measurements
+        backend (str): Backend of energy and magnetization sums
+    """
+
+    # Create measurements
+    global _worker_meas
+    _worker_meas = _ConfMeas(params, measures, backend)
+
+    # Return nothing
+    return None
+
+def _measure_chunk(items):
+    """Measure chunk
+
+    Measure chunk of configurations in worker process
+
+    Attributes:
+        items (list): Source and number of each configuration
+    """
+
+    # Return results
+    return _worker_meas.measure(items)
+
+""" Analysis class """
+class XYAnalysis(object):
+    """Offline analysis of an ensemble
+
+    Runs measurements on every saved configuration of an ensemble
+    without creating simulation objects. Angles are read straight
+    from the trajectory (or legacy .lat files) into one lattice per
+    worker process, and chunks of configurations are spread over a
+    pool of workers. Results come back in order of configuration
+    number and are streamed into one table (optionally written to a
+    tab-separated file as they arrive) and into binning accumulators
+    for ensemble averages with errors.
+
+    Measurements are names of XYMeas methods that return
+    dictionaries ('meas', 'bkt_meas', 'correlation') or functions
+    of the measurement object (which has lattice, J, size and
+    conf_num) returning a dictionary. Functions must be picklable,
+    i.e. defined at module level. Only scalar results are kept.
+
+    Attributes:
+        loc (str): Directory of configurations
+        ens_name (str): Ensemble name
+        alg (str): MC algorithm that generated configurations
+        params (dict): Shape, coupling, boundaries and storage of ensemble
+        configs (list): Source and number of each configuration
+        n_procs (int): Number of worker processes (0 to run in-process)
+        chunk (int): Configurations per task of a worker
+        backend (str): Backend of energy and magnetization sums
+        table (dict or None): Column of results for each observable
+        binning (dict): LogBinning accumulator of each observable
+    """
+    def __init__(self, loc, ens_name, alg = 'cluster', conf_min = 0, n_procs = None,
+                 chunk = 64, backend = 'numpy'):
+        # Save location, ensemble and algorithm
+        self.loc = loc; self.ens_name = ens_name; self.alg = alg;
+
+        # Get parameters of ensemble
+        self.params = parse_ens_name(ens_name)
+
+        # Find configurations
+        self.configs = find_configs(loc, ens_name, alg, conf_min)
+
+        # Set number of worker processes
+        self.n_procs = os.cpu_count() if n_procs is None else n_procs
+
+        # Save chunk size and backend
+        self.chunk = chunk; self.backend = backend;
+
+        # Initialize results
+        self.table = None; self.binning = {};
+
+        # Return nothing
+        return None
+
+    """ Private methods """
+    def __rows(self, measures):
+        """Stream rows
+
+        Generator of results of each configuration, in order
+
+        Attributes:
+            measures (list): Measurements
+            chunks (list): Chunks of configurations
+        """
+
+        # Cut configurations into chunks
+        chunks = [self.configs[i:i + self.chunk] for i in range(0, len(self.configs), self.chunk)]
+
+        # Check if measurements run in-process
+        if self.n_procs == 0:
+            # Measure chunks here
+            meas = _ConfMeas(self.params, measures, self.backend)
+            for chunk in chunks:
+                yield from meas.measure(chunk)
+        else: # Otherwise, use pool of workers
+            # Start workers
+            with mp.Pool(self.n_procs, _init_worker, (self.params, measures, self.backend)) as pool:
+                # Hand over results as chunks are done
+                for rows in pool.imap(_measure_chunk, chunks):
+                    yield from rows
+
+    """ Public methods """
+    def run(self, measures = ('meas',), out = None):
+        """Run analysis
+
+        Measure every configuration, filling table and binning
+        accumulators (and out, if given)
+
+        Attributes:
+            measures (list): Measurements
+            out (str or None): Tab-separated file for table
+            columns (dict): Results of each observable
+        """
+
+        # Initialize columns and output file
+        columns = None; out_file = open(out, 'w') if out is not None else None;
+
+        # Stream results
+        try:
+            # Cycle through configurations
+            for row in self.__rows(measures):
+                # Set up columns with first row
+                if columns is None:
+                    # Create columns and accumulators
+                    columns = {key : [] for key in row}
+                    self.binning = {key : LogBinning(key) for key in row if key != 'conf_num'}
+
+                    # Write header
+                    out_file.write('\t'.join(row) + '\n') if out_file is not None else None
+
+                # Add row to columns and accumulators
+                [columns[key].append(x) for key, x in row.items()]
+                [acc.push(row[key]) for key, acc in self.binning.items()]
+
+                # Write row
+                (out_file.write('\t'.join(repr(x) for x in row.values()) + '\n')
+                 if out_file is not None else None)
+        finally:
+            # Close output file
+            out_file.close() if out_file is not None else None
+
+        # Save table
+        self.table = {key : np.array(col) for key, col in (columns or {}).items()}
+
+        # Return table
+        return self.table
+
+    def summary(self, min_blocks = 32):
+        """Get summary
+
+        Get mean, binned error and tau_int of every observable
+        (see LogBinning.summary)
+
+        Attributes:
+            min_blocks (int): Fewest blocks for a trustworthy level
+        """
+
+        # Return summary of each observable
+        return {key : {k : v for k, v in acc.summary(min_blocks).items() if k != 'errors'}
+                for key, acc in self.binning.items()}
+
+""" Main """
+def main(argv = None):
+    """Run analysis
+
+    Attributes:
+        args (Namespace): Command line arguments
+        analysis (XYAnalysis): Analysis of ensemble
+    """
+
+    # Parse command line
+    parser = argparse.ArgumentParser(description = 'Measure saved configurations of an ensemble')
+    parser.add_argument('loc', help = 'directory of configurations')
+    parser.add_argument('ens_name', help = 'ensemble name, e.g. xyl16t16J1p0')
+    parser.add_argument('--alg', default = 'cluster', help = 'algorithm that saved configurations')
+    parser.add_argument('--meas', nargs = '*', default = ['meas'],
+                        help = "measurements ('meas', 'bkt_meas', 'correlation')")
+    parser.add_argument('--conf-min', type = int, default = 0,
+                        help = 'smallest configuration number (skip thermalization)')
+    parser.add_argument('--procs', type = int, default = None,
+                        help = 'worker processes (default all cores, 0 in-process)')
+    parser.add_argument('--chunk', type = int, default = 64, help = 'configurations per task')
+    parser.add_argument('--backend', default = 'numpy', help = "'numpy' or 'numba'")
+    parser.add_argument('--out', default = None, help = 'tab-separated file for table')
+    args = parser.parse_args(argv)
+
+    # Measure every configuration
+    analysis = XYAnalysis(args.loc, args.ens_name, args.alg, args.conf_min, args.procs,
+                          args.chunk, args.backend)
+    analysis.run(args.meas, args.out)
+
+    # Print summary
+    print(json.dumps(analysis.summary(), indent = 1))
+
+    # Return analysis
+    return analysis
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+""" External modules """
+# For background writes
+import threading
+
+# For bounded queue of pending writes
+import queue
+
+# For flushing on exit
+import atexit
+
+""" Checkpoint writer class """
+class XYCheckpointWriter(object):
+    """Background checkpoint writer
+
+    Runs writes of checkpoints in a background thread. The update
+    loop only snapshots what is to be written (copies of angles and
+    states) and hands a write to submit; encoding and disk I/O happen
+    off the update loop, where file writes release the GIL. Pending
+    writes wait in a bounded queue: when it is full, submit blocks
+    until the writer catches up (back-pressure), so a slow file
+    system slows updates down instead of growing memory. Writes are
+    done in the order they were submitted. An error in a write is
+    raised by the next call of submit, flush or close. Pending writes
+    are flushed at interpreter exit.
+
+    Attributes:
+        max_pending (int): Size of queue of pending writes
+        n_written (int): Number of writes done
+        n_blocked (int): Number of submits that had to wait for space
+    """
+    def __init__(self, max_pending = 8):
+        # Save size of queue
+        self.max_pending = max_pending
+
+        # Create queue of pending writes
+        self._queue = queue.Queue(maxsize = max_pending)
+
+        # Initialize statistics and first error
+        self.n_written = 0; self.n_blocked = 0; self._error = None;
+
+        # Start writer thread
+        self._thread = threading.Thread(target = self.__run, name = 'xy-checkpoint-writer',
+                                        daemon = True)
+        self._thread.start()
+
+        # Flush pending writes at exit
+        atexit.register(self.close)
+
+        # Return nothing
+        return None
+
+    """ Private methods """
+    def __run(self):
+        """Run writer
+
+        Do writes from queue until closed
+
+        Attributes:
+            task (tuple or None): Write to do (None to stop)
+        """
+
+        # Keep writing
+        while True:
+            # Get next write
+            task = self._queue.get()
+
+            # Check if writer is closed
+            if task is None:
+                # Stop
+                self._queue.task_done(); break;
+
+            # Do write, keeping first error
+            try:
+                task[0](*task[1]); self.n_written += 1;
+            except BaseException as error:
+                self._error = error if self._error is None else self._error
+            finally:
+                self._queue.task_done()
+
+        # Return nothing
+        return None
+
+    def __raise(self):
+        """Raise error
+
+        Raise first error of a write, if any
+
+        Attributes:
+        """
+
+        # Check if a write failed
+        if self._error is not None:
+            # Hand error to caller once
+            error = self._error; self._error = None;
+            raise RuntimeError('Background checkpoint write failed') from error
+
+        # Return nothing
+        return None
+
+    """ Public methods """
+    def submit(self, func, *args):
+        """Submit write
+
+        Queue func(*args) to be run by writer thread. Blocks while
+        queue is full. Arguments must not be changed afterwards
+
+        Attributes:
+            func (callable): Write to do
+            args (tuple): Arguments of write
+        """
+
+        # Raise error of earlier write
+        self.__raise()
+
+        # Check that writer is running
+        if not self._thread.is_alive():
+            # Tell user writer is closed
+            raise RuntimeError('Checkpoint writer is closed')
+
+        # Count submits that have to wait
+        self.n_blocked += self._queue.full()
+
+        # Queue write
+        self._queue.put((func, args))
+
+        # Return nothing
+        return None
+
+    def flush(self):
+        """Flush writes
+
+        Wait until every submitted write is done
+
+        Attributes:
+        """
+
+        # Wait for writes
+        self._queue.join()
+
+        # Raise error of a write
+        self.__raise()
+
+        # Return nothing
+        return None
+
+    def close(self):
+        """Close writer
+
+        Flush writes and stop writer thread
+
+        Attributes:
+        """
+
+        # Check if writer is running
+        if self._thread.is_alive():
+            # Stop writer after pending writes
+            self._queue.put(None); self._thread.join();
+
+            # Do not flush again at exit
+            atexit.unregister(self.close)
+
+        # Raise error of a write
+        self.__raise()
+
+        # Return nothing
+        return None
+
+    @property
+    def pending(self):
+        """Get number of pending writes
+
+        Attributes:
+        """
+
+        # Return number of pending writes
+        return self._queue.unfinished_tasks
@@ -2,6 +2,16 @@
 # Numpy for number crunching operations
 import numpy as np
 
+# Scalar math for hot loop
+import math
+
+""" Local modules """
+# Compiled growth kernel
+from xy_kernels import wolff_kernel, wolff_kernel_compact
+
+# Output and instrumentation
+from instruments import logger, logging
+
 """ Cluster class """
 class XYCluster:
     """Cluster update class.
@@ -14,79 +24,323 @@ class XYCluster:
     """
     def __init__(self):
         """ Give user information """
-        # Print outout to user
-        print('Cluster update class initialized.')
+        # Tell user
+        logger.debug('Cluster update class initialized.')
         
         # Return nothing
         return None
 
     """ Private methods """
+    def __flip_site(self, site):
+        """Flips site
+
+        Reflects spin at site about the plane perpendicular to the
+        reflection direction, marks site as visited and adds it to
+        the cluster
+
+        Attributes:
+           rx, ry (float): Components of reflection direction
+           dt_prd_st (float): Dot product of site with rfl. dir. before flip
+        """
+
+        # Get reflection direction
+        rx, ry = self.refl_dir
+
+        # Get spin components
+        cos_st, sin_st = self.lattice.components(site)
+
+        # Temporarily store dot product
+        dt_prd_st = cos_st * rx + sin_st * ry
+
+        # Keep stored angle before flip if rounded flips are tracked
+        if len(self._old_buf) > 0:
+            self._old_buf[len(self.cluster_sites)] = self.lattice.angles[site]
+
+        # Save reflected spin
+        self.lattice.set_new_lat_vec(site, (cos_st - 2. * dt_prd_st * rx,
+                                            sin_st - 2. * dt_prd_st * ry))
+
+        # Mark site as visited
+        self._in_cluster[site] = 1
+
+        # Add site to cluster
+        self.cluster_sites.append(site)
+
+        # Return dot product before flip
+        return dt_prd_st
+
     def __grow_cluster(self, site):
         """Grows cluster
 
-        Recursively grows cluster. Recursion implemented as "depth-first"
-        according to pseudocode found in lecture series by Kari Rummukainen: 
+        Grows cluster "depth-first" according to pseudocode found in
+        lecture series by Kari Rummukainen:
         -  https://www.mv.helsinki.fi/home/rummukai/simu/
+        The recursion is replaced by an explicit stack of frames, each
+        holding a cluster site, the position of its next neighbor to
+        test in the CSR neighbor index, the end of its neighbors and
+        the site's dot product with the reflection direction before
+        its flip. Neighbors are tested in the same order as the recursive
+        walk, and membership is checked against a byte mask over the
+        lattice at the moment each bond is tested. Scalar arithmetic
+        matches wolff_kernel exactly, so the Python and compiled
+        backends give the same trajectory.
 
         Attributes:
-           lat_vec_site (array): Lattice vector at this site
-           lat_vec_nhbr (array): Lattice vector at neighboring site
-           dt_prd_st_rfl (float): Dot product of current site with rfl. dir.
-           dt_prd_nghbr_rfl (flat): Dot product of neighbor site with rfl. dir.
+           stack (list): Frames of (site, next neighbor, end, dot product)
+           dt_prd_st (float): Dot product of current site with rfl. dir.
+           dt_prd_nghbr (flat): Dot product of neighbor site with rfl. dir.
            spin_prod (float): Product of dot products
            min_of_change (float): Minimum of change of energy and zero
-           prob_acc (float): Probability of reflecting neighboring spine
-           refl_spin (array): Reflected spin of neighbor           
+           prob_acc (float): Probability of reflecting neighboring spin
         """
 
         """ Define a few convient quantities """
-        # Temporarily store lattice vector of site
-        lat_vec_site = self.lattice[site].lat_vec
+        # Get CSR index of neighbors
+        indptr = self.lattice.indptr; indices = self.lattice.indices;
 
-        # Temporarily store dot product
-        dt_prd_st = np.dot(lat_vec_site, self.refl_dir)
+        # Get buffered draw of random number between 0 and 1
+        rand = self._prob_rng.random
 
-        """ Flip value at site """
-        # Define reflected spin
-        refl_spin = lat_vec_site - 2. * dt_prd_st * self.refl_dir
-                
-        # Save reflected spin
-        self.lattice[site].set_new_lat_vec(refl_spin)
+        # Get spin components and reflection direction
+        components = self.lattice.components; rx, ry = self.refl_dir;
 
-        # Add site to cluster
-        self.cluster_sites.append(site)
+        """ Flip seed site and walk cluster """
+        # Initialize stack with seed site
+        stack = [[site, int(indptr[site]), int(indptr[site + 1]), self.__flip_site(site)]]
 
-        """ Add neighbors to cluster """
-        # Get neighbors
-        nghbrs = self.lattice[site].lat_neighbors
+        # Keep walking until stack is exhausted
+        while stack:
+            # Get frame at top of stack
+            frame = stack[-1]
 
-        # Cycle through neighbors
-        for nghbr_site in [nghbr for nghbr in nghbrs if nghbr not in self.cluster_sites]:
-            """ Calculate a few things """
-            # Temporarily store lattice vector of neighbor
-            lat_vec_nhbr = self.lattice[nghbr_site].lat_vec
+            # Check if all neighbors of site have been tested
+            if frame[1] == frame[2]:
+                # Done with this site
+                stack.pop(); continue;
 
+            # Get neighbor to test
+            nghbr_site = int(indices[frame[1]])
+
+            # Move frame on to next neighbor
+            frame[1] += 1
+
+            # Skip neighbors already in cluster
+            if self._in_cluster[nghbr_site]:
+                continue
+
+            """ Calculate a few things """
             # Temporarily store dot product
-            dt_prd_nghbr = np.dot(lat_vec_nhbr, self.refl_dir)
-            
+            cos_nghbr, sin_nghbr = components(nghbr_site)
+            dt_prd_nghbr = cos_nghbr * rx + sin_nghbr * ry
+
             # Get product of spin dot products
-            spin_prod = dt_prd_st * dt_prd_nghbr
-            
+            spin_prod = frame[3] * dt_prd_nghbr
+
             # Get minimum of 0 and change in energy
             min_of_change = min(0., -2. * self.J * spin_prod)
 
             """ Do acc./rej. step """
             # Generate random number between 0 and 1
-            rand_num = self._rand_zero_to_one()
-            
+            rand_num = rand()
+
             # Define probability of acceptance
-            prob_acc = 1. - np.exp(min_of_change)
+            prob_acc = 1. - math.exp(min_of_change)
 
             # Check if change is to be accepted
             if (prob_acc >= rand_num):
-                # Grow cluster more
-                self.__grow_cluster(nghbr_site)
-                
+                # Flip neighbor and grow cluster from it
+                stack.append([nghbr_site, int(indptr[nghbr_site]), int(indptr[nghbr_site + 1]),
+                              self.__flip_site(nghbr_site)])
+
+        # Return nothing
+        return None
+
+    def __grow_cluster_frontier(self, site):
+        """Grows cluster layer by layer
+
+        Grows cluster breadth-first. Each layer is handled in one
+        batch: the bonds from the sites flipped last (the frontier)
+        to sites outside the cluster are gathered from the CSR index,
+        every bond gets its own acc./rej. test with the projections
+        of both spins before flipping, and the sites reached by an
+        accepted bond are flipped and become the next frontier.
+        Every bond between the cluster and the rest of the lattice
+        is tested exactly once, as in the depth-first walk, so the
+        result is a Wolff cluster; only the order of random numbers
+        differs. Interpreter overhead is paid per layer instead of
+        per site
+
+        Attributes:
+           frontier (array): Sites flipped in last layer
+           proj (array): Projections of frontier sites before flip
+           layers (list): Sites flipped in each layer
+           owner (array): Frontier site each bond starts from
+           nghbrs (array): Sites outside cluster each bond ends on
+           nghbr_proj (array): Projections of nghbrs onto refl. dir.
+           acc (array): Whether each bond is accepted
+           first (array): First accepted bond reaching each new site
+           n_cluster (int): Number of sites in cluster
+           inst (XYInstruments): Instrumentation of updates
+        """
+
+        """ Flip seed site """
+        # Get lattice and reflection direction
+        lat = self.lattice; rx, ry = self.refl_dir;
+
+        # Get seed site and its projection
+        frontier = np.array([site]); cos, sin = lat.components(frontier);
+        proj = cos * rx + sin * ry
+
+        # Initialize number of cluster sites
+        n_cluster = 1
+
+        # Keep stored angle before flip if rounded flips are tracked
+        if len(self._old_buf) > 0:
+            self._old_buf[0] = lat.angles[site]
+
+        # Flip seed site (timed as flip)
+        inst = self.instruments; inst.enter('flip');
+        lat.set_new_lat_vecs(frontier, cos - 2. * proj * rx, sin - 2. * proj * ry)
+        self._in_cluster[frontier] = 1; layers = [frontier];
+        inst.enter('growth')
+
+        """ Grow layer by layer """
+        # Keep growing until no new sites are reached
+        while len(frontier) > 0:
+            # Get bonds from frontier to sites outside cluster
+            owner, nghbrs = lat.geometry.neighbors_of(frontier)
+            outside = self._in_cluster[nghbrs] == 0
+            owner = owner[outside]; nghbrs = nghbrs[outside];
+
+            # Get projections of sites outside cluster
+            cos, sin = lat.components(nghbrs); nghbr_proj = cos * rx + sin * ry;
+
+            # Test every bond
+            acc = (1. - np.exp(np.minimum(0., -2. * self.J * proj[owner] * nghbr_proj))
+                   >= self._rand_zero_to_one(len(nghbrs)))
+
+            # Get sites reached by accepted bonds
+            frontier, first = np.unique(nghbrs[acc], return_index = True)
+
+            # Keep projections and components of new sites before flip
+            proj = nghbr_proj[acc][first]; cos = cos[acc][first]; sin = sin[acc][first];
+
+            # Keep stored angles before flip if rounded flips are tracked
+            if len(self._old_buf) > 0:
+                self._old_buf[n_cluster:n_cluster + len(frontier)] = lat.angles[frontier]
+            n_cluster += len(frontier)
+
+            # Flip new sites and add them to cluster (timed as flips)
+            inst.enter('flip')
+            lat.set_new_lat_vecs(frontier, cos - 2. * proj * rx, sin - 2. * proj * ry)
+            self._in_cluster[frontier] = 1; layers.append(frontier);
+            inst.enter('growth')
+
+        # Save sites of cluster
+        self.cluster_sites = np.concatenate(layers)
+
+        # Return nothing
+        return None
+
+    def __grow_cluster_compiled(self, site):
+        """Grows cluster with compiled kernel
+
+        Flips seed site, then hands the walk to wolff_kernel, which
+        reads random numbers straight from the block of the buffered
+        RNG. Whenever the block runs out the kernel returns with its
+        stack intact, the block is refilled and the walk resumes
+
+        Attributes:
+           rng (BufferedRNG): RNG for acc./rej. steps
+           pos (int): Position in block of random numbers
+           depth (int): Number of frames on stack
+           n_cluster (int): Number of sites in cluster
+           inst (XYInstruments): Instrumentation of updates
+        """
+
+        """ Flip seed site """
+        # Get RNG for acc./rej. steps
+        rng = self._prob_rng
+
+        # Put seed site on stack
+        self._stack_site[0] = site; self._stack_next[0] = self.lattice.indptr[site];
+        self._stack_proj[0] = self.__flip_site(site); self._cluster_buf[0] = site;
+
+        """ Walk cluster """
+        # Initialize walk
+        pos = rng.pos; depth = 1; n_cluster = 1;
+
+        # Get lattice and arguments shared by both kernels
+        lat = self.lattice
+        args = (lat.indptr, lat.indices, self._in_cluster, self.refl_dir[0], self.refl_dir[-1],
+                float(self.J))
+
+        # Keep walking until stack is exhausted
+        while depth > 0:
+            # Refill block of random numbers if exhausted
+            if pos == rng.block:
+                # Refill block
+                rng.refill(); pos = 0;
+
+            # Walk until done or out of random numbers
+            if lat.storage == 'float64':
+                pos, depth, n_cluster = wolff_kernel(lat.cos, lat.sin, lat.angles, *args,
+                                                     rng.buffer, pos, self._stack_site,
+                                                     self._stack_next, self._stack_proj,
+                                                     depth, self._cluster_buf, n_cluster)
+            else: # Otherwise, walk on stored angles only
+                pos, depth, n_cluster = wolff_kernel_compact(
+                    lat.angles, self._cos_table, self._sin_table, lat.q or 0, *args,
+                    rng.buffer, pos, self._stack_site, self._stack_next, self._stack_proj,
+                    depth, self._cluster_buf, n_cluster, self._old_buf)
+
+        # Save position in block
+        rng.pos = pos
+
+        # Save sites of cluster
+        self.cluster_sites = self._cluster_buf[:n_cluster].copy()
+
+        # Return nothing
+        return None
+
+    """ Protected methods """
+    def _init_cluster_mask(self):
+        """Initialize cluster mask
+
+        Allocates byte mask marking sites visited by cluster growth.
+        Mask is reused between updates; only entries touched by the
+        last cluster are reset. The compiled backend also gets a
+        preallocated stack and list of cluster sites
+
+        Attributes:
+        """
+
+        # Allocate mask over lattice
+        self._in_cluster = np.zeros(self.size, dtype = np.uint8)
+
+        # Initialize list of cluster sites
+        self.cluster_sites = []
+
+        # Allocate stored angles of cluster sites before flip (only needed to track
+        # float32 flips, which are rounded to stored values)
+        self._old_buf = (np.zeros(self.size, dtype = self.lattice.angles.dtype)
+                         if (self.lattice.storage == 'float32') and (self.track_obs is True)
+                         else np.zeros(0, dtype = self.lattice.angles.dtype))
+
+        # Check if compiled kernel is used
+        if self.backend == 'numba':
+            # Allocate stack of frames and list of cluster sites
+            self._stack_site = np.zeros(self.size, dtype = np.int32)
+            self._stack_next = np.zeros(self.size, dtype = np.int64)
+            self._stack_proj = np.zeros(self.size, dtype = np.float64)
+            self._cluster_buf = np.zeros(self.size, dtype = np.int32)
+
+            # Get tables of clock states (placeholders for float angles)
+            self._cos_table = (self.lattice.cos_table if self.lattice.q is not None
+                               else np.zeros(1))
+            self._sin_table = (self.lattice.sin_table if self.lattice.q is not None
+                               else np.zeros(1))
+
         # Return nothing
         return None
 
@@ -95,17 +349,20 @@ class XYCluster:
                        prnt = False, log = False):
         """Implement cluster update
         
-        Implement cluster update
+        Implement cluster update. Information about the update is
+        logged at INFO level if prnt or log is True and at DEBUG
+        level otherwise
 
         Attributes:
            site (int): Random site to start cluster
            angle (float): Random angle to define reflection
+           inst (XYInstruments): Instrumentation of updates
         """
         
         """ Initial tasks """
-        # Print separator if requested
-        print(25 * '-.' + '\n') if prnt is True else None
-        
+        # Start timing update
+        inst = self.instruments; inst.start('rng');
+
         # Sample a random site
         site = self._rand_site() if site is None else site
         
@@ -113,14 +370,55 @@ class XYCluster:
         angle = self._rand_angle()
 
         """ Get direction of reflection and grow cluster """
+        # Time growth
+        inst.enter('growth')
+
+        # Reset mask entries touched by last cluster
+        self._in_cluster[self.cluster_sites] = 0
+
         # Initialize list of cluster sites
         self.cluster_sites = []
 
         # Create lattice vector representing reflection
-        self.refl_dir = np.array([np.cos(angle), np.sin(angle)])
+        self.refl_dir = self.lattice.reflection(angle)
         
-        # Grow cluster
-        self.__grow_cluster(site)
+        # Grow cluster with chosen strategy and backend
+        if self.growth == 'frontier':
+            # Grow cluster layer by layer
+            self.__grow_cluster_frontier(site)
+        elif self.backend == 'numba':
+            # Grow cluster with compiled kernel
+            self.__grow_cluster_compiled(site)
+        else: # Otherwise, grow cluster in Python
+            # Grow cluster
+            self.__grow_cluster(site)
+
+        # Count cluster
+        inst.count_clusters(len(self.cluster_sites))
+
+        # Time measurements
+        inst.enter('meas')
+
+        # Update running observables if requested
+        if self.track_obs is True:
+            # Update energy and magnetization from cluster flip
+            self._track_reflection(self.cluster_sites, self.refl_dir,
+                                   self._old_buf[:len(self.cluster_sites)]
+                                   if len(self._old_buf) > 0 else None)
+
+        # Compute improved estimators if requested
+        if self.improved is True:
+            # Get flipped sites
+            sites = np.asarray(self.cluster_sites)
+
+            # Get spin components of flipped sites
+            cos, sin = self.lattice.components(sites)
+
+            # Get projections of flipped spins onto refl. dir.
+            proj = cos * self.refl_dir[0] + sin * self.refl_dir[-1]
+
+            # Compute estimators from cluster
+            self._improved_estimators(None, proj)
 
         """ Update lattice and save if necessary """
         # Update configuration number
@@ -129,28 +427,19 @@ class XYCluster:
         # Check if save is true
         if save is True:
             # Save angles to location
-            self._save_conf('cluster', prnt)
+            self._save_conf('cluster', prnt or log)
 
-        """ Save or print extra info if necessary """
-        # Check if prnt is True
-        if prnt is True:
-            # Print information about configuration
-            print('Info about conf. num. ' + str(self.conf_num) + ':')
+        """ Log and hand out info """
+        # Log information about update
+        logger.log(logging.INFO if (prnt or log) else logging.DEBUG,
+                   'conf. num. %d of %s: site, angle, alg = %d, %s, cluster; cluster size: %d',
+                   self.conf_num, self.ens_name.strip('_'), site, angle,
+                   len(self.cluster_sites))
 
-            # Print information about ensemble name
-            print('Ensemble name:', self.ens_name.strip('_'))
-            
-            # Print information about site and random angle
-            print('site, angle, alg = ' + str(site) + ',', 
-                  str(angle) + ', cluster')
+        # Finish timing update
+        inst.finish({'conf_num' : self.conf_num, 'alg' : 'cluster',
+                     'n_flipped' : len(self.cluster_sites),
+                     'cluster_size' : len(self.cluster_sites)})
 
-            # Print cluster size
-            print('Cluster size:', len(self.cluster_sites))
-
-            # Create final separator
-            print('\n' + 25 * '-.')
-
-        """ Option to log info to be added """
-        
         # Return nothing
         return None
@@ -0,0 +1,262 @@
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+""" Geometry class """
+class XYGeometry(object):
+    """Geometry of hypercubic lattice
+
+    Neighbor structure of a d-dimensional hypercubic lattice with
+    extent L_mu and periodic or open boundary conditions along each
+    axis mu. Site x = (x_0, ..., x_d-1) has index sum x_mu * stride_mu
+    with axis 0 running fastest, so in 2D site = y * N + x. The
+    forward step along axis 0 is +1 and along every other axis -1
+    (rows counted downward), which keeps the counter-clockwise order
+    next_X, next_Y, last_X, last_Y of the 2D neighbor table.
+
+    Neighbors are stored once in compressed sparse row (CSR) form:
+    the neighbors of site i are indices[indptr[i]:indptr[i + 1]],
+    forward neighbors along each axis first, then backward neighbors,
+    skipping those cut off by open boundaries. If every site has all
+    2 d neighbors, neighbors is the same index as a (size, 2 d) table.
+
+    Attributes:
+        shape (tuple): Extent of lattice along each axis
+        dim (int): Number of dimensions
+        bc (tuple): Boundary condition along each axis ('periodic' or 'open')
+        size (int): Number of lattice sites
+        strides (array): Step in site index along each axis
+        steps (array): Direction of forward step along each axis
+        indptr (array): Start of neighbors of each site in indices
+        indices (array): Neighbors of every site
+        neighbors (array or None): (size, 2 d) table if degree is uniform
+        bipartite (bool): Whether checkerboard sublattices are valid
+    """
+    # Known boundary conditions
+    bcs = ('periodic', 'open')
+
+    def __init__(self, shape, bc = 'periodic'):
+        # Save shape of lattice
+        self.shape = tuple(int(L) for L in shape); self.dim = len(self.shape);
+
+        # Save boundary condition along each axis
+        self.bc = (bc,) * self.dim if isinstance(bc, str) else tuple(bc)
+
+        # Check boundary conditions
+        if (len(self.bc) != self.dim) or any(b not in self.bcs for b in self.bc):
+            # Tell user which boundary conditions are available
+            raise ValueError('Need one boundary condition per axis from '
+                             + ', '.join(self.bcs) + ', got ' + repr(bc))
+
+        # Save number of lattice sites
+        self.size = int(np.prod(self.shape))
+
+        # Get step in site index and direction of forward step along each axis
+        self.strides = np.cumprod((1,) + self.shape[:-1])
+        self.steps = np.array([1] + [-1] * (self.dim - 1))
+
+        # Check if sublattices of checkerboard are never neighbors
+        self.bipartite = all((L % 2 == 0) or (b == 'open') for L, b in zip(self.shape, self.bc))
+
+        # Build neighbors
+        self.__neighbors()
+
+        # Initialize forward bonds
+        self._bonds = None
+
+        # Return nothing
+        return None
+
+    """ Private methods """
+    def __shifted(self, axis, step):
+        """Shifted sites
+
+        Neighbor of every site one step along axis, and whether
+        that neighbor exists
+
+        Attributes:
+            axis (int): Axis of step
+            step (int): Direction of step (+1 or -1)
+            sites (array): Index of every lattice site
+            x (array): Coordinate of every site along axis
+            x_new (array): Coordinate of neighbor along axis
+        """
+
+        # Get index and coordinate along axis of every site
+        sites = np.arange(self.size, dtype = np.int64)
+        x = (sites // self.strides[axis]) % self.shape[axis]
+
+        # Get coordinate of neighbor
+        x_new = x + step
+
+        # Return neighbor (wrapped) and whether it exists
+        return ((sites + ((x_new % self.shape[axis]) - x) * self.strides[axis]).astype(np.int32),
+                (x_new >= 0) & (x_new < self.shape[axis]) | (self.bc[axis] == 'periodic'))
+
+    def __neighbors(self):
+        """Builds neighbors
+
+        Builds CSR neighbor index from one shifted copy of the
+        lattice per axis and direction
+
+        Attributes:
+            table (array): Neighbor of each site in each direction
+            exists (array): Whether each neighbor exists
+        """
+
+        # Get neighbors in each direction, forward first
+        shifted = ([self.__shifted(axis, self.steps[axis]) for axis in range(self.dim)]
+                   + [self.__shifted(axis, -self.steps[axis]) for axis in range(self.dim)])
+
+        # Stack neighbors into table
+        table = np.stack([nghbr for nghbr, _ in shifted], axis = 1)
+        exists = np.stack([ok for _, ok in shifted], axis = 1)
+
+        # Get start of neighbors of each site (int32 unless index is too long for it)
+        self.indptr = np.zeros(self.size + 1, dtype = np.int32 if 2 * self.dim * self.size
+                               < np.iinfo(np.int32).max else np.int64)
+        np.cumsum(exists.sum(axis = 1), out = self.indptr[1:])
+
+        # Save neighbors of every site (no copy if none are missing)
+        self.indices = table.ravel() if exists.all() else table[exists]
+
+        # Keep table view if every site has every neighbor
+        self.neighbors = self.indices.reshape(self.size, 2 * self.dim) if exists.all() else None
+
+        # Return nothing
+        return None
+
+    """ Public methods """
+    @property
+    def degree(self):
+        """Get degree
+
+        Get number of neighbors of every site
+
+        Attributes:
+        """
+
+        # Return number of neighbors
+        return np.diff(self.indptr)
+
+    @property
+    def bonds(self):
+        """Get forward bonds
+
+        Get both ends of every bond, sorted by axis and then by
+        site, and the start of the bonds along each axis. Built
+        on first use
+
+        Attributes:
+            bond_i, bond_j (array): Ends of bonds
+            bond_ptr (array): Bonds along axis mu are bond_ptr[mu]:bond_ptr[mu + 1]
+        """
+
+        # Check if bonds need to be built
+        if self._bonds is None:
+            # Get forward neighbors along each axis
+            shifted = [self.__shifted(axis, self.steps[axis]) for axis in range(self.dim)]
+
+            # Get both ends of bonds that exist
+            bond_i = np.concatenate([np.flatnonzero(ok).astype(np.int32) for _, ok in shifted])
+            bond_j = np.concatenate([nghbr[ok] for nghbr, ok in shifted])
+
+            # Get start of bonds along each axis
+            bond_ptr = np.zeros(self.dim + 1, dtype = np.int64)
+            np.cumsum([np.count_nonzero(ok) for _, ok in shifted], out = bond_ptr[1:])
+
+            # Save bonds
+            self._bonds = (bond_i, bond_j, bond_ptr)
+
+        # Return bonds
+        return self._bonds
+
+    def neighbors_of(self, sites):
+        """Get neighbors of sites
+
+        Get neighbors of a group of sites as flat arrays
+
+        Attributes:
+            sites (array): Locations of lattice sites
+            owner (array): Position in sites of site each neighbor belongs to
+            counts (array): Number of neighbors of each site
+            starts (array): Start of each site's neighbors in indices
+        """
+
+        # Check if neighbor table exists
+        if self.neighbors is not None:
+            # Return owners and neighbors from table
+            return (np.repeat(np.arange(len(sites)), 2 * self.dim),
+                    self.neighbors[sites].ravel())
+
+        # Get number of neighbors of each site and where they start
+        counts = self.degree[sites]; starts = self.indptr[sites];
+
+        # Get owner of each neighbor
+        owner = np.repeat(np.arange(len(sites)), counts)
+
+        # Return owners and neighbors
+        return owner, self.indices[starts[owner] + np.arange(len(owner))
+                                   - np.repeat(np.cumsum(counts) - counts, counts)]
+
+    def forward_neighbors(self, site):
+        """Get forward neighbors
+
+        Get forward neighbor of site along each axis it has one
+
+        Attributes:
+            site (int): Location of lattice site
+            x (array): Coordinates of site
+            x_new (int): Coordinate of neighbor along axis
+        """
+
+        # Get coordinates of site
+        x = self.coords(site); nghbrs = [];
+
+        # Cycle through axes
+        for axis in range(self.dim):
+            # Get coordinate of neighbor along axis
+            x_new = x[axis] + self.steps[axis]
+
+            # Add neighbor if it exists
+            if (self.bc[axis] == 'periodic') or (0 <= x_new < self.shape[axis]):
+                nghbrs.append(int(site + ((x_new % self.shape[axis]) - x[axis]) * self.strides[axis]))
+
+        # Return forward neighbors
+        return nghbrs
+
+    def coords(self, sites):
+        """Gets coordinates
+
+        Gets coordinates (x_0, ..., x_d-1) of sites
+
+        Attributes:
+            sites (array): Locations of lattice sites
+        """
+
+        # Return coordinates
+        return (np.asarray(sites)[..., None] // self.strides) % np.array(self.shape)
+
+    def checkerboard(self):
+        """Gets checkerboard sublattices
+
+        Splits lattice into even and odd sites by parity of the sum
+        of coordinates. No two sites of the same sublattice are
+        neighbors if bipartite is True
+
+        Attributes:
+            sites (array): Index of every lattice site
+            parity (array): Parity of sum of coordinates of every site
+        """
+
+        # Get index of every site
+        sites = np.arange(self.size, dtype = np.int32)
+
+        # Get parity of every site
+        parity = np.zeros(self.size, dtype = np.int64)
+        for axis in range(self.dim):
+            parity += (sites // self.strides[axis]) % self.shape[axis]
+        parity %= 2
+
+        # Return even and odd sublattices
+        return [sites[parity == 0], sites[parity == 1]]
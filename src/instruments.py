@@ -0,0 +1,319 @@
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+# For output of simulation
+import logging
+
+# For timing phases of updates
+import time
+
+# For exporting metrics
+import json
+
+""" Logging """
+# Logger shared by all simulation classes
+logger = logging.getLogger('xy_model')
+
+# Stay silent unless user sets logging up
+logger.addHandler(logging.NullHandler())
+
+def log_to_console(level = logging.INFO):
+    """Log to console
+
+    Send output of simulation classes to stdout. Use
+    logging.DEBUG to also see every update
+
+    Attributes:
+        level (int): Lowest level of messages shown
+    """
+
+    # Attach console handler once
+    if not any(getattr(handler, '_xy_console', False) for handler in logger.handlers):
+        # Create handler printing bare messages
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        handler._xy_console = True
+
+        # Attach handler
+        logger.addHandler(handler)
+
+    # Set level of logger
+    logger.setLevel(level)
+
+    # Return nothing
+    return None
+
+""" Instrumentation class """
+class XYInstruments(object):
+    """Instrumentation of updates
+
+    Splits the wall time of every update into phases, counts
+    cluster sizes and flipped sites, and hands a record of every
+    update to registered hooks. Time is charged to whichever phase
+    was entered last, so phases nest: the RNG helpers enter 'rng'
+    and return to the phase they were called from. Random numbers
+    drawn inside the Wolff walk are counted as growth. The
+    depth-first walk (Python or compiled) flips each site the moment
+    it joins the cluster, between the acc./rej. tests of its bonds,
+    so its flips cannot be timed apart and are counted as growth
+    too; frontier growth times the flips of each layer as 'flip'.
+    Does nothing unless enabled; the histogram of cluster sizes is
+    only allocated once a cluster is counted
+
+    Attributes:
+        enabled (bool): Whether anything is recorded
+        times (dict): Total time spent in each phase
+        last (dict): Time spent in each phase in last update
+        n_updates (int): Number of updates recorded
+        n_flipped (int): Number of sites flipped
+        size (int): Number of lattice sites
+        cluster_hist (array or None): Number of clusters of each size
+        hooks (list): Pairs of (hook, every)
+    """
+    # Phases of an update
+    phases = ('rng', 'growth', 'flip', 'meas', 'io')
+
+    def __init__(self, size, enabled = False):
+        # Set whether anything is recorded
+        self.enabled = enabled
+
+        # Initialize list of hooks
+        self.hooks = []
+
+        # Initialize counters
+        self.reset(size)
+
+        # Return nothing
+        return None
+
+    """ Public methods """
+    def reset(self, size = None):
+        """Reset counters
+
+        Reset timers, counters and histogram
+
+        Attributes:
+            size (int or None): Number of lattice sites (None to keep)
+        """
+
+        # Save number of lattice sites
+        self.size = self.size if size is None else size
+
+        # Initialize timers
+        self.times = dict.fromkeys(self.phases, 0.)
+        self.last = dict.fromkeys(self.phases, 0.)
+
+        # Initialize counters
+        self.n_updates = 0; self.n_flipped = 0;
+
+        # Drop histogram of cluster sizes (allocated when first needed)
+        self.cluster_hist = None
+
+        # Initialize current phase
+        self._phase = None; self._t = 0.;
+
+        # Return nothing
+        return None
+
+    def start(self, phase):
+        """Start update
+
+        Start timing an update in phase
+
+        Attributes:
+            phase (str): First phase of update
+        """
+
+        # Check if enabled
+        if self.enabled is True:
+            # Clear times of last update
+            self.last = dict.fromkeys(self.phases, 0.)
+
+            # Enter first phase
+            self._phase = phase; self._t = time.perf_counter();
+
+        # Return nothing
+        return None
+
+    def enter(self, phase):
+        """Enter phase
+
+        Charge time since last switch to current phase and switch
+        to phase
+
+        Attributes:
+            phase (str or None): Phase to enter (None to stop timing)
+            prev (str or None): Phase that was left
+        """
+
+        # Check if enabled
+        if self.enabled is False:
+            # Nothing to do
+            return None
+
+        # Get time and phase that is left
+        now = time.perf_counter(); prev = self._phase;
+
+        # Charge time to phase that is left
+        if prev is not None:
+            # Add time to last update and total
+            self.last[prev] += now - self._t; self.times[prev] += now - self._t;
+
+        # Switch phase
+        self._phase = phase; self._t = now;
+
+        # Return phase that was left
+        return prev
+
+    def count_clusters(self, sizes):
+        """Count clusters
+
+        Add clusters to histogram of sizes
+
+        Attributes:
+            sizes (int or array): Size of each cluster built
+        """
+
+        # Check if enabled
+        if self.enabled is True:
+            # Allocate histogram on first use
+            if self.cluster_hist is None:
+                self.cluster_hist = np.zeros(self.size + 1, dtype = np.int64)
+
+            # Check if single cluster
+            if np.ndim(sizes) == 0:
+                # Add cluster to histogram
+                self.cluster_hist[sizes] += 1
+            else: # Otherwise, add all clusters at once
+                # Add clusters to histogram
+                self.cluster_hist += np.bincount(sizes, minlength = len(self.cluster_hist))
+
+        # Return nothing
+        return None
+
+    def finish(self, record):
+        """Finish update
+
+        Stop timing update, count sites it flipped, add times of
+        phases to record and hand record to hooks that are due
+
+        Attributes:
+            record (dict): Information about update (with 'n_flipped')
+        """
+
+        # Check if enabled
+        if self.enabled is False:
+            # Nothing to do
+            return None
+
+        # Stop timing
+        self.enter(None)
+
+        # Count update and flipped sites
+        self.n_updates += 1; self.n_flipped += record['n_flipped'];
+
+        # Add times of phases to record
+        record.update({'time_' + phase : self.last[phase] for phase in self.phases})
+
+        # Hand record to hooks that are due
+        [hook(record) for hook, every in self.hooks if self.n_updates % every == 0]
+
+        # Return nothing
+        return None
+
+    def add_hook(self, hook, every = 1):
+        """Add hook
+
+        Add callable that gets the record of every every-th update
+
+        Attributes:
+            hook (callable): Called with record of update
+            every (int): Updates between calls
+        """
+
+        # Add hook
+        self.hooks.append((hook, every))
+
+        # Return hook
+        return hook
+
+    def remove_hook(self, hook):
+        """Remove hook
+
+        Remove hook added with add_hook
+
+        Attributes:
+            hook (callable): Hook to remove
+        """
+
+        # Remove hook
+        self.hooks = [(h, every) for h, every in self.hooks if h is not hook]
+
+        # Return nothing
+        return None
+
+    def summary(self):
+        """Summary
+
+        Totals and rates over all recorded updates
+
+        Attributes:
+            total (float): Total time of all phases
+            n_clusters (int): Number of clusters counted
+        """
+
+        # Get histogram of cluster sizes (empty if nothing was counted)
+        hist = np.zeros(1, dtype = np.int64) if self.cluster_hist is None else self.cluster_hist
+
+        # Get total time and number of clusters
+        total = sum(self.times.values()); n_clusters = int(hist.sum());
+
+        # Return summary
+        return {'n_updates' : self.n_updates, 'n_flipped' : self.n_flipped,
+                'times' : dict(self.times), 'total_time' : total,
+                'updates_per_sec' : self.n_updates / total if total > 0. else 0.,
+                'flips_per_sec' : self.n_flipped / total if total > 0. else 0.,
+                'n_clusters' : n_clusters,
+                'mean_cluster_size' : (float(np.arange(len(hist)) @ hist)
+                                       / n_clusters if n_clusters > 0 else 0.)}
+
+""" Hooks """
+class JSONLinesHook(object):
+    """JSON lines hook
+
+    Hook that appends each record it gets to a file as one line
+    of JSON
+
+    Attributes:
+        path (str): File records are appended to
+    """
+    def __init__(self, path):
+        # Set path
+        self.path = path
+
+        # Open file for appending
+        self._file = open(path, 'a')
+
+        # Return nothing
+        return None
+
+    def __call__(self, record):
+        # Write record
+        self._file.write(json.dumps({key : (value.item() if isinstance(value, np.generic) else value)
+                                     for key, value in record.items()}) + '\n')
+
+        # Return nothing
+        return None
+
+    def close(self):
+        """Close file
+
+        Attributes:
+        """
+
+        # Close file
+        self._file.close()
+
+        # Return nothing
+        return None
@@ -0,0 +1,683 @@
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+# For running strips in worker processes
+import multiprocessing as mp
+
+# For lattice arrays shared with workers
+from multiprocessing import shared_memory
+
+# For counting cores
+import os
+
+# For releasing shared memory on exit
+import atexit
+
+""" Strip helpers """
+def strip_rng(seeds, conf_num, strip):
+    """Get RNG of strip
+
+    Get generator of a strip for one sweep, spawned from the angle
+    and probability seeds with the configuration number and strip as
+    spawn key. Streams of different strips and sweeps are independent,
+    and a sweep is fixed by the seeds and the configuration it starts
+    from, so nothing has to be saved to restart it
+
+    Attributes:
+        seeds (dict): Seeds dictionary of XYSimulation
+        conf_num (int): Configuration number sweep starts from
+        strip (int): Index of strip
+    """
+
+    # Return generator of strip
+    return np.random.Generator(np.random.PCG64(np.random.SeedSequence(
+        [seeds['angles'], seeds['probabilities']], spawn_key = (conf_num, strip))))
+
+def _attach_shared(spec):
+    """Attach shared arrays
+
+    Attach to shared memory blocks and view them as arrays
+
+    Attributes:
+        spec (dict): Name, shape and dtype of each shared array
+        blocks (dict): Shared memory block of each array
+    """
+
+    # Attach to blocks
+    blocks = {key : shared_memory.SharedMemory(name = name) for key, (name, _, _) in spec.items()}
+
+    # Return blocks and arrays viewing them
+    return blocks, {key : np.ndarray(shape, dtype = dtype, buffer = blocks[key].buf)
+                    for key, (_, shape, dtype) in spec.items()}
+
+class _StripGroup(object):
+    """Group of strips
+
+    Group of strips updated by one process. Sites of each strip are
+    split by checkerboard color once; neighbors are read from the
+    shared CSR index on every update
+
+    Attributes:
+        strips (list): Strips of group
+        seeds (dict): Seeds dictionary of XYSimulation
+        arrays (dict): Shared angles, cos and sin (float64 storage only), indptr and indices
+        storage (str): Storage mode of angles (see XYLattice)
+        q (int or None): Number of clock states (uint16 storage only)
+        degree (int or None): Number of neighbors of every site, if uniform
+        sites (dict): Sites of each strip and color
+        rngs (dict): Generator of each strip in current sweep
+    """
+    def __init__(self, spec, strips):
+        # Save strips and seeds
+        self.strips = strips; self.seeds = spec['seeds'];
+
+        # Attach to shared arrays
+        self._blocks, self.arrays = _attach_shared(spec['arrays'])
+
+        # Save number of neighbors of every site, if uniform
+        self.degree = spec['degree']
+
+        # Save storage mode and tables of clock states
+        self.storage = spec['storage']; self.q = spec['q'];
+        self._tables = spec['tables']
+
+        # Initialize sites and generators
+        self.sites = {}; self.rngs = {};
+
+        # Cycle through strips
+        for strip in strips:
+            # Get sites of strip
+            sites = np.arange(spec['bounds'][strip], spec['bounds'][strip + 1], dtype = np.int64)
+
+            # Get color of every site
+            parity = (((sites[:, None] // spec['strides']) % spec['shape']).sum(axis = 1)) % 2
+
+            # Save sites of each color
+            self.sites[strip] = [sites[parity == 0], sites[parity == 1]]
+
+        # Return nothing
+        return None
+
+    """ Private methods """
+    def __components(self, sites):
+        """Get vector components
+
+        Get x- and y-components of spins at sites, as
+        XYLattice.components does
+
+        Attributes:
+            sites (array): Locations of lattice sites
+            stored (array): Stored angles at sites
+        """
+
+        # Check if vector components are stored
+        if self.storage == 'float64':
+            # Return stored components
+            return self.arrays['cos'][sites], self.arrays['sin'][sites]
+
+        # Get stored angles at sites
+        stored = self.arrays['angles'][sites]
+
+        # Check if angles are quantized
+        if self.storage == 'uint16':
+            # Return components from tables
+            return self._tables[0][stored], self._tables[1][stored]
+
+        # Return components computed from angles
+        return np.cos(stored.astype(np.float64)), np.sin(stored.astype(np.float64))
+
+    def __to_stored(self, angles):
+        """Convert angles to stored values
+
+        Convert angles in radians to stored values, as
+        XYLattice.to_stored does
+
+        Attributes:
+            angles (array): Angles in radians
+        """
+
+        # Check if angles are quantized
+        if self.storage == 'uint16':
+            # Return nearest clock index
+            return (np.floor(np.mod(angles, 2. * np.pi) * (self.q / (2. * np.pi)) + 0.5)
+                    .astype(np.int64) % self.q).astype(np.uint16)
+
+        # Return angles in stored precision
+        return np.mod(angles, 2. * np.pi).astype(self.storage)
+
+    def __to_radians(self, stored):
+        """Convert stored values to angles
+
+        Convert stored values to float64 radians, as
+        XYLattice.to_radians does
+
+        Attributes:
+            stored (array): Stored values
+        """
+
+        # Return angles as float64
+        return (np.asarray(stored, dtype = np.float64)
+                * ((2. * np.pi / self.q) if self.storage == 'uint16' else 1.))
+
+    def __local_field(self, sites):
+        """Get local field
+
+        Get sum of neighboring spins at each site
+
+        Attributes:
+            starts (array): Start of neighbors of each site
+            counts (array): Number of neighbors of each site
+            owner (array): Site each neighbor belongs to
+            nghbrs (array): Neighbors of sites
+        """
+
+        # Get neighbors
+        indptr = self.arrays['indptr']; indices = self.arrays['indices'];
+
+        # Check if every site has every neighbor
+        if self.degree is not None:
+            # Get spin components of neighbors of sites
+            cos, sin = self.__components(indices.reshape(-1, self.degree)[sites])
+
+            # Return components of local field
+            return cos.sum(axis = 1), sin.sum(axis = 1)
+
+        # Get number of neighbors of each site and where they start
+        starts = indptr[sites]; counts = indptr[sites + 1] - starts;
+
+        # Get neighbors of sites from CSR index
+        owner = np.repeat(np.arange(len(sites)), counts)
+        nghbrs = indices[starts[owner] + np.arange(len(owner))
+                         - np.repeat(np.cumsum(counts) - counts, counts)]
+
+        # Get spin components of neighbors
+        cos, sin = self.__components(nghbrs)
+
+        # Return components of local field
+        return (np.bincount(owner, weights = cos, minlength = len(sites)),
+                np.bincount(owner, weights = sin, minlength = len(sites)))
+
+    def __set_angles(self, sites, angles):
+        """Set angles at sites
+
+        Set angles of sites and recompute their vector
+        components, as XYLattice.set_site_angles does
+
+        Attributes:
+            sites (array): Locations of lattice sites
+            angles (array): New angles at sites
+        """
+
+        # Check if angles are stored compactly
+        if self.storage != 'float64':
+            # Save nearest stored values
+            self.arrays['angles'][sites] = self.__to_stored(angles)
+
+            # Return nothing
+            return None
+
+        # Set angles and vector components
+        self.arrays['angles'][sites] = np.mod(angles, 2. * np.pi)
+        self.arrays['cos'][sites] = np.cos(self.arrays['angles'][sites])
+        self.arrays['sin'][sites] = np.sin(self.arrays['angles'][sites])
+
+        # Return nothing
+        return None
+
+    def __metropolis(self, sites, rng, J, metro_delta):
+        """Metropolis update of sites
+
+        Metropolis update of every site with one batch of
+        proposals and one batch of acc./rej. tests
+
+        Attributes:
+            rand (array): Uniform random numbers of proposals and tests
+            new_angles (array): Proposed angles
+            d_energ (array): Change in energy of each proposal
+            acc (array): Whether each proposal is accepted
+        """
+
+        # Get local field and old spin components
+        h_x, h_y = self.__local_field(sites)
+        old_cos, old_sin = self.__components(sites)
+
+        # Draw random numbers of proposals and tests
+        rand = rng.random(2 * len(sites))
+
+        # Propose new angles within metro_delta of old angles
+        new_angles = (self.__to_radians(self.arrays['angles'][sites])
+                      + (2. * rand[:len(sites)] - 1.) * metro_delta)
+
+        # Round proposals to stored angles
+        if self.storage != 'float64':
+            new_angles = self.__to_radians(self.__to_stored(new_angles))
+
+        # Get new spin components
+        new_cos = np.cos(new_angles); new_sin = np.sin(new_angles);
+
+        # Get change in energy
+        d_energ = -J * ((new_cos - old_cos) * h_x + (new_sin - old_sin) * h_y)
+
+        # Check which proposals are accepted
+        acc = rand[len(sites):] < np.exp(-d_energ)
+
+        # Save accepted angles
+        self.__set_angles(sites[acc], new_angles[acc])
+
+        # Return number accepted, change in energy and magnetization
+        return (np.count_nonzero(acc), d_energ[acc].sum(),
+                np.array([(new_cos - old_cos)[acc].sum(), (new_sin - old_sin)[acc].sum()]))
+
+    def __overrelax(self, sites, rng, J, metro_delta):
+        """Over-relaxation update of sites
+
+        Reflect every spin about its local field. Sites with
+        vanishing local field are left alone. Changes of float32
+        spins are taken from the stored spins before and after, as
+        XYSweep does
+
+        Attributes:
+            h_sq (array): Squared magnitude of local field
+            keep (array): Whether local field at site is nonvanishing
+            scale (array): 2 (s.h) / |h|^2 at each site
+            d_cos, d_sin (array): Changes of rounded spins (float32 storage)
+        """
+
+        # Get local field and old spin components
+        h_x, h_y = self.__local_field(sites)
+        old_cos, old_sin = self.__components(sites)
+
+        # Leave sites with vanishing local field alone
+        h_sq = h_x * h_x + h_y * h_y; keep = h_sq > 0.;
+        sites = sites[keep]; h_x = h_x[keep]; h_y = h_y[keep]; h_sq = h_sq[keep];
+        old_cos = old_cos[keep]; old_sin = old_sin[keep];
+
+        # Get scale of projection onto local field
+        scale = 2. * (old_cos * h_x + old_sin * h_y) / h_sq
+
+        # Save reflected spins
+        self.__set_angles(sites, np.arctan2(scale * h_y - old_sin, scale * h_x - old_cos))
+
+        # Check if reflected angles are rounded to stored values
+        if self.storage == 'float32':
+            # Get changes of stored spins (energy is no longer conserved exactly)
+            new_cos, new_sin = self.__components(sites)
+            d_cos = new_cos - old_cos; d_sin = new_sin - old_sin;
+
+            # Return number updated, change in energy and magnetization
+            return (len(sites), -J * np.sum(d_cos * h_x + d_sin * h_y),
+                    np.array([d_cos.sum(), d_sin.sum()]))
+
+        # Return number updated, change in energy and magnetization
+        return (len(sites), 0., np.array([(scale * h_x - 2. * old_cos).sum(),
+                                          (scale * h_y - 2. * old_sin).sum()]))
+
+    """ Public methods """
+    def update(self, color, conf_num, J, alg, metro_delta):
+        """Update color of strips
+
+        Update sites of one checkerboard color in every strip of
+        group. Generators of strips are created with the first color
+
+        Attributes:
+            color (int): Checkerboard color to update
+            conf_num (int): Configuration number sweep starts from
+            J (float): Coupling
+            alg (str): Local update ('metropolis' or 'overrelax')
+            metro_delta (float): Half width of Metropolis proposals
+            local_update (method): Update of sites of a strip
+            n_acc (int): Number of accepted updates
+        """
+
+        # Get local update
+        local_update = {'metropolis' : self.__metropolis, 'overrelax' : self.__overrelax}[alg]
+
+        # Create generators of strips at start of sweep
+        if color == 0:
+            self.rngs = {strip : strip_rng(self.seeds, conf_num, strip) for strip in self.strips}
+
+        # Initialize changes
+        n_acc = 0; d_energ = 0.; d_mag = np.zeros(2);
+
+        # Cycle through strips
+        for strip in self.strips:
+            # Update sites of color in strip
+            n_sub, d_energ_sub, d_mag_sub = local_update(self.sites[strip][color], self.rngs[strip],
+                                                         J, metro_delta)
+
+            # Accumulate changes
+            n_acc += n_sub; d_energ += d_energ_sub; d_mag += d_mag_sub;
+
+        # Return changes
+        return int(n_acc), float(d_energ), d_mag
+
+    def close(self):
+        """Detach shared arrays
+
+        Attributes:
+        """
+
+        # Drop views, then detach blocks
+        self.arrays = {}; [block.close() for block in self._blocks.values()];
+
+        # Return nothing
+        return None
+
+def _strip_worker(conn, spec, strips):
+    """Worker process
+
+    Holds a group of strips and runs commands sent by driver
+
+    Attributes:
+        conn (Connection): End of pipe to driver
+        spec (dict): Shared arrays and layout of strips
+        strips (list): Strips of worker
+    """
+
+    # Create group of strips
+    group = _StripGroup(spec, strips)
+
+    # Tell driver strips are ready
+    conn.send(None)
+
+    # Keep running commands until told to stop
+    while True:
+        # Get command
+        cmd, args = conn.recv()
+
+        # Check if told to stop
+        if cmd == 'stop':
+            # Done
+            break
+
+        # Run command and send result back
+        conn.send(getattr(group, cmd)(*args))
+
+    # Detach shared arrays and close pipe
+    group.close(); conn.close();
+
+    # Return nothing
+    return None
+
+""" Parallel sweep class """
+class XYParallelSweep(object):
+    """Domain-decomposed checkerboard sweeps
+
+    Runs checkerboard sweeps of a lattice in worker processes. The
+    angles (and vector components, if stored) of the lattice are moved into
+    shared memory, together with its CSR neighbor index, and the
+    lattice is cut into n_strips strips of whole rows along the
+    last axis. Each worker owns a contiguous group of strips. A
+    sweep updates the even sites of every strip, waits for all
+    workers, then updates the odd sites, so no two workers ever
+    touch neighboring sites at the same time.
+
+    Each strip draws from its own generator, spawned from the seeds
+    with the configuration number (see strip_rng). The chain only
+    depends on the seeds and n_strips, not on the number of workers,
+    and the serial RNG states are left alone, so checkpoints stay
+    valid in both modes and a run can switch between serial and
+    parallel sweeps at any configuration.
+
+    Attributes:
+        n_procs (int): Number of worker processes (0 to run in-process)
+        n_strips (int): Number of strips
+        bounds (array): First site of each strip (and size of lattice)
+        groups (list): Strips of each worker
+    """
+    def __init__(self, lattice, seeds, n_procs = None, n_strips = None):
+        # Get geometry of lattice
+        geometry = lattice.geometry
+
+        # Check that checkerboard is valid
+        if geometry.bipartite is False:
+            # Same-colored sites would be neighbors across boundary
+            raise ValueError('Checkerboard sweeps need even extent along periodic axes, got '
+                             + str(geometry.shape))
+
+        # Set number of strips (at most one per row along last axis)
+        self.n_strips = min(64 if n_strips is None else n_strips, geometry.shape[-1])
+
+        # Set number of worker processes
+        self.n_procs = min(os.cpu_count() if n_procs is None else n_procs, self.n_strips)
+
+        # Get first site of each strip
+        self.bounds = (np.linspace(0, geometry.shape[-1], self.n_strips + 1).astype(np.int64)
+                       * int(geometry.strides[-1]))
+
+        # Assign contiguous strips to workers
+        self.groups = [list(group) for group in np.array_split(np.arange(self.n_strips),
+                                                                max(self.n_procs, 1))]
+
+        """ Move arrays to shared memory """
+        # Create shared blocks of lattice and neighbor arrays
+        arrays = {'angles' : lattice.angles, 'cos' : lattice.cos, 'sin' : lattice.sin,
+                  'indptr' : geometry.indptr, 'indices' : geometry.indices}
+
+        # Share only angles if vector components are not stored
+        arrays = {key : arr for key, arr in arrays.items() if arr is not None}
+
+        # Save names of shared spin arrays
+        self._spins = [key for key in ('angles', 'cos', 'sin') if key in arrays]
+        self._blocks = {key : shared_memory.SharedMemory(create = True, size = max(arr.nbytes, 1))
+                        for key, arr in arrays.items()}
+
+        # Get name, shape and dtype of each shared array
+        spec = {key : (self._blocks[key].name, arr.shape, arr.dtype.str)
+                for key, arr in arrays.items()}
+
+        # View shared blocks as arrays
+        self._arrays = {key : np.ndarray(shape, dtype = dtype, buffer = self._blocks[key].buf)
+                        for key, (_, shape, dtype) in spec.items()}
+
+        # Copy neighbor index and move lattice into shared arrays
+        self._arrays['indptr'][:] = geometry.indptr; self._arrays['indices'][:] = geometry.indices;
+        self._lattice = None; self.attach(lattice);
+
+        # Save layout of strips for workers
+        self._spec = {'arrays' : spec, 'seeds' : dict(seeds), 'bounds' : self.bounds,
+                      'strides' : geometry.strides, 'shape' : np.array(geometry.shape),
+                      'degree' : None if geometry.neighbors is None else 2 * geometry.dim,
+                      'storage' : lattice.storage, 'q' : lattice.q,
+                      'tables' : (lattice.cos_table, lattice.sin_table)}
+
+        """ Start workers """
+        # Check if strips run in-process
+        if self.n_procs == 0:
+            # Create single group in this process
+            self._local = _StripGroup(self._spec, self.groups[0])
+        else: # Otherwise, start worker processes
+            # Start workers
+            self._start_workers()
+
+        # Release shared memory at exit
+        atexit.register(self.close)
+
+        # Return nothing
+        return None
+
+    """ Protected methods """
+    def _start_workers(self):
+        """Start worker processes
+
+        Start one worker process per group of strips
+
+        Attributes:
+        """
+
+        # Initialize pipes and processes
+        self._conns = []; self._procs = [];
+
+        # Cycle through groups
+        for group in self.groups:
+            # Create pipe
+            conn, child_conn = mp.Pipe()
+
+            # Create worker
+            proc = mp.Process(target = _strip_worker, daemon = True,
+                              args = (child_conn, self._spec, group))
+
+            # Start worker
+            proc.start()
+
+            # Save pipe and process
+            self._conns.append(conn); self._procs.append(proc);
+
+        # Wait for strips to be set up
+        [conn.recv() for conn in self._conns]
+
+        # Return nothing
+        return None
+
+    def _command(self, cmd, args):
+        """Run command on every group
+
+        Run command on every group of strips concurrently and
+        wait for all of them
+
+        Attributes:
+            cmd (str): Method of _StripGroup to run
+            args (tuple): Arguments of command
+        """
+
+        # Check if strips run in-process
+        if self.n_procs == 0:
+            # Run command
+            return [getattr(self._local, cmd)(*args)]
+
+        # Send command to every worker
+        [conn.send((cmd, args)) for conn in self._conns]
+
+        # Return results once every worker is done
+        return [conn.recv() for conn in self._conns]
+
+    """ Private methods """
+    def __detach(self):
+        """Detach lattice
+
+        Move lattice attached last back into private memory
+
+        Attributes:
+        """
+
+        # Check if lattice still uses shared arrays
+        if (self._lattice is not None) and (self._lattice.angles is self._arrays['angles']):
+            # Copy spins into private arrays
+            [setattr(self._lattice, key, self._arrays[key].copy()) for key in self._spins]
+
+        # Forget lattice
+        self._lattice = None
+
+        # Return nothing
+        return None
+
+    """ Public methods """
+    def attach(self, lattice):
+        """Attach lattice
+
+        Copy angles and vector components of lattice into shared
+        memory and make the lattice use the shared arrays, so
+        other updates and saves see what workers write
+
+        Attributes:
+            lattice (XYLattice): Lattice to sweep
+        """
+
+        # Check if lattice already uses shared arrays
+        if lattice.angles is self._arrays['angles']:
+            # Nothing to do
+            return None
+
+        # Move lattice attached before back into private memory
+        self.__detach()
+
+        # Copy spins into shared arrays
+        [np.copyto(self._arrays[key], getattr(lattice, key)) for key in self._spins]
+
+        # Make lattice use shared arrays
+        [setattr(lattice, key, self._arrays[key]) for key in self._spins]; self._lattice = lattice;
+
+        # Return nothing
+        return None
+
+    def sweep(self, lattice, conf_num, J, alg, metro_delta):
+        """Do sweep
+
+        Update even sites of every strip, then odd sites
+
+        Attributes:
+            lattice (XYLattice): Lattice to sweep
+            conf_num (int): Configuration number sweep starts from
+            J (float): Coupling
+            alg (str): Local update ('metropolis' or 'overrelax')
+            metro_delta (float): Half width of Metropolis proposals
+            results (list): Changes from each group of strips
+        """
+
+        # Attach lattice if it was replaced (e.g. loaded)
+        self.attach(lattice)
+
+        # Initialize changes
+        n_acc = 0; d_energ = 0.; d_mag = np.zeros(2);
+
+        # Cycle through colors
+        for color in (0, 1):
+            # Update color in every strip
+            results = self._command('update', (color, conf_num, J, alg, metro_delta))
+
+            # Accumulate changes
+            n_acc += sum(r[0] for r in results); d_energ += sum(r[1] for r in results);
+            d_mag += sum(r[2] for r in results);
+
+        # Return number accepted, change in energy and magnetization
+        return n_acc, d_energ, d_mag
+
+    def close(self):
+        """Stop worker processes
+
+        Stop workers, move the lattice back into private memory
+        and release shared memory
+
+        Attributes:
+        """
+
+        # Check if already closed
+        if self._blocks is None:
+            # Nothing to do
+            return None
+
+        # Check if there are workers to stop
+        if self.n_procs > 0:
+            # Tell workers to stop
+            [conn.send(('stop', ())) for conn in self._conns]
+
+            # Wait for workers to finish
+            [proc.join() for proc in self._procs]
+        else: # Otherwise, detach in-process group
+            # Detach group
+            self._local.close(); self._local = None;
+
+        # Move lattice back into private memory
+        self.__detach()
+
+        # Drop views, then release blocks
+        self._arrays = {}
+        for block in self._blocks.values():
+            # Detach block unless views of it are still alive elsewhere
+            try:
+                block.close()
+            except BufferError:
+                pass
+
+            # Release block
+            block.unlink()
+
+        # Forget workers and blocks
+        self.n_procs = 0; self._blocks = None;
+
+        # Do not close again at exit
+        atexit.unregister(self.close)
+
+        # Return nothing
+        return None
@@ -0,0 +1,423 @@
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+""" Helpers """
+def _logsumexp(a, axis):
+    """Log of sum of exponentials
+
+    Stable log(sum(exp(a))) along axis
+
+    Attributes:
+        a (array): Exponents
+        axis (int): Axis to sum over
+        a_max (array): Largest exponent along axis
+    """
+
+    # Get largest exponent
+    a_max = np.max(a, axis = axis, keepdims = True)
+
+    # Return log of sum
+    return np.squeeze(a_max, axis = axis) + np.log(np.sum(np.exp(a - a_max), axis = axis))
+
+""" Reweighting class """
+class XYReweighting(object):
+    """Multi-histogram reweighting across couplings
+
+    Combines time series of the energy and other observables from
+    runs at a few couplings J_k into estimates at any coupling J,
+    with the Ferrenberg-Swendsen multi-histogram method (WHAM) in
+    its histogram-free form. With H = energy / J, a sample n has
+    weight at coupling J
+
+        w_n(J) = exp(-J H_n) / sum_k N_k / g_k exp(-J_k H_n + f_k)
+
+    where N_k is the number of samples of run k, g_k = 1 + 2 tau_int
+    its statistical inefficiency and the free energies f_k = -ln Z(J_k)
+    are solved self-consistently. With a single run this is single
+    histogram reweighting. Averages are taken over all samples at
+    once, for a whole grid of couplings.
+
+    Errors are block jackknife errors: every run is cut into n_blocks
+    blocks, and block b of every run is left out in turn (free
+    energies are solved again for each). Blocks should be much longer
+    than the autocorrelation time.
+
+    Attributes:
+        size (int): Number of lattice sites
+        Js (list): Coupling of each run
+        n_blocks (int): Number of jackknife blocks per run
+        f (array or None): Free energy of each run (f[0] = 0)
+        n_iter (int): Iterations of last solve
+    """
+    # Quantities derived from moments of the energy or magnetization
+    derived = ('specific_heat', 'susc_conn')
+
+    def __init__(self, size, n_blocks = 16):
+        # Save number of lattice sites
+        self.size = size
+
+        # Save number of jackknife blocks
+        self.n_blocks = n_blocks
+
+        # Initialize runs
+        self.Js = []; self._H = []; self._obs = []; self._g = [];
+
+        # Initialize free energies and denominators of samples
+        self.f = None; self.n_iter = 0; self._log_den = {};
+
+        # Return nothing
+        return None
+
+    """ Private methods """
+    def __samples(self):
+        """Gather samples
+
+        Concatenate samples of every run
+
+        Attributes:
+            n_k (array): Number of samples of each run
+        """
+
+        # Get number of samples of each run
+        n_k = np.array([len(H) for H in self._H])
+
+        # Save energies, runs and jackknife blocks of all samples
+        self._H_all = np.concatenate(self._H)
+        self._run = np.repeat(np.arange(len(self.Js)), n_k)
+        self._block = np.concatenate([np.arange(n) * self.n_blocks // n for n in n_k])
+
+        # Save observables present in every run
+        keys = set.intersection(*[set(obs) for obs in self._obs])
+        self._obs_all = {key : np.concatenate([obs[key] for obs in self._obs]) for key in keys}
+
+        # Return nothing
+        return None
+
+    def __solve(self, keep, f, tol, max_iter):
+        """Solve free energies
+
+        Iterate Ferrenberg-Swendsen equations for free energies
+        using samples in keep
+
+        Attributes:
+            keep (array): Whether each sample is used
+            f (array): Starting free energies
+            tol (float): Largest change of free energies at convergence
+            max_iter (int): Largest number of iterations
+            J_k (array): Coupling of each run
+            log_n (array): Log of effective number of samples of each run
+            log_w (array): Log of weight of each sample (-ln g_k)
+            JH (array): J_k H_n for every run and sample
+        """
+
+        # Get couplings, samples and weights
+        J_k = np.array(self.Js); H = self._H_all[keep]; run = self._run[keep];
+        log_w = -np.log(np.array(self._g))[run]
+        log_n = np.log(np.bincount(run, minlength = len(J_k)) / np.array(self._g))
+
+        # Get J_k H_n
+        JH = J_k[:, None] * H[None, :]
+
+        # Iterate until converged
+        for n_iter in range(1, max_iter + 1):
+            # Get log of denominator of every sample
+            log_den = _logsumexp(log_n[:, None] - JH + f[:, None], axis = 0)
+
+            # Get new free energies
+            f_new = -_logsumexp(log_w[None, :] - JH - log_den[None, :], axis = 1)
+            f_new -= f_new[0]
+
+            # Check if converged
+            if np.max(np.abs(f_new - f)) < tol:
+                f = f_new; break;
+
+            # Move on
+            f = f_new
+
+        # Save number of iterations
+        self.n_iter = n_iter
+
+        # Return free energies and log of denominator of every sample
+        return f, _logsumexp(log_n[:, None] - JH + f[:, None], axis = 0)
+
+    def __averages(self, Js, keys, keep, log_den, chunk = 64):
+        """Reweighted averages
+
+        Averages of H, H^2 and observables at each coupling
+
+        Attributes:
+            Js (array): Couplings
+            keys (list): Observables to average
+            keep (array): Whether each sample is used
+            log_den (array): Log of denominator of every kept sample
+            chunk (int): Couplings handled at once
+            values (dict): Samples of each average
+            log_w (array): Log of weights of samples at each coupling
+            w (array): Normalized weights of samples at each coupling
+        """
+
+        # Get samples
+        H = self._H_all[keep]; log_g = np.log(np.array(self._g))[self._run[keep]];
+        values = {'H' : H, 'H2' : H * H}
+        values.update({key : self._obs_all[key][keep] for key in keys})
+
+        # Initialize averages
+        avg = {key : np.zeros(len(Js)) for key in values}
+
+        # Cycle through chunks of couplings
+        for start in range(0, len(Js), chunk):
+            # Get log of weights of samples
+            log_w = -Js[start:start + chunk, None] * H[None, :] - log_g[None, :] - log_den[None, :]
+
+            # Normalize weights
+            w = np.exp(log_w - log_w.max(axis = 1, keepdims = True))
+            w /= w.sum(axis = 1, keepdims = True)
+
+            # Get averages
+            for key, x in values.items():
+                avg[key][start:start + chunk] = w @ x
+
+        # Return averages
+        return avg
+
+    def __quantity(self, name, Js, avg):
+        """Get quantity
+
+        Get quantity from reweighted averages
+
+        Attributes:
+            name (str): Observable, 'energy', 'specific_heat' or 'susc_conn'
+            Js (array): Couplings
+            avg (dict): Reweighted averages
+        """
+
+        # Check which quantity is requested
+        if name == 'energy':
+            # Return energy (as measured by XYMeas.energ)
+            return Js * avg['H']
+        elif name == 'specific_heat':
+            # Return specific heat per site
+            return Js**2 * (avg['H2'] - avg['H']**2) / self.size
+        elif name == 'susc_conn':
+            # Return connected susceptibility
+            return self.size * (avg['mag_sq'] - avg['mag_abs']**2)
+
+        # Return average of observable
+        return avg[name]
+
+    def __evaluate(self, name, Js, block):
+        """Evaluate quantity
+
+        Evaluate quantity at couplings, leaving out a block of
+        every run. Free energies of each jackknife sample are
+        solved once and kept
+
+        Attributes:
+            name (str): Quantity (see estimate)
+            Js (array): Couplings
+            block (int or None): Block left out (None for all samples)
+            keys (list): Observables needed by quantity
+            keep (array): Whether each sample is used
+            log_den (array): Log of denominator of every kept sample
+        """
+
+        # Get observables needed
+        keys = {'energy' : [], 'specific_heat' : [], 'susc_conn' : ['mag_sq', 'mag_abs']}.get(name, [name])
+
+        # Check that observables were given
+        if any(key not in self._obs_all for key in keys):
+            # Tell user which observables are missing
+            raise KeyError('Runs lack observables ' + ', '.join(k for k in keys if k not in self._obs_all))
+
+        # Get samples used
+        keep = np.ones(len(self._H_all), dtype = bool) if block is None else self._block != block
+
+        # Solve free energies of jackknife sample if not done yet
+        if block not in self._log_den:
+            self._log_den[block] = self.__solve(keep, self.f, self._tol, self._max_iter)[1]
+
+        # Return quantity
+        return self.__quantity(name, Js, self.__averages(Js, keys, keep, self._log_den[block]))
+
+    def __jackknife(self, func):
+        """Block jackknife
+
+        Jackknife estimate and error of func(block), leaving
+        out one block of every run at a time
+
+        Attributes:
+            func (function): Function of block left out (None for all samples)
+            f_all (array): Function of all samples
+            f_loo (array): Function leaving out one block at a time
+        """
+
+        # Get function of all samples
+        f_all = np.asarray(func(None))
+
+        # Get function leaving out each block
+        f_loo = np.array([func(b) for b in range(self.n_blocks)])
+
+        # Return bias-corrected estimate and error
+        return (self.n_blocks * f_all - (self.n_blocks - 1) * f_loo.mean(axis = 0),
+                np.sqrt((self.n_blocks - 1) * np.mean((f_loo - f_loo.mean(axis = 0))**2, axis = 0)))
+
+    """ Public methods """
+    def add_run(self, J, energy, obs = None, tau_int = None):
+        """Add run
+
+        Add time series of a run at coupling J
+
+        Attributes:
+            J (float): Coupling of run
+            energy (array): Energy of each sample (as measured by XYMeas.energ)
+            obs (dict or None): Time series of other observables
+            tau_int (float or None): Integrated autocorrelation time of energy
+                                     (in samples, 0.5 if None)
+        """
+
+        # Save coupling and energy divided by coupling
+        self.Js.append(float(J)); self._H.append(np.asarray(energy, dtype = np.float64) / J);
+
+        # Save observables
+        self._obs.append({key : np.asarray(x, dtype = np.float64)
+                          for key, x in ({} if obs is None else obs).items()})
+
+        # Add modulus of magnetization if squared magnetization is given
+        if ('mag_sq' in self._obs[-1]) and ('mag_abs' not in self._obs[-1]):
+            self._obs[-1]['mag_abs'] = np.sqrt(self._obs[-1]['mag_sq'])
+
+        # Save statistical inefficiency
+        self._g.append(1. + 2. * (0.5 if tau_int is None else tau_int))
+
+        # Free energies have to be solved again
+        self.f = None
+
+        # Return nothing
+        return None
+
+    def add_observables(self, J, obs_list, tau_int = None):
+        """Add run from observables
+
+        Add run from a list of observables dictionaries, as
+        yielded by XYSimulation.stream or handed to the callback
+        of XYSimulation.run. Scalar observables are kept
+
+        Attributes:
+            J (float): Coupling of run
+            obs_list (list): Observables of each sample
+            tau_int (float or None): Integrated autocorrelation time of energy
+            keys (list): Scalar observables
+        """
+
+        # Get scalar observables
+        keys = [key for key, x in obs_list[0].items() if np.ndim(x) == 0 and key != 'energy']
+
+        # Add run
+        self.add_run(J, [obs['energy'] for obs in obs_list],
+                     {key : [obs[key] for obs in obs_list] for key in keys}, tau_int)
+
+        # Return nothing
+        return None
+
+    def solve(self, tol = 1e-10, max_iter = 10000):
+        """Solve free energies
+
+        Solve Ferrenberg-Swendsen equations for the free
+        energies of the runs using all samples
+
+        Attributes:
+            tol (float): Largest change of free energies at convergence
+            max_iter (int): Largest number of iterations
+        """
+
+        # Gather samples
+        self.__samples()
+
+        # Save convergence settings
+        self._tol = tol; self._max_iter = max_iter;
+
+        # Solve free energies
+        self.f, log_den = self.__solve(np.ones(len(self._H_all), dtype = bool), np.zeros(len(self.Js)),
+                                       tol, max_iter)
+
+        # Keep denominators of all samples, drop those of jackknife samples
+        self._log_den = {None : log_den}
+
+        # Return free energies
+        return self.f
+
+    def estimate(self, name, Js, errors = True):
+        """Estimate quantity
+
+        Reweighted estimate of a quantity on a grid of couplings:
+        the average of any observable given to add_run, 'energy',
+        'specific_heat' (J^2 var(H) / size) or 'susc_conn'
+        (size (<m^2> - <|m|>^2), needs 'mag_sq')
+
+        Attributes:
+            name (str): Quantity
+            Js (array): Couplings
+            errors (bool): Compute jackknife errors
+        """
+
+        # Solve free energies if necessary
+        self.solve() if self.f is None else None
+
+        # Get couplings
+        Js = np.atleast_1d(np.asarray(Js, dtype = np.float64))
+
+        # Check if errors are requested
+        if errors is False:
+            # Return estimate
+            return self.__evaluate(name, Js, None)
+
+        # Return jackknife estimate and error
+        return self.__jackknife(lambda block: self.__evaluate(name, Js, block))
+
+    def peak(self, name = 'specific_heat', J_range = None, n_grid = 201, n_zoom = 3):
+        """Locate peak
+
+        Locate maximum of a quantity (see estimate) in J_range
+        (range of run couplings if None): take the largest value
+        on a grid of n_grid couplings, then zoom in n_zoom times
+        on a finer grid around it. Location and height get block
+        jackknife errors. A peak at the edge of J_range means the
+        maximum lies outside it
+
+        Attributes:
+            name (str): Quantity
+            J_range (tuple or None): Smallest and largest coupling
+            n_grid (int): Number of couplings in grid
+            n_zoom (int): Number of refinements
+        """
+
+        # Solve free energies if necessary
+        self.solve() if self.f is None else None
+
+        # Get range of couplings
+        J_lo, J_hi = (min(self.Js), max(self.Js)) if J_range is None else J_range
+
+        # Define search for peak with given samples
+        def search(block):
+            # Start with whole range
+            Js = np.linspace(J_lo, J_hi, n_grid)
+
+            # Cycle through refinements
+            for _ in range(n_zoom + 1):
+                # Get quantity on grid and location and height of maximum
+                values = self.__evaluate(name, Js, block); i_max = np.argmax(values);
+                J_max = Js[i_max]; height = values[i_max];
+
+                # Zoom in around maximum
+                step = Js[1] - Js[0]
+                Js = np.linspace(max(J_max - step, J_lo), min(J_max + step, J_hi), 21)
+
+            # Return location and height of peak on last grid evaluated
+            return np.array([J_max, height])
+
+        # Get jackknife estimates and errors
+        mean, err = self.__jackknife(search)
+
+        # Return peak
+        return {'J' : mean[0], 'J_err' : err[0], 'height' : mean[1], 'height_err' : err[1]}
@@ -2,15 +2,57 @@
 # For number crunching
 import numpy as np
 
+# For scalar math in hot loops
+import math
+
 # For loading/saving configurations/rng states
 import pickle as pickle
 
+# For checking files on disk
+import os
+
+# For saving accumulator states
+import json
+
+# For timing updates when picking a schedule
+import time
+
 """ Import local modules """
+# For output and instrumentation
+from instruments import *
+
 # For cluster update
 from cluster import *
 
+# For Swendsen-Wang update
+from sw_cluster import *
+
+# For checkerboard sweeps
+from sweep import *
+
+# For checkerboard sweeps in worker processes
+from parallel_sweep import *
+
+# For compiled kernels
+from xy_kernels import *
+
+# For buffered random numbers
+from xy_rng import *
+
+# For neighbor structure of lattice
+from geometry import *
+
 # For creating lattice sites
 from xy_lattice import *
 
+# For storing configurations
+from trajectory import *
+
+# For writing configurations in background
+from checkpoint import *
+
+# For online statistics
+from accumulators import *
+
 # For measuring observables on lattice
 from xy_meas import *
@@ -0,0 +1,231 @@
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+""" Local modules """
+# Output and instrumentation
+from instruments import logger, logging
+
+""" Swendsen-Wang class """
+class XYSwendsenWang:
+    """Swendsen-Wang update class.
+
+    Class implements multi-cluster update according to algorithm
+    in Phys. Rev. Lett. 58, 86 ("Nonuniversal Critical Dynamics in
+    Monte Carlo Simulations", R. H. Swendsen and J.-S. Wang) with
+    the embedding of Phys. Rev. Lett. 62, 361 (U. Wolff). Every bond
+    is activated at once for a random reflection direction, the
+    whole lattice is split into clusters and each cluster is
+    reflected with probability 1/2
+
+    Attributes:
+       n_clusters (int): Number of clusters in last update
+       max_cluster (int): Size of largest cluster in last update
+    """
+    def __init__(self):
+        """ Give user information """
+        # Tell user
+        logger.debug('Swendsen-Wang update class initialized.')
+
+        # Initialize cluster statistics
+        self.n_clusters = 0; self.max_cluster = 0;
+
+        # Return nothing
+        return None
+
+    """ Private methods """
+    def __activate_bonds(self, proj):
+        """Activate bonds
+
+        Activate every forward bond (i, j) with probability
+        1 - exp(min(0, -2 J p_i p_j)), p being the projection
+        of each spin onto the reflection direction
+
+        Attributes:
+           proj (array): Projection of each spin onto refl. dir.
+           bond_i, bond_j (array): Ends of every forward bond
+           prob_acc (array): Probability of activating each bond
+        """
+
+        # Get both ends of every forward bond
+        bond_i, bond_j, _ = self.lattice.geometry.bonds
+
+        # Get probability of activating each bond
+        prob_acc = 1. - np.exp(np.minimum(0., -2. * self.J * proj[bond_i] * proj[bond_j]))
+
+        # Check which bonds are activated
+        active = self._rand_zero_to_one(len(bond_i)) < prob_acc
+
+        # Return ends of active bonds
+        return bond_i[active], bond_j[active]
+
+    def __label_clusters(self, bond_i, bond_j):
+        """Label clusters
+
+        Vectorized union-find over active bonds. Each round hooks the
+        root of every bond end onto the smaller of the two roots,
+        then compresses paths by pointer jumping until every site
+        points at its root. Rounds stop once both ends of every
+        active bond share a root. Each cluster ends up labelled by
+        its smallest site
+
+        Attributes:
+           labels (array): Root of each site
+           root_i, root_j (array): Roots of bond ends
+           low (array): Smaller root of bond ends
+        """
+
+        # Every site starts as its own root
+        labels = np.arange(self.size, dtype = np.int32)
+
+        # Keep hooking until all bonds are inside clusters
+        while True:
+            # Get roots of bond ends
+            root_i = labels[bond_i]; root_j = labels[bond_j];
+
+            # Check if every bond is inside a cluster
+            if np.array_equal(root_i, root_j):
+                # Done
+                break
+
+            # Get smaller root of bond ends
+            low = np.minimum(root_i, root_j)
+
+            # Hook roots onto smaller root
+            np.minimum.at(labels, root_i, low); np.minimum.at(labels, root_j, low);
+
+            # Compress paths until every site points at its root
+            while True:
+                # Jump to parent of parent
+                jumped = labels[labels]
+
+                # Check if paths are compressed
+                if np.array_equal(jumped, labels):
+                    # Done
+                    break
+
+                # Save jumped labels
+                labels = jumped
+
+        # Return labels
+        return labels
+
+    """ Public methods """
+    def sw_update(self, save = False, prnt = False):
+        """Implement Swendsen-Wang update
+
+        Implement Swendsen-Wang update. Information about the update
+        is logged at INFO level if prnt is True and at DEBUG level
+        otherwise
+
+        Attributes:
+           inst (XYInstruments): Instrumentation of updates
+           angle (float): Random angle to define reflection
+           proj (array): Projection of each spin onto refl. dir.
+           labels (array): Cluster label of each site
+           sizes (array): Size of cluster labelled by each site
+           flip (array): Whether each site is reflected
+        """
+
+        """ Initial tasks """
+        # Start timing update
+        inst = self.instruments; inst.start('growth');
+
+        # Sample a random angle
+        angle = self._rand_angle()
+
+        # Create lattice vector representing reflection
+        self.refl_dir = self.lattice.reflection(angle)
+
+        """ Build clusters """
+        # Get spin components
+        cos, sin = self.lattice.components()
+
+        # Get projections onto reflection direction
+        proj = cos * self.refl_dir[0] + sin * self.refl_dir[-1]
+
+        # Label clusters connected by active bonds
+        labels = self.__label_clusters(*self.__activate_bonds(proj))
+
+        # Get size of each cluster
+        sizes = np.bincount(labels, minlength = self.size)
+
+        # Set cluster statistics
+        self.n_clusters = np.count_nonzero(sizes); self.max_cluster = sizes.max();
+
+        # Compute improved estimators if requested
+        if self.improved is True:
+            # Time measurements
+            inst.enter('meas')
+
+            # Compute estimators from clusters
+            self._improved_estimators(labels, proj)
+
+            # Back to growth
+            inst.enter('growth')
+
+        """ Reflect clusters """
+        # Reflect each cluster with probability 1/2
+        flip = (self._rand_zero_to_one(self.size) < 0.5)[labels]
+
+        # Time flips
+        inst.enter('flip')
+
+        # Reset mask entries left by last Wolff cluster (cleared lazily in cluster_update)
+        self._in_cluster[self.cluster_sites] = 0
+
+        # Get reflected sites
+        self.cluster_sites = np.flatnonzero(flip)
+
+        # Keep stored angles before flip if rounded flips are tracked
+        old = (self.lattice.angles[self.cluster_sites]
+               if (self.track_obs is True) and (self.lattice.storage == 'float32') else None)
+
+        # Save reflected spins
+        self.lattice.set_new_lat_vecs(self.cluster_sites,
+                                      cos[self.cluster_sites]
+                                      - 2. * proj[self.cluster_sites] * self.refl_dir[0],
+                                      sin[self.cluster_sites]
+                                      - 2. * proj[self.cluster_sites] * self.refl_dir[-1])
+
+        # Count clusters
+        inst.count_clusters(sizes[sizes > 0])
+
+        # Time measurements
+        inst.enter('meas')
+
+        # Update running observables if requested
+        if self.track_obs is True:
+            # Mark reflected sites
+            self._in_cluster[self.cluster_sites] = 1
+
+            # Update energy and magnetization from reflection
+            self._track_reflection(self.cluster_sites, self.refl_dir, old)
+
+            # Unmark reflected sites
+            self._in_cluster[self.cluster_sites] = 0
+
+        """ Update lattice and save if necessary """
+        # Update configuration number
+        self.conf_num += 1
+
+        # Check if save is true
+        if save is True:
+            # Save angles to location
+            self._save_conf('sw', prnt)
+
+        """ Log and hand out info """
+        # Log information about update
+        logger.log(logging.INFO if prnt is True else logging.DEBUG,
+                   'conf. num. %d of %s: angle, alg = %s, sw; number of clusters: %d; '
+                   'largest cluster: %d', self.conf_num, self.ens_name.strip('_'),
+                   angle, self.n_clusters, self.max_cluster)
+
+        # Finish timing update
+        inst.finish({'conf_num' : self.conf_num, 'alg' : 'sw',
+                     'n_flipped' : len(self.cluster_sites),
+                     'n_clusters' : int(self.n_clusters),
+                     'max_cluster' : int(self.max_cluster)})
+
+        # Return nothing
+        return None
@@ -0,0 +1,307 @@
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+""" Local modules """
+# Output and instrumentation
+from instruments import logger, logging
+
+# For sweeps in worker processes
+from parallel_sweep import XYParallelSweep
+
+""" Sweep class """
+class XYSweep:
+    """Sweep update class.
+
+    Class implements checkerboard sweeps over the lattice. All
+    sites of the even sublattice are updated at once, then all
+    sites of the odd sublattice. Sites of one sublattice are never
+    neighbors, so each half-sweep is a set of independent local
+    updates that can be done in bulk. Two kinds of local update
+    are available:
+       - "metropolis": Propose a new angle uniformly within
+         metro_delta of the old one and accept with probability
+         min(1, exp(-dE))
+       - "overrelax": Reflect each spin about its local field,
+         which leaves the energy unchanged
+    After set_parallel, sweeps are done by worker processes on
+    strips of the lattice in shared memory (see XYParallelSweep)
+
+    Attributes:
+       metro_delta (float): Half width of Metropolis proposals
+       acc_rate (float): Acceptance rate of last Metropolis sweep
+       parallel (XYParallelSweep or None): Workers of parallel sweeps
+    """
+    def __init__(self):
+        """ Give user information """
+        # Tell user
+        logger.debug('Sweep update class initialized.')
+
+        # Set default half width of Metropolis proposals
+        self.metro_delta = np.pi
+
+        # Initialize acceptance rate
+        self.acc_rate = 1.
+
+        # Start with serial sweeps
+        self.parallel = None
+
+        # Return nothing
+        return None
+
+    """ Private methods """
+    def __local_field(self, sites):
+        """Get local field
+
+        Get sum of neighboring spins at each site
+
+        Attributes:
+           nghbrs (array): Neighbors of sites
+           owner (array): Site each neighbor belongs to
+        """
+
+        # Check if neighbor table exists
+        if self.lattice.neighbors is not None:
+            # Get spin components of neighbors of sites
+            cos, sin = self.lattice.components(self.lattice.neighbors[sites])
+
+            # Return components of local field
+            return cos.sum(axis = 1), sin.sum(axis = 1)
+
+        # Get neighbors of sites from CSR index
+        owner, nghbrs = self.lattice.geometry.neighbors_of(sites)
+
+        # Get spin components of neighbors
+        cos, sin = self.lattice.components(nghbrs)
+
+        # Return components of local field
+        return (np.bincount(owner, weights = cos, minlength = len(sites)),
+                np.bincount(owner, weights = sin, minlength = len(sites)))
+
+    def __metropolis(self, sites):
+        """Metropolis update of sublattice
+
+        Metropolis update of every site in sublattice with one
+        batch of proposals and one batch of acc./rej. tests
+
+        Attributes:
+           h_x, h_y (array): Local field at sites
+           new_angles (array): Proposed angles
+           d_energ (array): Change in energy of each proposal
+           acc (array): Whether each proposal is accepted
+        """
+
+        """ Make proposals """
+        # Get local field
+        h_x, h_y = self.__local_field(sites)
+
+        # Get old spin components
+        old_cos, old_sin = self.lattice.components(sites)
+
+        # Propose new angles within metro_delta of old angles (rounded to stored angles)
+        new_angles = self.lattice.quantize(self.lattice.to_radians(self.lattice.angles[sites])
+                                           + (self._rand_angle(len(sites)) - np.pi)
+                                           * self.metro_delta / np.pi)
+
+        # Get new spin components
+        new_cos = np.cos(new_angles); new_sin = np.sin(new_angles);
+
+        # Get change in energy
+        d_energ = -self.J * ((new_cos - old_cos) * h_x + (new_sin - old_sin) * h_y)
+
+        """ Do acc./rej. step """
+        # Check which proposals are accepted
+        acc = self._rand_zero_to_one(len(sites)) < np.exp(-d_energ)
+
+        # Save accepted angles
+        self.lattice.set_site_angles(sites[acc], new_angles[acc])
+
+        # Return number accepted, change in energy and magnetization
+        return (np.count_nonzero(acc), d_energ[acc].sum(),
+                np.array([(new_cos - old_cos)[acc].sum(),
+                          (new_sin - old_sin)[acc].sum()]))
+
+    def __overrelax(self, sites):
+        """Over-relaxation update of sublattice
+
+        Reflect every spin in sublattice about its local field,
+        s -> 2 (s.h) h / |h|^2 - s. Sites with vanishing local
+        field are left alone. The reflection conserves energy, but
+        float32 angles are rounded after it, so then the changes
+        are taken from the stored spins before and after
+
+        Attributes:
+           h_x, h_y (array): Local field at sites
+           h_sq (array): Squared magnitude of local field
+           keep (array): Whether local field at site is nonvanishing
+           scale (array): 2 (s.h) / |h|^2 at each site
+           d_cos, d_sin (array): Changes of rounded spins (float32 storage)
+        """
+
+        """ Reflect spins """
+        # Get local field
+        h_x, h_y = self.__local_field(sites)
+
+        # Get old spin components
+        old_cos, old_sin = self.lattice.components(sites)
+
+        # Get squared magnitude of local field
+        h_sq = h_x * h_x + h_y * h_y
+
+        # Get sites with nonvanishing local field
+        keep = h_sq > 0.
+
+        # Leave sites with vanishing local field alone
+        sites = sites[keep]; h_x = h_x[keep]; h_y = h_y[keep]; h_sq = h_sq[keep];
+        old_cos = old_cos[keep]; old_sin = old_sin[keep];
+
+        # Get scale of projection onto local field
+        scale = 2. * (old_cos * h_x + old_sin * h_y) / h_sq
+
+        # Save reflected spins
+        self.lattice.set_new_lat_vecs(sites, scale * h_x - old_cos,
+                                      scale * h_y - old_sin)
+
+        # Check if reflected angles are rounded to stored values
+        if self.lattice.storage == 'float32':
+            # Get changes of stored spins (energy is no longer conserved exactly)
+            new_cos, new_sin = self.lattice.components(sites)
+            d_cos = new_cos - old_cos; d_sin = new_sin - old_sin;
+
+            # Return number updated, change in energy and magnetization
+            return (len(sites), -self.J * np.sum(d_cos * h_x + d_sin * h_y),
+                    np.array([d_cos.sum(), d_sin.sum()]))
+
+        # Return number updated, change in energy and magnetization
+        return (len(sites), 0.,
+                np.array([(scale * h_x - 2. * old_cos).sum(),
+                          (scale * h_y - 2. * old_sin).sum()]))
+
+    """ Public methods """
+    def set_parallel(self, n_procs = None, n_strips = None):
+        """Switch to parallel sweeps
+
+        Do following sweeps in n_procs worker processes (all cores
+        if None) on n_strips strips of the lattice. The lattice is
+        moved into shared memory. Parallel sweeps draw from streams
+        derived from the seeds and the configuration number, not from
+        the RNG's saved with configurations, so saving, resuming and
+        switching back with set_serial work at any configuration
+
+        Attributes:
+           n_procs (int or None): Number of worker processes (0 to run in-process)
+           n_strips (int or None): Number of strips (64 if None)
+        """
+
+        # Stop workers of earlier parallel sweeps
+        self.set_serial()
+
+        # Start workers
+        self.parallel = XYParallelSweep(self.lattice, self.seeds, n_procs, n_strips)
+
+        # Tell user
+        logger.info('Parallel sweeps with %d processes on %d strips',
+                    self.parallel.n_procs, self.parallel.n_strips)
+
+        # Return nothing
+        return None
+
+    def set_serial(self):
+        """Switch to serial sweeps
+
+        Stop workers of parallel sweeps and move the lattice
+        back into private memory
+
+        Attributes:
+        """
+
+        # Check if sweeps are parallel
+        if self.parallel is not None:
+            # Stop workers
+            self.parallel.close(); self.parallel = None;
+
+        # Return nothing
+        return None
+
+    def sweep_update(self, save = False, prnt = False, kind = None):
+        """Implement checkerboard sweep
+
+        Implement checkerboard sweep with algorithm kind (self.alg
+        if None). Local updates are timed as flips. Information
+        about the update is logged at INFO level if prnt is True
+        and at DEBUG level otherwise
+
+        Attributes:
+           kind (str or None): Local update ('metropolis' or 'overrelax')
+           inst (XYInstruments): Instrumentation of updates
+           local_update (method): Update of a single sublattice
+           n_acc (int): Number of accepted updates
+           d_energ (float): Change in energy
+           d_mag_tot (array): Change in total magnetization vector
+        """
+
+        """ Initial tasks """
+        # Check that checkerboard is valid
+        if self.lattice.geometry.bipartite is False:
+            # Same-colored sites would be neighbors across boundary
+            raise ValueError('Checkerboard sweeps need even extent along periodic axes, got '
+                             + str(self.lattice.shape))
+
+        # Get kind of local update
+        kind = self.alg if kind is None else kind
+
+        # Get update of a single sublattice
+        local_update = {'metropolis' : self.__metropolis,
+                        'overrelax' : self.__overrelax}[kind]
+
+        """ Sweep even then odd sublattice """
+        # Start timing update
+        inst = self.instruments; inst.start('flip');
+
+        # Initialize changes
+        n_acc = 0; d_energ = 0.; d_mag_tot = np.zeros(2);
+
+        # Check if sweeps are parallel
+        if self.parallel is not None:
+            # Sweep strips in worker processes
+            n_acc, d_energ, d_mag_tot = self.parallel.sweep(self.lattice, self.conf_num, self.J,
+                                                            kind, self.metro_delta)
+        else: # Otherwise, sweep here
+            # Cycle through sublattices
+            for sites in self.lattice.sublattices:
+                # Update sublattice
+                n_sub, d_energ_sub, d_mag_sub = local_update(sites)
+
+                # Accumulate changes
+                n_acc += n_sub; d_energ += d_energ_sub; d_mag_tot += d_mag_sub;
+
+        # Set acceptance rate
+        self.acc_rate = n_acc / self.size
+
+        # Time measurements
+        inst.enter('meas')
+
+        # Update running observables if requested
+        self._track_delta(d_energ, d_mag_tot) if self.track_obs is True else None
+
+        """ Update lattice and save if necessary """
+        # Update configuration number
+        self.conf_num += 1
+
+        # Check if save is true
+        if save is True:
+            # Save angles to location
+            self._save_conf(self.alg, prnt)
+
+        """ Log and hand out info """
+        # Log information about update
+        logger.log(logging.INFO if prnt is True else logging.DEBUG,
+                   'conf. num. %d of %s: alg = %s; acceptance rate: %s',
+                   self.conf_num, self.ens_name.strip('_'), kind, self.acc_rate)
+
+        # Finish timing update
+        inst.finish({'conf_num' : self.conf_num, 'alg' : kind,
+                     'n_flipped' : int(n_acc), 'acc_rate' : float(self.acc_rate)})
+
+        # Return nothing
+        return None
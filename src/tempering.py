@@ -0,0 +1,389 @@
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+# For running replicas in worker processes
+import multiprocessing as mp
+
+# For counting cores
+import os
+
+""" Local modules """
+# For replicas
+from xy_model import XYSimulation
+
+# For swap decisions
+from xy_rng import BufferedRNG
+
+""" Replica helpers """
+def replica_seeds(seeds, replica):
+    """Derive seeds of replica
+
+    Derive independent seeds for a replica from a seeds dictionary,
+    spawning one child stream per replica from each seed
+
+    Attributes:
+        seeds (dict): Seeds dictionary of XYSimulation
+        replica (int): Index of replica
+    """
+
+    # Return seeds of replica
+    return {key : int(np.random.SeedSequence(seed, spawn_key = (replica,))
+                      .generate_state(1)[0])
+            for key, seed in seeds.items()}
+
+class _ReplicaGroup(object):
+    """Group of replicas
+
+    Group of replicas living in one process
+
+    Attributes:
+        replicas (list): XYSimulation objects of group
+    """
+    def __init__(self, replica_kwargs):
+        # Create replicas
+        self.replicas = [XYSimulation(**kwargs) for kwargs in replica_kwargs]
+
+        # Return nothing
+        return None
+
+    def update(self, n_updates):
+        """Update replicas
+
+        Update every replica and measure its energy
+
+        Attributes:
+            n_updates (int): Number of updates per replica
+        """
+
+        # Cycle through replicas
+        for sim in self.replicas:
+            # Do updates
+            [sim.update() for _ in range(n_updates)]
+
+            # Measure energy
+            sim.energ()
+
+        # Return energy divided by coupling of each replica
+        return [sim.energy / sim.J for sim in self.replicas]
+
+    def set_couplings(self, Js):
+        """Set couplings
+
+        Set coupling of every replica
+
+        Attributes:
+            Js (list): New coupling of each replica
+        """
+
+        # Set couplings
+        [sim.set_coupling(J) for sim, J in zip(self.replicas, Js)]
+
+        # Return nothing
+        return None
+
+def _replica_worker(conn, replica_kwargs):
+    """Worker process
+
+    Holds a group of replicas and runs commands sent by driver
+
+    Attributes:
+        conn (Connection): End of pipe to driver
+        replica_kwargs (list): Arguments of each replica
+    """
+
+    # Create replicas
+    group = _ReplicaGroup(replica_kwargs)
+
+    # Tell driver replicas are ready
+    conn.send(None)
+
+    # Keep running commands until told to stop
+    while True:
+        # Get command
+        cmd, args = conn.recv()
+
+        # Check if told to stop
+        if cmd == 'stop':
+            # Done
+            break
+
+        # Run command and send result back
+        conn.send(getattr(group, cmd)(*args))
+
+    # Close pipe
+    conn.close()
+
+    # Return nothing
+    return None
+
+""" Parallel tempering class """
+class XYTempering(object):
+    """Parallel tempering across couplings
+
+    Holds one XYSimulation replica per coupling on a ladder and
+    advances them concurrently in worker processes. Between rounds
+    of updates, couplings of neighboring rungs are exchanged with
+    probability min(1, exp((J_k - J_k+1) (H_k - H_k+1))), where
+    H = energy / J is measured with XYMeas.energ. Even and odd
+    pairs of rungs are tried on alternate rounds. Couplings, not
+    configurations, move between replicas, so nothing but energies
+    and couplings crosses process boundaries.
+
+    Attributes:
+        Js (array): Ladder of couplings (sorted)
+        N (int): Linear dimension of lattice
+        n_procs (int): Number of worker processes (0 to run in-process)
+        rep_at_J (array): Replica currently at each coupling
+        n_attempts (array): Swaps attempted between rungs k and k + 1
+        n_accepts (array): Swaps accepted between rungs k and k + 1
+        closed (bool): Whether workers were stopped by close
+    """
+    def __init__(self, Js, N, n_procs = None, seeds = None,
+                 start = None, alg = 'cluster', save_loc = './',
+                 track_obs = False):
+        """ Set initial variables """
+        # Set ladder of couplings
+        self.Js = np.sort(np.asarray(Js, dtype = np.float64))
+
+        # Check that ladder is usable
+        if (len(self.Js) < 2) or np.any(self.Js == 0.):
+            # Tell user what is wrong
+            raise ValueError('Need at least two nonzero couplings')
+
+        # Set linear dimension of lattice
+        self.N = N
+
+        # Set number of worker processes
+        self.n_procs = min(os.cpu_count() if n_procs is None else n_procs, len(self.Js))
+
+        # Set seeds
+        self.seeds = ({'start' : 0, 'angles' : 1, 'probabilities' : 2, 'sites' : 3}
+                      if seeds is None else seeds)
+
+        # Initialize replica at each coupling
+        self.rep_at_J = np.arange(len(self.Js))
+
+        # Initialize swap statistics
+        self.n_attempts = np.zeros(len(self.Js) - 1, dtype = np.int64)
+        self.n_accepts = np.zeros(len(self.Js) - 1, dtype = np.int64)
+
+        # Initialize parity of pairs to try next
+        self._parity = 0
+
+        # Driver is open until closed
+        self.closed = False
+
+        # Initialize RNG for swap decisions
+        self._swap_rng = BufferedRNG(seed = replica_seeds(self.seeds, len(self.Js))['probabilities'])
+
+        """ Create replicas """
+        # Get arguments of each replica
+        replica_kwargs = [{'J' : J, 'N' : N, 'seeds' : replica_seeds(self.seeds, replica),
+                           'start' : start, 'alg' : alg, 'save_loc' : save_loc,
+                           'track_obs' : track_obs}
+                          for replica, J in enumerate(self.Js)]
+
+        # Assign replicas to groups
+        self._groups = [list(range(len(self.Js)))[group::max(self.n_procs, 1)]
+                        for group in range(max(self.n_procs, 1))]
+
+        # Check if replicas run in-process
+        if self.n_procs == 0:
+            # Create single group in this process
+            self._local = _ReplicaGroup(replica_kwargs)
+        else: # Otherwise, start worker processes
+            # Start workers
+            self._start_workers(replica_kwargs)
+
+        # Return nothing
+        return None
+
+    """ Protected methods """
+    def _start_workers(self, replica_kwargs):
+        """Start worker processes
+
+        Start one worker process per group of replicas
+
+        Attributes:
+            replica_kwargs (list): Arguments of each replica
+        """
+
+        # Initialize pipes and processes
+        self._conns = []; self._procs = [];
+
+        # Cycle through groups
+        for group in self._groups:
+            # Create pipe
+            conn, child_conn = mp.Pipe()
+
+            # Create worker
+            proc = mp.Process(target = _replica_worker, daemon = True,
+                              args = (child_conn, [replica_kwargs[r] for r in group]))
+
+            # Start worker
+            proc.start()
+
+            # Save pipe and process
+            self._conns.append(conn); self._procs.append(proc);
+
+        # Wait for replicas to be created
+        [conn.recv() for conn in self._conns]
+
+        # Return nothing
+        return None
+
+    def _command(self, cmd, args_of_group):
+        """Run command on every group
+
+        Run command on every group of replicas concurrently
+        and gather results in replica order
+
+        Attributes:
+            cmd (str): Method of _ReplicaGroup to run
+            args_of_group (list): Arguments for each group
+        """
+
+        # Check that driver is open
+        if self.closed is True:
+            # Tell user driver is closed
+            raise RuntimeError('Parallel tempering driver is closed')
+
+        # Check if replicas run in-process
+        if self.n_procs == 0:
+            # Run command directly
+            results = [getattr(self._local, cmd)(*args_of_group[0])]
+        else: # Otherwise, send command to every worker
+            # Send commands
+            [conn.send((cmd, args)) for conn, args in zip(self._conns, args_of_group)]
+
+            # Gather results
+            results = [conn.recv() for conn in self._conns]
+
+        # Check if command returns anything
+        if results[0] is None:
+            # Return nothing
+            return None
+
+        # Initialize result of each replica
+        out = np.empty(len(self.Js))
+
+        # Put results in replica order
+        for group, result in zip(self._groups, results):
+            # Save results of group
+            out[group] = result
+
+        # Return results
+        return out
+
+    def _attempt_swaps(self, H):
+        """Attempt swaps
+
+        Attempt to exchange couplings of every other
+        pair of neighboring rungs
+
+        Attributes:
+            H (array): Energy divided by coupling of each replica
+        """
+
+        # Cycle through pairs of this parity
+        for k in range(self._parity, len(self.Js) - 1, 2):
+            # Get replicas at both rungs
+            a = self.rep_at_J[k]; b = self.rep_at_J[k + 1];
+
+            # Update number of attempts
+            self.n_attempts[k] += 1
+
+            # Do acc./rej. step
+            if self._swap_rng.random() < np.exp(min(0., (self.Js[k] - self.Js[k + 1]) * (H[a] - H[b]))):
+                # Exchange replicas
+                self.rep_at_J[k] = b; self.rep_at_J[k + 1] = a;
+
+                # Update number of accepts
+                self.n_accepts[k] += 1
+
+        # Switch parity for next round
+        self._parity ^= 1
+
+        # Get coupling of each replica
+        J_of_rep = np.empty(len(self.Js)); J_of_rep[self.rep_at_J] = self.Js;
+
+        # Send new couplings to replicas
+        self._command('set_couplings', [([J_of_rep[r] for r in group],)
+                                        for group in self._groups])
+
+        # Return nothing
+        return None
+
+    """ Public methods """
+    def run(self, n_rounds, updates_per_round = 1, save = False):
+        """Run parallel tempering
+
+        Run rounds of concurrent updates followed by swap attempts.
+        Configurations are not saved: replicas have their own seeds
+        and RNG streams, and each one moves along the ladder, so the
+        trajectory of a coupling would mix replicas and could not be
+        resumed. save = True raises ValueError
+
+        Attributes:
+            n_rounds (int): Number of rounds
+            updates_per_round (int): Updates of each replica per round
+            save (bool): Must be False
+            energies (array): Energy at each coupling after each round
+        """
+
+        # Check that no saves are requested
+        if save is not False:
+            # Tell user why configurations cannot be saved
+            raise ValueError('Parallel tempering does not save configurations: a coupling\'s '
+                             'trajectory would mix replicas with different RNG streams')
+
+        # Initialize energy at each coupling
+        energies = np.empty((n_rounds, len(self.Js)))
+
+        # Cycle through rounds
+        for n in range(n_rounds):
+            # Update replicas and get energies divided by couplings
+            H = self._command('update', [(updates_per_round,)] * len(self._groups))
+
+            # Save energy at each coupling
+            energies[n] = self.Js * H[self.rep_at_J]
+
+            # Attempt swaps
+            self._attempt_swaps(H)
+
+        # Return energy at each coupling
+        return energies
+
+    def acc_rates(self):
+        """Get swap acceptance rates
+
+        Get acceptance rate of swaps between rungs k and k + 1
+
+        Attributes:
+        """
+
+        # Return acceptance rates
+        return self.n_accepts / np.maximum(self.n_attempts, 1)
+
+    def close(self):
+        """Stop worker processes
+
+        Stop worker processes. The driver cannot be run afterwards
+
+        Attributes:
+        """
+
+        # Check if there are workers to stop
+        if (self.n_procs > 0) and (self.closed is False):
+            # Tell workers to stop
+            [conn.send(('stop', ())) for conn in self._conns]
+
+            # Wait for workers to finish
+            [proc.join() for proc in self._procs]
+
+        # Mark driver as closed and drop in-process replicas
+        self.closed = True; self._local = None;
+
+        # Return nothing
+        return None
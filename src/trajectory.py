@@ -0,0 +1,325 @@
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+# For header and RNG states
+import json
+
+# For checking files
+import os
+
+""" Trajectory class """
+class XYTrajectory(object):
+    """Trajectory store for configurations
+
+    Append-only binary file holding every saved configuration of an
+    ensemble. The file starts with a fixed-size header (magic string
+    followed by JSON describing N, shape, J, alg, seeds, the angle dtype,
+    the number of clock states q of quantized angles and the size of the
+    RNG slot), followed by fixed-size records:
+       - conf_num (int64): Configuration number
+       - rng_len (int64): Length of RNG state in slot
+       - rng (bytes): JSON of RNG states, zero padded
+       - angles (dtype, size): Angle of every lattice site (clock
+         index if q is set)
+    Since records have fixed size, record i starts at a known offset
+    and the whole file can be opened with np.memmap to slice
+    configurations without copying. A record cut short by a crash is
+    ignored. A trajectory opened with the description of the lattice
+    (N given) refuses to append to a file whose header has another
+    shape, dtype, q or seeds.
+
+    Attributes:
+        path (str): Location of trajectory file
+        header (dict): Contents of header
+        n_records (int): Number of complete records
+    """
+    # Magic string at start of file
+    magic = b'XYTRAJ1\n'
+
+    # Size of header in bytes
+    header_size = 4096
+
+    def __init__(self, path, N = None, J = None, alg = None,
+                 seeds = None, dtype = 'float64', shape = None, q = None):
+        # Save location of file
+        self.path = path
+
+        # Get shape of lattice (square if not given)
+        shape = (N, N) if shape is None else tuple(shape)
+
+        # Get contents of header describing this lattice
+        header = {'N' : N, 'shape' : shape, 'size' : int(np.prod(shape)) if N is not None else None,
+                  'J' : J, 'alg' : alg, 'seeds' : seeds, 'dtype' : np.dtype(dtype).str,
+                  'q' : q, 'rng_bytes' : None}
+
+        # Keep header to check existing file against before appending (not if only reading)
+        self._expected = header if N is not None else None
+
+        # Check if file exists already
+        if os.path.exists(path):
+            # Read header
+            self.__read_header()
+        else: # Otherwise, header is written with first record
+            # Save contents of header
+            self.header = header
+
+        # Initialize index of configuration numbers
+        self._index = {}; self._n_indexed = 0;
+
+        # Return nothing
+        return None
+
+    """ Private methods """
+    def __read_header(self):
+        """Read header
+
+        Read and check header of existing file
+
+        Attributes:
+        """
+
+        # Open file
+        with open(self.path, 'rb') as in_file:
+            # Read header block
+            block = in_file.read(self.header_size)
+
+        # Check magic string
+        if not block.startswith(self.magic):
+            # Tell user file is not a trajectory
+            raise ValueError(self.path + ' is not an XY trajectory file')
+
+        # Parse header
+        self.header = json.loads(block[len(self.magic):].rstrip(b'\0').decode())
+
+        # Return nothing
+        return None
+
+    def __check_header(self):
+        """Check header
+
+        Check that header of file describes the same lattice, storage
+        and seeds as the trajectory was opened with. Values are
+        compared after a round trip through JSON
+
+        Attributes:
+            keys (tuple): Fields of header that have to agree
+            found (dict): Fields of header in file
+            wanted (dict): Fields of header trajectory was opened with
+        """
+
+        # Get fields that have to agree
+        keys = ('shape', 'size', 'dtype', 'q', 'seeds')
+
+        # Get fields of file and of this trajectory as JSON values
+        found = json.loads(json.dumps({key : self.header.get(key) for key in keys}))
+        wanted = json.loads(json.dumps({key : self._expected[key] for key in keys},
+                                       default = lambda obj: obj.tolist()))
+
+        # Check if fields agree
+        if found != wanted:
+            # Tell user which fields differ
+            raise ValueError('Cannot append to ' + self.path + ': header has '
+                             + ', '.join(key + ' = ' + repr(found[key]) for key in keys
+                                         if found[key] != wanted[key])
+                             + ' instead of '
+                             + ', '.join(key + ' = ' + repr(wanted[key]) for key in keys
+                                         if found[key] != wanted[key]))
+
+        # Return nothing
+        return None
+
+    def __write_header(self):
+        """Write header
+
+        Write header of new file
+
+        Attributes:
+        """
+
+        # Encode header
+        block = self.magic + json.dumps(self.header).encode()
+
+        # Check that header fits
+        if len(block) > self.header_size:
+            # Tell user header is too large
+            raise ValueError('Trajectory header exceeds ' + str(self.header_size) + ' bytes')
+
+        # Write header padded with zeros
+        with open(self.path, 'wb') as out_file:
+            # Write header block
+            out_file.write(block.ljust(self.header_size, b'\0'))
+
+        # Return nothing
+        return None
+
+    """ Public methods """
+    def record_dtype(self):
+        """Get record dtype
+
+        Get structured dtype of one record
+
+        Attributes:
+        """
+
+        # Return record dtype
+        return np.dtype([('conf_num', '<i8'), ('rng_len', '<i8'),
+                         ('rng', 'u1', (self.header['rng_bytes'],)),
+                         ('angles', self.header['dtype'], (self.header['size'],))])
+
+    @property
+    def n_records(self):
+        """Get number of records
+
+        Get number of complete records in file
+
+        Attributes:
+        """
+
+        # Check if file has been written yet
+        if not os.path.exists(self.path):
+            # No records
+            return 0
+
+        # Return number of complete records
+        return ((os.path.getsize(self.path) - self.header_size)
+                // self.record_dtype().itemsize)
+
+    def records(self, mode = 'r'):
+        """Get records
+
+        Get memory map of all complete records
+
+        Attributes:
+            mode (str): Mode of memory map
+        """
+
+        # Return memory map of records
+        return np.memmap(self.path, dtype = self.record_dtype(), mode = mode,
+                         offset = self.header_size, shape = (self.n_records,))
+
+    def conf_nums(self):
+        """Get configuration numbers
+
+        Get configuration number of every record
+
+        Attributes:
+        """
+
+        # Return configuration numbers
+        return np.array(self.records()['conf_num']) if self.n_records > 0 else np.zeros(0, np.int64)
+
+    def find(self, conf_num):
+        """Find record
+
+        Find record holding configuration number, using an index of
+        configuration numbers that is extended as records are added
+
+        Attributes:
+            conf_num (int): Configuration number
+        """
+
+        # Check if index is out of date
+        if self._n_indexed != self.n_records:
+            # Index configuration numbers (latest record wins)
+            self._index = {int(c) : i for i, c in enumerate(self.conf_nums())}
+
+            # Save number of indexed records
+            self._n_indexed = self.n_records
+
+        # Check if configuration is in file
+        if conf_num not in self._index:
+            # Tell user configuration is missing
+            raise KeyError('Configuration ' + str(conf_num) + ' not in ' + self.path)
+
+        # Return record
+        return self._index[conf_num]
+
+    def append(self, conf_num, angles, rng_states):
+        """Append configuration
+
+        Append configuration and RNG states as new record
+
+        Attributes:
+            conf_num (int): Configuration number
+            angles (array): Angle of every lattice site
+            rng_states (list): States of RNG's
+            rng (bytes): JSON of RNG states
+        """
+
+        # Encode RNG states
+        rng = json.dumps(rng_states, default = lambda obj: obj.tolist()).encode()
+
+        # Check if this is first record
+        if not os.path.exists(self.path):
+            # Size RNG slot from first state
+            self.header['rng_bytes'] = 512 * (2 * len(rng) // 512 + 1)
+
+            # Write header
+            self.__write_header()
+        elif self.header['rng_bytes'] is None:
+            # Read header written by another writer
+            self.__read_header()
+
+        # Check header of file once before first append
+        if self._expected is not None:
+            # Check header and forget expected header
+            self.__check_header(); self._expected = None;
+
+        # Check that RNG state fits in slot
+        if len(rng) > self.header['rng_bytes']:
+            # Tell user state is too large
+            raise ValueError('RNG state exceeds slot of trajectory ' + self.path)
+
+        # Create record
+        record = np.zeros(1, dtype = self.record_dtype())
+
+        # Fill record
+        record['conf_num'] = conf_num; record['rng_len'] = len(rng);
+        record['rng'][0, :len(rng)] = np.frombuffer(rng, dtype = np.uint8)
+        record['angles'][0] = angles
+
+        # Append record to file
+        with open(self.path, 'r+b') as out_file:
+            # Move to end of last complete record
+            out_file.seek(self.header_size + self.n_records * record.itemsize)
+
+            # Write record
+            out_file.write(record.tobytes())
+
+            # Drop partial record left by crash, if any
+            out_file.truncate()
+
+        # Return nothing
+        return None
+
+    def read(self, conf_num, raw = False):
+        """Read configuration
+
+        Read angles (in radians, or as stored if raw is True)
+        and RNG states of configuration
+
+        Attributes:
+            conf_num (int): Configuration number
+            raw (bool): Return angles in stored dtype
+            record (void): Record holding configuration
+            q (int or None): Number of clock states of quantized angles
+        """
+
+        # Get record
+        record = self.records()[self.find(conf_num)]
+
+        # Decode RNG states
+        rng_states = json.loads(record['rng'][:record['rng_len']].tobytes().decode())
+
+        # Check if stored angles are requested
+        if raw is True:
+            # Return copy of stored angles and RNG states
+            return np.array(record['angles']), rng_states
+
+        # Get number of clock states
+        q = self.header.get('q')
+
+        # Return angles in radians and RNG states
+        return (np.array(record['angles'], dtype = np.float64)
+                * ((2. * np.pi / q) if q is not None else 1.)), rng_states
@@ -0,0 +1,236 @@
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+# Scalar math shared with Python update path
+import math
+
+# Numba for compiled loops (optional)
+try:
+    # Import just-in-time compiler
+    from numba import njit
+
+    # Numba is available
+    HAVE_NUMBA = True
+except ImportError:
+    # Numba is not available
+    HAVE_NUMBA = False
+
+    # Run kernels as plain Python instead
+    def njit(*args, **kwargs):
+        return (lambda func: func) if (len(args) == 0 or not callable(args[0])) else args[0]
+
+""" Wolff kernel """
+@njit(cache = True)
+def wolff_kernel(cos, sin, angles, indptr, indices, in_cluster, rx, ry, J,
+                 buf, pos, stack_site, stack_next, stack_proj, depth,
+                 cluster, n_cluster):
+    """Grow Wolff cluster
+
+    Compiled depth-first growth of a Wolff cluster, doing exactly the
+    same arithmetic in the same order as the Python walk in
+    XYCluster (scalar libm cos/sin/atan2/exp), so both give the same
+    trajectory bit-for-bit. Random numbers are read from buf starting
+    at pos. If buf runs out, the kernel returns early with the stack
+    intact so the caller can refill buf and call again. The walk is
+    finished when the returned depth is zero.
+
+    Attributes:
+        cos, sin, angles (array): Spins of lattice
+        indptr, indices (array): CSR index of neighbors
+        in_cluster (array): Byte mask of cluster sites
+        rx, ry (float): Direction of reflection
+        J (float): Spin-spin coupling
+        buf (array): Block of uniform random numbers
+        pos (int): Position of next random number in buf
+        stack_site, stack_next, stack_proj (array): Stack of frames
+                                                    (stack_next is a position in indices)
+        depth (int): Number of frames on stack
+        cluster (array): Sites of cluster
+        n_cluster (int): Number of sites in cluster
+    """
+
+    # Keep walking until stack is exhausted
+    while depth > 0:
+        # Get site at top of stack
+        site = stack_site[depth - 1]
+
+        # Check if all neighbors of site have been tested
+        if stack_next[depth - 1] == indptr[site + 1]:
+            # Done with this site
+            depth -= 1
+            continue
+
+        # Get neighbor to test
+        nghbr = indices[stack_next[depth - 1]]
+
+        # Skip neighbors already in cluster
+        if in_cluster[nghbr]:
+            stack_next[depth - 1] += 1
+            continue
+
+        # Return early to refill random numbers
+        if pos == buf.shape[0]:
+            return pos, depth, n_cluster
+
+        # Move frame on to next neighbor
+        stack_next[depth - 1] += 1
+
+        # Get projection of neighbor and acceptance probability
+        dt_prd_nghbr = cos[nghbr] * rx + sin[nghbr] * ry
+        prob_acc = 1. - math.exp(min(0., -2. * J * (stack_proj[depth - 1] * dt_prd_nghbr)))
+
+        # Draw random number
+        rand_num = buf[pos]
+        pos += 1
+
+        # Check if change is to be accepted
+        if prob_acc >= rand_num:
+            # Flip neighbor
+            new_cos = cos[nghbr] - 2. * dt_prd_nghbr * rx
+            new_sin = sin[nghbr] - 2. * dt_prd_nghbr * ry
+            angles[nghbr] = math.atan2(new_sin, new_cos) % (2. * math.pi)
+            cos[nghbr] = math.cos(angles[nghbr]); sin[nghbr] = math.sin(angles[nghbr]);
+
+            # Add neighbor to cluster
+            in_cluster[nghbr] = 1; cluster[n_cluster] = nghbr; n_cluster += 1;
+
+            # Push frame of neighbor
+            stack_site[depth] = nghbr; stack_next[depth] = indptr[nghbr];
+            stack_proj[depth] = dt_prd_nghbr; depth += 1;
+
+    # Return position in buf, depth and cluster size
+    return pos, depth, n_cluster
+
+@njit(cache = True)
+def wolff_kernel_compact(angles, cos_table, sin_table, q, indptr, indices, in_cluster, rx, ry, J,
+                         buf, pos, stack_site, stack_next, stack_proj, depth,
+                         cluster, n_cluster, old):
+    """Grow Wolff cluster on compact lattice
+
+    Same walk as wolff_kernel for lattices that only store angles
+    (see XYLattice). With q = 0 angles are float32 and vector
+    components are computed from them; otherwise angles are clock
+    indices and components are read from the tables. Flipped angles
+    are rounded to stored values exactly as XYLattice.set_new_lat_vec
+    does, so both backends give the same trajectory. If old is not
+    empty, the stored angle of each flipped site before its flip is
+    kept in old, in cluster order (to track rounded flips exactly).
+
+    Attributes:
+        angles (array): Stored angles of lattice
+        cos_table, sin_table (array): Vector components of clock states
+        q (int): Number of clock states (0 for float32 angles)
+        old (array): Stored angles of cluster sites before flip (or empty)
+        (others as in wolff_kernel)
+    """
+
+    # Keep walking until stack is exhausted
+    while depth > 0:
+        # Get site at top of stack
+        site = stack_site[depth - 1]
+
+        # Check if all neighbors of site have been tested
+        if stack_next[depth - 1] == indptr[site + 1]:
+            # Done with this site
+            depth -= 1
+            continue
+
+        # Get neighbor to test
+        nghbr = indices[stack_next[depth - 1]]
+
+        # Skip neighbors already in cluster
+        if in_cluster[nghbr]:
+            stack_next[depth - 1] += 1
+            continue
+
+        # Return early to refill random numbers
+        if pos == buf.shape[0]:
+            return pos, depth, n_cluster
+
+        # Move frame on to next neighbor
+        stack_next[depth - 1] += 1
+
+        # Get vector components of neighbor (int() keeps float32 angles typable; adding
+        # 0. keeps LLVM from shrinking cos(float(x)) to single precision cosf(x))
+        if q == 0:
+            angle = float(angles[nghbr]) + 0.
+            cos_nghbr = math.cos(angle); sin_nghbr = math.sin(angle);
+        else:
+            cos_nghbr = cos_table[int(angles[nghbr])]; sin_nghbr = sin_table[int(angles[nghbr])];
+
+        # Get projection of neighbor and acceptance probability
+        dt_prd_nghbr = cos_nghbr * rx + sin_nghbr * ry
+        prob_acc = 1. - math.exp(min(0., -2. * J * (stack_proj[depth - 1] * dt_prd_nghbr)))
+
+        # Draw random number
+        rand_num = buf[pos]
+        pos += 1
+
+        # Check if change is to be accepted
+        if prob_acc >= rand_num:
+            # Keep stored angle before flip if requested
+            if old.shape[0] > 0:
+                old[n_cluster] = angles[nghbr]
+
+            # Flip neighbor, rounding angle to stored value
+            angle = math.atan2(sin_nghbr - 2. * dt_prd_nghbr * ry,
+                               cos_nghbr - 2. * dt_prd_nghbr * rx) % (2. * math.pi)
+            if q == 0:
+                angles[nghbr] = angle
+            else:
+                angles[nghbr] = math.floor(angle * (q / (2. * math.pi)) + 0.5) % q
+
+            # Add neighbor to cluster
+            in_cluster[nghbr] = 1; cluster[n_cluster] = nghbr; n_cluster += 1;
+
+            # Push frame of neighbor
+            stack_site[depth] = nghbr; stack_next[depth] = indptr[nghbr];
+            stack_proj[depth] = dt_prd_nghbr; depth += 1;
+
+    # Return position in buf, depth and cluster size
+    return pos, depth, n_cluster
+
+""" Measurement kernels """
+@njit(cache = True)
+def energ_kernel(cos, sin, bond_i, bond_j):
+    """Sum of bond energies
+
+    Compiled sum of 1 - s_i . s_j over forward bonds
+
+    Attributes:
+        cos, sin (array): Spins of lattice
+        bond_i, bond_j (array): Ends of bonds
+    """
+
+    # Initialize sum
+    total = 0.
+
+    # Cycle through bonds
+    for b in range(bond_i.shape[0]):
+        # Add energy of bond
+        total += 1. - (cos[bond_i[b]] * cos[bond_j[b]] + sin[bond_i[b]] * sin[bond_j[b]])
+
+    # Return sum
+    return total
+
+@njit(cache = True)
+def magn_kernel(cos, sin):
+    """Sum of spins
+
+    Compiled sum of spin components
+
+    Attributes:
+        cos, sin (array): Spins of lattice
+    """
+
+    # Initialize sums
+    tot_x = 0.; tot_y = 0.;
+
+    # Cycle through sites
+    for site in range(cos.shape[0]):
+        # Add spin
+        tot_x += cos[site]; tot_y += sin[site];
+
+    # Return sums
+    return tot_x, tot_y
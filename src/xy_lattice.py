@@ -5,131 +5,334 @@ from sim_imports import *
 class XYLattice(object):
     """Class defining XY lattice
 
-    Class defining XY lattice sites and their attributes
+    Class defining XY lattice as a structure of arrays. Spins are
+    stored as contiguous arrays of angles and vector components,
+    and neighbors are stored once in the compressed index of an
+    XYGeometry.
+
+    The storage mode sets how angles are kept:
+       - "float64": Angles and vector components as float64
+       - "float32": Only angles, as float32; vector components
+         are computed from them when needed
+       - "uint16": Only the index k of angle 2 pi k / q, which
+         makes the lattice an exact q-state clock model; vector
+         components are read from tables of the q angles
+    In the compact modes cos and sin are None and every reader goes
+    through components. Angles written by the set methods are rounded
+    to the nearest stored value.
 
     Attributes:
-        site (int): Location of lattice site
-        value (float): Value of spin at lattice site
-        lat_vec (array): Array of vector components
-        lat_dirs (array): Array of neighbors (counter-clockwise)
+        N (int or tuple): Linear dimension of square lattice, or shape
+        shape (tuple): Extent of lattice along each axis
+        size (int): Number of lattice sites
+        geometry (XYGeometry): Neighbor structure of lattice
+        angles (array): Angle of spin at each lattice site
+        cos (array): x-component of spin at each lattice site
+        sin (array): y-component of spin at each lattice site
+        indptr, indices (array): CSR index of neighbors (see XYGeometry)
+        neighbors (array or None): (size, 2 d) table of neighbors
+                                   (counter-clockwise in 2D), None with
+                                   open boundaries
+        sublattices (list): Even and odd sites of checkerboard
+        storage (str): Storage mode of angles
+        q (int or None): Number of clock states (uint16 storage only)
+        cos_table, sin_table (array or None): Vector components of clock states
     """
-    def __init__(self, angle, site, N):
-        # Save value at site
-        self.angle = angle
-
-        # Set lattice vector
-        self.lat_vec = np.array([np.cos(self.angle), np.sin(self.angle)])
-        
-        # Save site location
-        self.site = site
-        
-        # Initialize neighbors
-        self.__neighbors(N)
+    # Known storage modes
+    storages = ('float64', 'float32', 'uint16')
+
+    def __init__(self, angles, N, bc = 'periodic', storage = 'float64', q = None):
+        # Save linear dimension or shape of lattice
+        self.N = N
+
+        # Get shape of lattice (square if N is an integer)
+        self.shape = (N, N) if np.ndim(N) == 0 else tuple(N)
+
+        # Build neighbor structure
+        self.geometry = XYGeometry(self.shape, bc)
+
+        # Save number of lattice sites
+        self.size = self.geometry.size
+
+        # Check storage mode
+        if storage not in self.storages:
+            # Tell user which storage modes are available
+            raise ValueError('Unknown storage ' + repr(storage) + ', choose from '
+                             + ', '.join(self.storages))
+
+        # Save storage mode and number of clock states
+        self.storage = storage; self.q = None; self.cos_table = None; self.sin_table = None;
+
+        # Check if angles are quantized
+        if storage == 'uint16':
+            # Save number of clock states
+            self.q = 65536 if q is None else int(q)
+
+            # Check that states fit
+            if not 2 <= self.q <= 65536:
+                # Tell user what is wrong
+                raise ValueError('Need 2 <= q <= 65536, got ' + str(self.q))
+
+            # Tabulate vector components of clock states
+            self.cos_table = np.cos(self.to_radians(np.arange(self.q)))
+            self.sin_table = np.sin(self.to_radians(np.arange(self.q)))
+
+        # Set values of spins
+        self.set_angles(angles)
+
+        # Get neighbors
+        self.indptr = self.geometry.indptr; self.indices = self.geometry.indices;
+        self.neighbors = self.geometry.neighbors
+
+        # Initialize checkerboard
+        self.sublattices = self.geometry.checkerboard()
 
         # Return nothing
         return None
 
-    """ Private Methods """
-    def __set_x(self, N):
-        """Set neighbor in x
+    """ Public methods """
+    def set_angles(self, angles):
+        """Sets angles of whole lattice
 
-        Set neighbor in x-direction
+        Sets angles of every lattice site and
+        recomputes vector components. Arrays already in the
+        stored dtype are taken as stored values (e.g. clock
+        indices read from a trajectory)
 
         Attributes:
-           N (int): Linear dimension of lattice
+            angles (array): Angle of spin at each lattice site
         """
 
-        """ Figure out neighbors in positive x-direction """
-        # Perform check to impose periodic BC's
-        if ( (self.site + 1) % N ) == 0:
-            # Set index of next neighbor on period
-            self.next_X = self.site - (N - 1)
-        else: # Set to next lattice site
-            # Set index of next neighbor
-            self.next_X = self.site + 1
-
-        """ Figure out neighbors in negative x-direction """
-        # Perform check to impose periodic BC's
-        if (self.site % N == 0):
-            # Set index of neighbor behind on period
-            self.last_X = self.site + (N - 1)
-        else: # Set to next lattice site
-            # Set index of neighbor behind
-            self.last_X = self.site - 1
-            
+        # Check if angles are given as stored values
+        if (self.storage != 'float64') and (np.asarray(angles).dtype == self.storage):
+            # Copy stored values
+            self.angles = np.array(angles); self.cos = None; self.sin = None;
+
+            # Return nothing
+            return None
+
+        # Set angles
+        self.angles = np.mod(np.asarray(angles, dtype = np.float64), 2. * np.pi)
+
+        # Check if angles are stored compactly
+        if self.storage != 'float64':
+            # Keep only stored values
+            self.angles = self.to_stored(self.angles); self.cos = None; self.sin = None;
+
+            # Return nothing
+            return None
+
+        # Set x-components of spins
+        self.cos = np.cos(self.angles)
+
+        # Set y-components of spins
+        self.sin = np.sin(self.angles)
+
         # Return nothing
         return None
-    
-    def __set_y(self, N):
-        """Set neighbor in y
 
-        Set neighbor in y-direction
+    def to_stored(self, angles):
+        """Converts angles to stored values
+
+        Converts angles in radians to the values kept in the
+        angles array (float32 angles or clock indices, rounded
+        to the nearest clock state)
 
         Attributes:
-           N (int): Linear dimension of lattice
+            angles (array): Angles in radians
         """
 
-        """ Figure out neighbors in positive y-direction """
-        # Perform check to impose periodic BC's
-        if (0 <= self.site <= N - 1):
-            # Set index of neighbor on period
-            self.next_Y = self.site + N*(N - 1)
-        else: # Set to next lattice site
-            # Set index of neighbor
-            self.next_Y = self.site - N
-
-        """ Figure out neighbros in negative y-direction """
-        if (N*(N - 1) <= self.site <= N*N - 1):
-            # Set index of last neighbor in period
-            self.last_Y = self.site - N*(N - 1)
-        else: # Set to next lattice site
-            # Set index of last neighbor
-            self.last_Y = self.site + N
-        
-        # Return nothing
-        return None
+        # Check if angles are quantized
+        if self.storage == 'uint16':
+            # Return nearest clock index
+            return (np.floor(np.mod(angles, 2. * np.pi) * (self.q / (2. * np.pi)) + 0.5)
+                    .astype(np.int64) % self.q).astype(np.uint16)
+
+        # Return angles in stored precision
+        return np.mod(angles, 2. * np.pi).astype(self.storage)
 
-    def __neighbors(self, N):
-        """Saves index of neighbors
+    def to_radians(self, stored):
+        """Converts stored values to angles
 
-        Saves index of neighbors
+        Converts values of the angles array to float64 radians
 
-        Attributes
-            ndim (int): Number of dimensions
-            dr_mthds (array): Array of dir. sttng. mthds.
+        Attributes:
+            stored (array): Stored values
         """
 
-        # Set number of dimensions
-        ndim = 2
+        # Check if angles are quantized
+        if self.storage == 'uint16':
+            # Return angles of clock indices
+            return np.asarray(stored, dtype = np.float64) * (2. * np.pi / self.q)
 
-        # Define direction methods
-        dr_mthds = [self.__set_x, self.__set_y]
+        # Return angles as float64
+        return np.asarray(stored, dtype = np.float64)
 
-        # Set directions
-        [set_dir(N) for set_dir in dr_mthds]
+    def quantize(self, angles):
+        """Rounds angles
 
-        # Set array of counter-clockwise directions
-        self.lat_neighbors = [self.next_X, self.next_Y,
-                              self.last_X, self.last_Y]
+        Rounds angles in radians to the nearest angles that can
+        be stored, so updates can compute with exactly the spins
+        they will store. Angles are unchanged with float64 storage
 
-        # Return nothing
-        return None    
-    
-    """ Public methods """
-    def set_new_lat_vec(self, lat_vec):
+        Attributes:
+            angles (array): Angles in radians
+        """
+
+        # Return rounded angles
+        return angles if self.storage == 'float64' else self.to_radians(self.to_stored(angles))
+
+    def components(self, sites = None):
+        """Gets vector components
+
+        Gets x- and y-components of spins at sites (whole lattice
+        if None). With float64 storage these are the stored arrays;
+        otherwise they are computed from the stored angles
+
+        Attributes:
+            sites (int, array or None): Locations of lattice sites
+            stored (array): Stored values at sites
+        """
+
+        # Check if vector components are stored
+        if self.storage == 'float64':
+            # Return stored components
+            return (self.cos, self.sin) if sites is None else (self.cos[sites], self.sin[sites])
+
+        # Get stored values at sites
+        stored = self.angles if sites is None else self.angles[sites]
+
+        # Check if angles are quantized
+        if self.storage == 'uint16':
+            # Return components from tables
+            return self.cos_table[stored], self.sin_table[stored]
+
+        # Return components computed from angles
+        return np.cos(np.asarray(stored, dtype = np.float64)), np.sin(np.asarray(stored, dtype = np.float64))
+
+    def reflection(self, angle):
+        """Gets reflection direction
+
+        Gets unit vector at angle, used as the direction of
+        cluster reflections. For clock models the direction is
+        moved to pi m / q + pi / 2 with m = floor(q angle / 2 pi),
+        which maps clock state k to clock state m - k
+
+        Attributes:
+            angle (float): Angle in [0, 2 pi)
+        """
+
+        # Move direction onto axes of clock states if quantized
+        if self.storage == 'uint16':
+            angle = np.pi * math.floor(angle * self.q / (2. * np.pi)) / self.q + np.pi / 2.
+
+        # Return unit vector
+        return np.array([np.cos(angle), np.sin(angle)])
+
+    def lat_vec(self, site):
+        """Gets lattice vector
+
+        Gets lattice vector at site
+
+        Attributes:
+            site (int): Location of lattice site
+        """
+
+        # Return lattice vector
+        return np.array(self.components(site))
+
+    def set_new_lat_vec(self, site, lat_vec):
         """Sets new lattice vector
-        
-        Sets new lattice vector, figures 
-        out angle
+
+        Sets new lattice vector at site, figures out angle.
+        Vector components are recomputed from the angle, so the
+        angles alone determine the lattice (as saved on disk).
+        Uses scalar libm functions, like the compiled kernels
 
         Attributes:
+            site (int): Location of lattice site
+            lat_vec (array): Array of vector components
         """
 
-        # Set lattice vector
-        self.lat_vec = lat_vec
+        # Get new angle
+        angle = math.atan2(lat_vec[-1], lat_vec[0]) % (2. * math.pi)
+
+        # Check if angles are stored compactly
+        if self.storage != 'float64':
+            # Save nearest stored value (same rounding as to_stored)
+            self.angles[site] = (math.floor(angle * (self.q / (2. * math.pi)) + 0.5) % self.q
+                                 if self.storage == 'uint16' else angle)
+
+            # Return nothing
+            return None
 
         # Set new angle
-        self.angle = np.mod(np.arctan(lat_vec[-1]/lat_vec[0]), 2. * np.pi)
+        self.angles[site] = angle
+
+        # Set lattice vector from angle
+        self.cos[site] = math.cos(self.angles[site]); self.sin[site] = math.sin(self.angles[site]);
 
         # Return nothing
         return None
+
+    def set_site_angles(self, sites, angles):
+        """Sets angles at sites
+
+        Sets angles of a group of lattice sites and
+        recomputes their vector components
+
+        Attributes:
+            sites (array): Locations of lattice sites
+            angles (array): New angles at sites
+        """
+
+        # Check if angles are stored compactly
+        if self.storage != 'float64':
+            # Save nearest stored values
+            self.angles[sites] = self.to_stored(angles)
+
+            # Return nothing
+            return None
+
+        # Set angles
+        self.angles[sites] = np.mod(angles, 2. * np.pi)
+
+        # Set x-components of spins
+        self.cos[sites] = np.cos(self.angles[sites])
+
+        # Set y-components of spins
+        self.sin[sites] = np.sin(self.angles[sites])
+
+        # Return nothing
+        return None
+
+    def set_new_lat_vecs(self, sites, cos, sin):
+        """Sets new lattice vectors
+
+        Sets new lattice vectors of a group of lattice
+        sites, figures out angles. Vector components are
+        recomputed from the angles
+
+        Attributes:
+            sites (array): Locations of lattice sites
+            cos (array): New x-components at sites
+            sin (array): New y-components at sites
+        """
+
+        # Set new angles
+        self.set_site_angles(sites, np.arctan2(sin, cos))
+
+        # Return nothing
+        return None
+
+    def coords(self, sites):
+        """Gets coordinates
+
+        Gets coordinates (x, y, ...) of sites
+
+        Attributes:
+            sites (array): Locations of lattice sites
+        """
+
+        # Return coordinates
+        return self.geometry.coords(sites)
@@ -11,8 +11,8 @@ class XYMeas:
     """
     def __init__(self):
         """ Give user information """
-        # Print outout to user
-        print('Measurement class initialized.')
+        # Tell user
+        logger.debug('Measurement class initialized.')
         
         # Return nothing
         return None
@@ -20,23 +20,47 @@ class XYMeas:
     def meas_loc_energ(self, site):
         """Measure dot product with neighbors
         
-        Measure dot product with neighbors
+        Measure energy of forward bonds of site
 
         Attributes:
+           nghbrs (list): Forward neighbor of site along each axis
+           dots (array): Dot product with each forward neighbor
         """
 
-        # Get next x and y ind
-        next_X = self.lattice[site].next_X; next_Y = self.lattice[site].next_Y;
-        
-        # Get dot with neighbor in positive x
-        dot_x = np.dot(self.lattice[site].lat_vec, self.lattice[next_X].lat_vec)
+        # Get forward neighbors
+        nghbrs = self.lattice.geometry.forward_neighbors(site)
+
+        # Get spin components of site and neighbors
+        cos, sin = self.lattice.components(np.array([site] + nghbrs))
         
-        # Get dot with neighbor in positive y
-        dot_y = np.dot(self.lattice[site].lat_vec, self.lattice[next_Y].lat_vec)
+        # Get dot with each forward neighbor
+        dots = cos[0] * cos[1:] + sin[0] * sin[1:]
         
         # Return local energy
-        return 2. - dot_x - dot_y
+        return len(nghbrs) - dots.sum()
     
+    def bond_energ(self):
+        """Measure energy of forward bonds
+
+        Measure 1 - cos(theta_i - theta_j) on every forward bond in a
+        single vectorized pass over the spin arrays. Bonds are in the
+        order of XYGeometry.bonds (by axis, then by site)
+
+        Attributes:
+           cos (array): x-component of spin at each site
+           sin (array): y-component of spin at each site
+           bond_i, bond_j (array): Ends of every forward bond
+        """
+
+        # Get spin components
+        cos, sin = self.lattice.components()
+
+        # Get forward bonds
+        bond_i, bond_j, _ = self.lattice.geometry.bonds
+
+        # Return energy of each forward bond
+        return 1. - (cos[bond_i] * cos[bond_j] + sin[bond_i] * sin[bond_j])
+
     def energ(self):
         """Measure energy
 
@@ -45,22 +69,540 @@ class XYMeas:
         Attributes:
         """
 
-        # Calculate energy
-        self.energy = self.J * sum(self.meas_loc_energ(site) for site in range(self.size))
+        # Check if compiled kernels are used
+        if self.backend == 'numba':
+            # Calculate energy with compiled loop
+            self.energy = self.J * energ_kernel(*self.lattice.components(),
+                                                *self.lattice.geometry.bonds[:2])
+        else: # Otherwise, use vectorized bond energies
+            # Calculate energy
+            self.energy = self.J * self.bond_energ().sum()
         
         # Return Nothing
         return None
 
     def magn(self):
-        """Measure mean squared magnetization
+        """Measure magnetization
 
-        Measure mean suared magnetization
+        Measure magnetization vector per site, its square
+        and the susceptibility size * |M|^2
 
         Attributes:
         """
 
-        # Calculate mean squared magnetization
-        self.mag = sum(obj.lat_vec for obj in self.lattice) / self.size
+        # Check if compiled kernels are used
+        if self.backend == 'numba':
+            # Calculate magnetization vector with compiled loop
+            self.mag = np.array(magn_kernel(*self.lattice.components())) / self.size
+        else: # Otherwise, sum arrays
+            # Get spin components
+            cos, sin = self.lattice.components()
+
+            # Calculate magnetization vector
+            self.mag = np.array([cos.sum(), sin.sum()]) / self.size
+
+        # Calculate squared magnetization
+        self.mag_sq = np.dot(self.mag, self.mag)
+
+        # Calculate susceptibility
+        self.susc = self.size * self.mag_sq
         
         # Return nothing
         return None
+
+    def meas(self):
+        """Measure observables
+
+        Measure energy, magnetization vector, squared
+        magnetization and susceptibility for this configuration
+
+        Attributes:
+        """
+
+        # Measure energy
+        self.energ()
+
+        # Measure magnetization
+        self.magn()
+
+        # Return dictionary of observables
+        return {'energy' : self.energy, 'mag' : self.mag,
+                'mag_sq' : self.mag_sq, 'susc' : self.susc}
+
+    def bkt_meas(self):
+        """Measure BKT observables
+
+        Measure observables for the Kosterlitz-Thouless analysis in a
+        single pass over the forward bonds. For every forward bond the
+        cosine, sine and wrapped difference of the angles are computed
+        once and reused for
+           - energy: J sum (1 - cos)
+           - helicity modulus: (J sum cos - J^2 (sum sin)^2) / size,
+             per axis (helicity_x, helicity_y, ...) and averaged
+             over axes
+           - vorticity: winding of angle differences around each
+             plaquette (i, i + mu, i + mu + nu, i + nu), in units of
+             2 pi, in every plane (mu, nu) of the lattice. Densities
+             are per plaquette; plaquettes cut by open boundaries are
+             left out
+        together with the magnetization and its 2nd and 4th moments.
+        Averages of mag_sq and mag_4 give the Binder cumulant (see
+        binder)
+
+        Attributes:
+           cos, sin (array): Spin components at each site
+           bond_i, bond_j (array): Ends of every forward bond
+           bond_ptr (array): Start of bonds along each axis
+           bond_cos (array): cos(theta_j - theta_i) on forward bonds
+           bond_sin (array): sin(theta_j - theta_i) on forward bonds
+           bond_diff (array): Wrapped theta_j - theta_i on forward bonds
+           diff (list): theta_j - theta_i of bond along each axis from
+                        each site (nan past last site or open boundary)
+           fwd (list): Forward neighbor along each axis of each site
+                       (size past last site or open boundary)
+           winding (array): Winding number of each plaquette
+        """
+
+        """ Gather bonds """
+        # Get spin components
+        cos, sin = self.lattice.components()
+
+        # Get forward bonds
+        bond_i, bond_j, bond_ptr = self.lattice.geometry.bonds
+
+        # Get cosine and sine of angle differences on forward bonds
+        bond_cos = cos[bond_j] * cos[bond_i] + sin[bond_j] * sin[bond_i]
+        bond_sin = sin[bond_j] * cos[bond_i] - cos[bond_j] * sin[bond_i]
+
+        # Get wrapped angle differences on forward bonds
+        bond_diff = np.arctan2(bond_sin, bond_cos)
+
+        # Get bonds along each axis
+        axes = [slice(bond_ptr[mu], bond_ptr[mu + 1]) for mu in range(len(bond_ptr) - 1)]
+
+        """ Energy and helicity modulus """
+        # Get sums of cosines and sines along each axis
+        sum_cos = np.array([bond_cos[axis].sum() for axis in axes])
+        sum_sin = np.array([bond_sin[axis].sum() for axis in axes])
+
+        # Calculate energy
+        self.energy = self.J * (len(bond_i) - sum_cos.sum())
+
+        # Calculate helicity modulus along each axis
+        helicity = (self.J * sum_cos - self.J**2 * sum_sin**2) / self.size
+
+        # Average helicity modulus over axes
+        self.helicity = helicity.mean()
+
+        """ Vortices """
+        # Initialize angle differences and forward neighbors along each axis
+        diff = [np.full(self.size + 1, np.nan) for axis in axes]
+        fwd = [np.full(self.size + 1, self.size, dtype = np.int64) for axis in axes]
+
+        # Cycle through axes
+        for mu, axis in enumerate(axes):
+            # Set angle differences and forward neighbors of bonds
+            diff[mu][bond_i[axis]] = bond_diff[axis]; fwd[mu][bond_i[axis]] = bond_j[axis];
+
+        # Get winding around each plaquette of every plane
+        winding = np.concatenate([np.rint((diff[mu] + diff[nu][fwd[mu]]
+                                           - diff[mu][fwd[nu]] - diff[nu]) / (2. * np.pi))
+                                  for mu in range(len(axes)) for nu in range(mu + 1, len(axes))]
+                                 + [np.empty(0)])
+
+        # Get number of plaquettes
+        n_plaq = max(np.count_nonzero(np.isfinite(winding)), 1)
+
+        # Get density of vortices and antivortices
+        vortices = np.count_nonzero(winding > 0) / n_plaq
+        antivortices = np.count_nonzero(winding < 0) / n_plaq
+
+        # Calculate total density of vortices
+        self.vortex_density = vortices + antivortices
+
+        """ Magnetization """
+        # Measure magnetization
+        self.magn()
+
+        # Return dictionary of observables
+        return dict({'energy' : self.energy, 'mag' : self.mag, 'mag_sq' : self.mag_sq,
+                     'mag_4' : self.mag_sq**2, 'susc' : self.susc,
+                     'helicity' : self.helicity, 'vortex_density' : self.vortex_density,
+                     'vortices' : vortices, 'antivortices' : antivortices},
+                    **{'helicity_' + ('xyz'[mu] if mu < 3 else str(mu)) : helicity[mu]
+                       for mu in range(len(axes))})
+
+    def binder(self, mag_sq, mag_4):
+        """Binder cumulant
+
+        Binder cumulant 1 - <|M|^4> / (2 <|M|^2>^2) of the O(2)
+        magnetization from averages of mag_sq and mag_4 (works
+        elementwise on arrays, e.g. jackknife samples)
+
+        Attributes:
+           mag_sq (float or array): Average of |M|^2
+           mag_4 (float or array): Average of |M|^4
+        """
+
+        # Return Binder cumulant
+        return 1. - mag_4 / (2. * mag_sq**2)
+
+    def correlation(self, radial = False):
+        """Measure spin-spin correlation function
+
+        Measure periodic two-point function G(r) = <s_i . s_i+r>
+        (averaged over i) and structure factor S(k) from d-dimensional
+        FFTs of the cos and sin fields in O(size log size):
+           S(k) = (|FFT cos|^2 + |FFT sin|^2) / size
+           G(r) = inverse FFT of S(k)
+        S(0) equals the susceptibility. S at the smallest nonzero
+        momenta, 2 pi / L along each axis of extent L = shape[0]
+        (averaged), gives the second-moment correlation length (see
+        xi_2nd). Arrays are indexed (..., y, x), last axis first.
+        Needs periodic boundaries
+
+        Attributes:
+           radial (bool): Also return radially averaged G(r)
+           shape (tuple): Shape of arrays (extents of axes, last first)
+           struct (array): Structure factor S(k)
+           corr (array): Correlation function G(r)
+           kmin (list): Index of smallest momentum along each axis
+        """
+
+        """ Structure factor and correlation function """
+        # Check that lattice is periodic
+        if 'open' in self.lattice.geometry.bc:
+            # Momenta are only defined with periodic boundaries
+            raise ValueError('Correlation function needs periodic boundaries')
+
+        # Get shape of arrays
+        shape = self.lattice.shape[::-1]
+
+        # Get spin components
+        cos, sin = self.lattice.components()
+
+        # Get structure factor
+        struct = (np.abs(np.fft.fftn(cos.reshape(shape)))**2
+                  + np.abs(np.fft.fftn(sin.reshape(shape)))**2) / self.size
+
+        # Get correlation function
+        corr = np.fft.ifftn(struct).real
+
+        # Get index of smallest momentum along each axis of extent shape[0]
+        kmin = [tuple(int(a == len(shape) - 1 - mu) for a in range(len(shape)))
+                for mu, L in enumerate(self.lattice.shape) if L == self.lattice.shape[0]]
+
+        # Get structure factor at zero and smallest nonzero momenta
+        S_0 = struct.flat[0]; S_kmin = np.mean([struct[k] for k in kmin]);
+
+        # Calculate second-moment correlation length
+        self.xi = self.xi_2nd(S_0, S_kmin)
+
+        # Create dictionary of results
+        result = {'corr' : corr, 'S_0' : S_0, 'S_kmin' : S_kmin, 'xi' : self.xi}
+
+        """ Radial average """
+        # Check if radial average is requested
+        if radial is True:
+            # Get squared shortest periodic displacement along each axis
+            disp_sq = np.meshgrid(*[np.minimum(np.arange(L), L - np.arange(L))**2 for L in shape],
+                                  indexing = 'ij')
+
+            # Get distance of every displacement, rounded to nearest integer
+            dist = np.rint(np.sqrt(sum(disp_sq))).astype(np.int64).ravel()
+
+            # Average correlation function over each distance
+            counts = np.bincount(dist)
+            result['r'] = np.flatnonzero(counts)
+            result['G_r'] = (np.bincount(dist, weights = corr.ravel())[result['r']]
+                             / counts[result['r']])
+
+        # Return results
+        return result
+
+    def xi_2nd(self, S_0, S_kmin):
+        """Second-moment correlation length
+
+        Second-moment correlation length
+        sqrt(S(0) / S(k_min) - 1) / (2 sin(pi / L)) from (averages
+        of) the structure factor at zero and smallest momenta.
+        Gives nan when S(0) < S(k_min)
+
+        Attributes:
+           S_0 (float or array): Structure factor at zero momentum
+           S_kmin (float or array): Structure factor at smallest momenta
+        """
+
+        # Get ratio of structure factors
+        ratio = np.asarray(S_0 / S_kmin - 1.)
+
+        # Return correlation length
+        return (np.sqrt(np.where(ratio >= 0., ratio, np.nan))
+                / (2. * np.sin(np.pi / self.lattice.shape[0])))
+
+    def observables(self, bkt = False):
+        """Get observables
+
+        Get current observables: running values if they are
+        being tracked, otherwise a full measurement. With bkt,
+        the BKT observables of bkt_meas are measured as well.
+        Improved estimators from the last cluster update are
+        included if they are being computed
+
+        Attributes:
+           bkt (bool): Measure BKT observables too
+           prev (str or None): Phase of instrumentation before measuring
+           obs (dict): Observables
+        """
+
+        # Time measurements
+        prev = self.instruments.enter('meas')
+
+        # Check which measurement to do
+        if bkt is True:
+            # Measure BKT observables
+            obs = self.bkt_meas()
+        elif self.track_obs is not True:
+            # Measure observables
+            obs = self.meas()
+        else: # Otherwise, use running observables
+            # Get running observables
+            obs = {'energy' : self.energy, 'mag' : self.mag,
+                   'mag_sq' : self.mag_sq, 'susc' : self.susc}
+
+        # Add improved estimators if there are any
+        obs.update(self.improved_obs) if self.improved is True else None
+
+        # Back to previous phase
+        self.instruments.enter(prev)
+
+        # Return observables
+        return obs
+
+    """ Protected methods """
+    def _init_tracking(self):
+        """Initialize running observables
+
+        Measures observables on the whole lattice and uses them as
+        the starting point of the running energy and magnetization
+
+        Attributes:
+        """
+
+        # Measure observables on whole lattice
+        self.meas()
+
+        # Set running total of magnetization vector
+        self._mag_tot = self.mag * self.size
+
+        # Reset number of updates since last full measurement
+        self._track_count = 0
+
+        # Return nothing
+        return None
+
+    def _improved_estimators(self, labels, proj):
+        """Improved estimators from clusters
+
+        Improved estimators of the susceptibility and of the
+        structure factor at the smallest nonzero momenta, from the
+        projections p_i of the spins onto the reflection direction
+        in each cluster C of the last update (n = 2 components):
+           susc_imp = n / V sum_C |sum_(i in C) p_i|^2
+           S_kmin_imp = n / V sum_C |sum_(i in C) p_i exp(i k x_i)|^2
+        For a Wolff update (one cluster, chosen with probability
+        |C| / V) the 1 / V is replaced by 1 / |C|. Cross terms between
+        clusters average to zero over the random flips, which is
+        where the reduced variance comes from. The cost is linear in
+        the number of sites in clusters. cluster_size is the size of
+        the Wolff cluster, or the mean cluster size for Swendsen-Wang
+
+        Attributes:
+           labels (array or None): Cluster of each site (None for Wolff)
+           proj (array): Projections onto reflection direction
+           axes (list): Axes of extent L = shape[0]
+           phase (array): exp(i k x) for k = 2 pi / L along each of axes
+           weight (float): Normalization of sum over clusters
+        """
+
+        # Get sites of clusters
+        sites = np.asarray(self.cluster_sites) if labels is None else np.arange(self.size)
+
+        # Get axes of extent shape[0]
+        axes = [mu for mu, L in enumerate(self.lattice.shape) if L == self.lattice.shape[0]]
+
+        # Get phases at smallest nonzero momenta along each axis
+        phase = np.exp(2.j * np.pi * self.lattice.coords(sites)[:, axes] / self.lattice.shape[0])
+
+        # Check if projections come from a single Wolff cluster
+        if labels is None:
+            # Sum over cluster
+            X = np.abs(proj.sum())**2; X_k = np.abs(proj @ phase)**2;
+
+            # Normalize by cluster size
+            weight = 2. / len(sites)
+        else: # Otherwise, sum over every cluster
+            # Sum over each cluster
+            X = np.sum(np.bincount(labels, weights = proj)**2)
+            X_k = np.array([np.sum(np.bincount(labels, weights = proj * phase[:, d].real)**2
+                                   + np.bincount(labels, weights = proj * phase[:, d].imag)**2)
+                            for d in range(phase.shape[1])])
+
+            # Normalize by lattice size
+            weight = 2. / self.size
+
+        # Save improved estimators
+        self.improved_obs = {'cluster_size' : (len(sites) if labels is None
+                                               else self.size / self.n_clusters),
+                             'susc_imp' : weight * X,
+                             'S_kmin_imp' : weight * np.mean(X_k)}
+
+        # Return nothing
+        return None
+
+    def _track_reflection(self, sites, refl_dir, old = None):
+        """Update running observables after reflection
+
+        Updates running energy and magnetization after the spins at
+        sites (marked in self._in_cluster) have been reflected about
+        refl_dir. Bonds inside the reflected set keep their energy,
+        so only bonds crossing its boundary contribute. Float32 flips
+        are rounded to stored angles, so reflections are not exact;
+        given the stored angles before the flip (old), changes are
+        computed from the old and the stored new spins instead, on
+        every bond touching the reflected set
+
+        Attributes:
+           sites (array): Sites that were reflected
+           refl_dir (array): Direction of reflection
+           old (array or None): Stored angles of sites before reflection
+           proj (array): Projection of reflected spins onto refl_dir
+           owner (array): Reflected site each neighbor belongs to
+           nghbrs (array): Neighbors of reflected sites
+           outside (array): Whether each neighbor was not reflected
+           nghbr_proj (array): Projection of neighbors onto refl_dir
+        """
+
+        """ Gather projections """
+        # Get spin components of reflected sites
+        sites = np.asarray(sites); cos, sin = self.lattice.components(sites);
+
+        # Get neighbors of reflected sites
+        owner, nghbrs = self.lattice.geometry.neighbors_of(sites)
+
+        # Get neighbors that were not reflected
+        outside = self._in_cluster[nghbrs] == 0
+
+        # Get spin components of neighbors
+        nghbr_cos, nghbr_sin = self.lattice.components(nghbrs)
+
+        # Check if stored angles before reflection are given
+        if old is not None:
+            # Update running observables from exact changes
+            self._track_rounded(sites, old, cos, sin, owner, nghbrs, outside, nghbr_cos, nghbr_sin)
+
+            # Return nothing
+            return None
+
+        # Get projections of reflected spins and neighbors
+        proj = cos * refl_dir[0] + sin * refl_dir[-1]
+        nghbr_proj = nghbr_cos * refl_dir[0] + nghbr_sin * refl_dir[-1]
+
+        """ Update running values """
+        # Update running observables from boundary bonds and flipped spins
+        self._track_delta(-2. * self.J * np.sum(proj[owner] * nghbr_proj * outside),
+                          2. * proj.sum() * refl_dir)
+
+        # Return nothing
+        return None
+
+    def _track_rounded(self, sites, old, cos, sin, owner, nghbrs, outside, nghbr_cos, nghbr_sin):
+        """Update running observables after rounded reflection
+
+        Updates running energy and magnetization from the spins of
+        sites before (old) and after reflection. Bonds inside the
+        reflected set are seen from both ends and count half each time
+
+        Attributes:
+           sites (array): Sites that were reflected
+           old (array): Stored angles of sites before reflection
+           cos, sin (array): Spin components of sites after reflection
+           owner, nghbrs (array): Bonds from sites to their neighbors
+           outside (array): Whether each neighbor was not reflected
+           nghbr_cos, nghbr_sin (array): Spin components of neighbors after reflection
+           old_cos, old_sin (array): Spin components of sites before reflection
+           pos (array): Position in sites of each neighbor (if reflected)
+        """
+
+        # Get spin components before reflection
+        old_cos = np.cos(self.lattice.to_radians(old)); old_sin = np.sin(self.lattice.to_radians(old));
+
+        # Get position in sites of reflected neighbors
+        order = np.argsort(sites)
+        pos = order[np.minimum(np.searchsorted(sites[order], nghbrs), len(sites) - 1)]
+
+        # Get spin components of neighbors before reflection
+        nghbr_old_cos = np.where(outside, nghbr_cos, old_cos[pos])
+        nghbr_old_sin = np.where(outside, nghbr_sin, old_sin[pos])
+
+        # Get change of s_i . s_j on every bond touching reflected set
+        d_dot = ((cos[owner] * nghbr_cos + sin[owner] * nghbr_sin)
+                 - (old_cos[owner] * nghbr_old_cos + old_sin[owner] * nghbr_old_sin))
+
+        # Update running observables
+        self._track_delta(-self.J * np.sum(np.where(outside, 1., 0.5) * d_dot),
+                          np.array([cos.sum() - old_cos.sum(), sin.sum() - old_sin.sum()]))
+
+        # Return nothing
+        return None
+
+    def _track_delta(self, d_energy, d_mag_tot):
+        """Update running observables from changes
+
+        Adds changes in energy and total magnetization vector to
+        running observables. Every self.track_check updates the running
+        values are compared against a full measurement and reset to it
+
+        Attributes:
+           d_energy (float): Change in energy
+           d_mag_tot (array): Change in total magnetization vector
+        """
+
+        """ Update running values """
+        # Update energy
+        self.energy += d_energy
+
+        # Update running total of magnetization vector
+        self._mag_tot = self._mag_tot + d_mag_tot
+
+        # Set magnetization vector
+        self.mag = self._mag_tot / self.size
+
+        # Set squared magnetization
+        self.mag_sq = np.dot(self.mag, self.mag)
+
+        # Set susceptibility
+        self.susc = self.size * self.mag_sq
+
+        """ Consistency check """
+        # Update number of updates since last full measurement
+        self._track_count += 1
+
+        # Check if full measurement is due
+        if self._track_count >= self.track_check:
+            # Save running energy
+            energy = self.energy
+
+            # Save running magnetization
+            mag = self.mag
+
+            # Resynchronize with full measurement
+            self._init_tracking()
+
+            # Save largest drift seen
+            self.track_drift = max(self.track_drift,
+                                   abs(energy - self.energy),
+                                   np.abs(mag - self.mag).max())
+
+        # Return nothing
+        return None
@@ -2,25 +2,52 @@
 from sim_imports import *
 
 """ XY Model Class """
-class XYSimulation(XYCluster, XYMeas):
+class XYSimulation(XYCluster, XYSwendsenWang, XYSweep, XYMeas):
     """Performs XY simulation
 
     Class implements simulation of Ising model
 
     Attributes:
-        N (int): Linear dimension of lattice
+        N (int or tuple): Linear dimension of lattice, or extent along each axis
+        shape (tuple): Extent of lattice along each axis
+        bc (str or tuple): Boundary conditions ('periodic' or 'open', per axis)
         J (float): Value of spin-spin coupling
+        alg (str): Default updates ('cluster', 'sw', 'metropolis' or 'overrelax')
+        track_obs (bool): Keep running energy and magnetization
+        track_check (int): Updates between full consistency checks
+        improved (bool): Compute improved estimators in cluster updates
+        backend (str): Kernels for Wolff growth and measurements
+                       ('numpy', or 'numba' if it is installed)
+        instruments (XYInstruments): Timers, counters and hooks of updates
+        async_save (bool): Write saved configurations in a background thread
+        max_pending (int): Saves that may wait for the background writer
+        storage (str): Storage of angles ('float64', 'float32' or 'uint16', see XYLattice)
+        q (int or None): Number of clock states with uint16 storage (65536 if None)
+        growth (str): Growth of Wolff clusters ('depth' for the depth-first walk,
+                      'frontier' for layers grown as NumPy batches)
+        schedule (list or None): Cycle of updates done by update, as (kind, count)
+                                 pairs (None for alg only, see set_schedule)
     """
+    # Available updating algorithms
+    algs = ('cluster', 'sw', 'metropolis', 'overrelax')
+
     def __init__(self, J, N, config = None, seeds = None,
                  start = None, alg = 'cluster',
-                 load_loc = './', save_loc = './'):
+                 load_loc = './', save_loc = './',
+                 track_obs = False, track_check = 1000, improved = False,
+                 backend = 'numpy', instrument = False, dim = 2, bc = 'periodic',
+                 async_save = False, max_pending = 8, storage = 'float64', q = None,
+                 growth = 'depth'):
         """ Initialize class """
-        # Create first separator
-        print('\n' + 25 * '--' + '\n')
-        
         # Initialize cluster update class
         XYCluster.__init__(self)
 
+        # Initialize Swendsen-Wang update class
+        XYSwendsenWang.__init__(self)
+
+        # Initialize sweep update class
+        XYSweep.__init__(self)
+
         # Initialize measurement class
         XYMeas.__init__(self)
         
@@ -31,18 +58,59 @@ class XYSimulation(XYCluster, XYMeas):
         # Set linear dimension of lattice
         self.N = N
 
+        # Set extent along each axis (hypercube of dimension dim if N is an integer)
+        self.shape = (N,) * dim if np.ndim(N) == 0 else tuple(N)
+
+        # Set boundary conditions
+        self.bc = bc
+
         # Set size of lattice
-        self.size = self.N * self.N
+        self.size = int(np.prod(self.shape))
+
+        # Set storage mode of angles
+        self.storage = storage
+
+        # Set number of clock states of quantized angles
+        self.q = (65536 if q is None else int(q)) if storage == 'uint16' else None
         
+        # Check that algorithm is known
+        if alg not in self.algs:
+            # Tell user which algorithms are available
+            raise ValueError('Unknown alg ' + repr(alg) + ', choose from '
+                             + ', '.join(self.algs))
+
+        # Check that over-relaxation keeps clock states
+        if (alg == 'overrelax') and (storage == 'uint16'):
+            # Reflections about the local field leave the clock states
+            raise ValueError("alg 'overrelax' needs float storage")
+
         # Set default algorithm
         self.alg = alg
+
+        # Start without schedule of updates
+        self.schedule = None; self._cycle = None;
+
+        # Check that cluster growth is known
+        if growth not in ('depth', 'frontier'):
+            # Tell user which growth strategies are available
+            raise ValueError("Unknown growth " + repr(growth) + ", choose from depth, frontier")
+
+        # Set growth of Wolff clusters
+        self.growth = growth
+
+        # Check if compiled kernels are requested but unavailable
+        if (backend == 'numba') and (HAVE_NUMBA is False):
+            # Tell user about fallback
+            logger.warning('Numba not found, falling back to numpy backend')
+
+            # Fall back to numpy
+            backend = 'numpy'
+
+        # Set backend
+        self.backend = backend
         
         # Define name for ensemble
-        self.ens_name = 'xyl' + str(self.N) + 't' + str(self.N)
-        self.ens_name += 'J' + str(self.J) + '_'
-
-        # Replace any periods with 'p'
-        self.ens_name = self.ens_name.replace('.', 'p')
+        self._set_ens_name()
         
         # Define place to load configrations/rng states
         self.load_loc = load_loc
@@ -50,18 +118,45 @@ class XYSimulation(XYCluster, XYMeas):
         # Define place to save configurations/rng states
         self.save_loc = save_loc
 
-        """ Print out some information """
+        # Set whether to keep running observables
+        self.track_obs = track_obs
+
+        # Set number of updates between full consistency checks
+        self.track_check = track_check
+
+        # Initialize largest drift seen in a consistency check
+        self.track_drift = 0.
+
+        # Initialize online accumulators
+        self.accumulators = []
+
+        # Set whether to compute improved estimators
+        self.improved = improved
+
+        # Initialize improved estimators
+        self.improved_obs = {}
+
+        # Initialize instrumentation of updates
+        self.instruments = XYInstruments(self.size, enabled = instrument)
+
+        # Start background writer of saves if requested
+        self._writer = XYCheckpointWriter(max_pending) if async_save is True else None
+
+        """ Log some information """
         # Tell user ensemble name
-        print('Ensemble name:', self.ens_name.strip('_'))
+        logger.info('Ensemble name: %s', self.ens_name.strip('_'))
 
         # Tell user default updating algorithm
-        print('Default updates: ' + self.alg)
+        logger.info('Default updates: %s', self.alg)
+
+        # Tell user backend
+        logger.info('Backend: %s', self.backend)
 
         # Tell user where configs will be loaded from
-        print('Loading dir:', self.load_loc) if config is not None else None
+        logger.info('Loading dir: %s', self.load_loc) if config is not None else None
 
         # Tell user where configurations will be saved to
-        print('Saving dir:', self.save_loc)
+        logger.info('Saving dir: %s', self.save_loc)
         
         """ Set lattice and rng up """
         # Check if seeds is None
@@ -80,133 +175,721 @@ class XYSimulation(XYCluster, XYMeas):
             
         # Set lattice up
         self.__setup_lattice(config, start)
-
-        # Create last separator
-        print('\n' + 25 * '--' + '\n')
         
         # Return nothing
         return None
 
+    """ Public methods """
+    def update(self, save = False, prnt = False):
+        """Do one update
+
+        Do one update with the default algorithm self.alg, or the
+        next update of the schedule if one is set (see set_schedule).
+        Saved configurations always go to the trajectory of self.alg
+
+        Attributes:
+           save (bool): Save configuration after update
+           prnt (bool): Print information about update
+           kind (str): Kind of update to do
+        """
+
+        # Get kind of update (position in cycle follows configuration number)
+        kind = self.alg if self.schedule is None else self._cycle[self.conf_num % len(self._cycle)]
+
+        # Check which kind of update to do
+        if kind == 'cluster':
+            # Do cluster update
+            self.cluster_update(save = save and self.schedule is None, prnt = prnt)
+        elif kind == 'sw':
+            # Do Swendsen-Wang update
+            self.sw_update(save = save and self.schedule is None, prnt = prnt)
+        else: # Otherwise, do checkerboard sweep
+            # Do sweep
+            self.sweep_update(save = save and self.schedule is None, prnt = prnt, kind = kind)
+
+        # Save scheduled update under default algorithm if requested
+        self._save_conf(self.alg, prnt) if (save is True) and (self.schedule is not None) else None
+
+        # Return nothing
+        return None
+
+    def set_schedule(self, schedule):
+        """Set schedule of updates
+
+        Set a cycle of updates for update (and stream and run) to
+        go through, as (kind, count) pairs, e.g. [('cluster', 1),
+        ('overrelax', 4)] for one Wolff update followed by four
+        over-relaxation sweeps. Each update is one configuration,
+        and the position in the cycle is the configuration number
+        modulo the length of the cycle, so resumed runs continue the
+        cycle where it was. None goes back to self.alg only
+
+        Attributes:
+           schedule (list or None): Kind and number of each step of cycle
+           kinds (list): Kinds of updates in schedule
+        """
+
+        # Check if schedule is removed
+        if schedule is None:
+            # Go back to default algorithm
+            self.schedule = None; self._cycle = None;
+
+            # Return nothing
+            return None
+
+        # Keep steps that are done at least once
+        schedule = [[str(kind), int(count)] for kind, count in schedule if int(count) > 0]
+        kinds = [kind for kind, _ in schedule]
+
+        # Check that schedule is usable
+        if len(schedule) == 0:
+            # Tell user schedule is empty
+            raise ValueError('Schedule has no updates')
+        elif any(kind not in self.algs for kind in kinds):
+            # Tell user which algorithms are available
+            raise ValueError('Unknown kind of update in ' + repr(kinds) + ', choose from '
+                             + ', '.join(self.algs))
+        elif ('overrelax' in kinds) and (self.storage == 'uint16'):
+            # Reflections about the local field leave the clock states
+            raise ValueError("Updates 'overrelax' need float storage")
+        elif (({'metropolis', 'overrelax'} & set(kinds)) and
+              (self.lattice.geometry.bipartite is False)):
+            # Same-colored sites would be neighbors across boundary
+            raise ValueError('Checkerboard sweeps need even extent along periodic axes, got '
+                             + str(self.lattice.shape))
+
+        # Set schedule and cycle of updates
+        self.schedule = schedule; self._cycle = sum([[kind] * count for kind, count in schedule], []);
+
+        # Tell user
+        logger.info('Schedule of updates: %s', ' + '.join(str(n) + ' ' + k for k, n in schedule))
+
+        # Return nothing
+        return None
+
+    def autotune(self, schedules = None, n_cycles = 200, metro_target = 0.5):
+        """Pick schedule of updates
+
+        Try each schedule (see set_schedule) for n_cycles cycles,
+        measuring the CPU time of the updates and the integrated
+        autocorrelation time of the energy and |M|^2 between cycles,
+        then set the schedule with the lowest cost per independent
+        sample, 2 tau_int CPU seconds per cycle (with the larger
+        tau_int of the two observables). A tenth of the cycles are
+        done first to adapt to each schedule, and Metropolis steps
+        scale metro_delta toward acceptance rate metro_target while
+        doing so. The updates are meant to be done during
+        thermalization. By default, schedules are one Wolff update
+        followed by 0, 1, 2, 4 or 8 over-relaxation sweeps (Metropolis
+        sweeps with uint16 storage), and Metropolis plus four
+        over-relaxation sweeps
+
+        Attributes:
+           schedules (list or None): Schedules to try
+           n_cycles (int): Cycles measured per schedule
+           metro_target (float): Acceptance rate Metropolis sweeps are tuned to
+           results (list): Schedule, tau_int, CPU time per cycle and cost of each try
+           accs (list): Autocorrelation of energy and |M|^2
+           cpu (float): CPU time of updates
+        """
+
+        # Get schedules to try
+        schedules = self.__default_schedules() if schedules is None else schedules
+
+        # Initialize results
+        results = []
+
+        # Cycle through schedules
+        for schedule in schedules:
+            # Set schedule
+            self.set_schedule(schedule)
+
+            # Adapt to schedule, tuning Metropolis proposals
+            for _ in range(max(n_cycles // 10, 1) * len(self._cycle)):
+                # Do update
+                self.update()
+
+                # Scale width of proposals toward target acceptance rate
+                if self._cycle[(self.conf_num - 1) % len(self._cycle)] == 'metropolis':
+                    self.metro_delta = min(max(self.metro_delta * self.acc_rate / metro_target,
+                                               1e-3), np.pi)
+
+            # Initialize autocorrelations and CPU time
+            accs = [AutoCorrelation('energy'), AutoCorrelation('mag_sq')]; cpu = 0.;
+
+            # Cycle through cycles
+            for _ in range(n_cycles):
+                # Do one cycle, counting CPU time of updates
+                start = time.process_time()
+                [self.update() for _ in range(len(self._cycle))]
+                cpu += time.process_time() - start
+
+                # Measure observables
+                obs = self.meas(); [acc.push_obs(obs) for acc in accs];
+
+            # Get integrated autocorrelation time
+            tau = max(acc.tau_int() for acc in accs)
+
+            # Save result
+            results.append({'schedule' : self.schedule, 'tau_int' : float(tau),
+                            'cpu_per_cycle' : cpu / n_cycles,
+                            'cost' : 2. * tau * cpu / n_cycles})
+
+            # Tell user
+            logger.info('Schedule %s: tau_int %.3g, %.3g s per cycle',
+                        self.schedule, tau, cpu / n_cycles)
+
+            # Warn if series is too short for tau_int
+            if not n_cycles >= 20. * tau:
+                logger.warning('Schedule %s: tau_int %.3g is unreliable with %d cycles',
+                               self.schedule, tau, n_cycles)
+
+        # Set cheapest schedule
+        self.set_schedule(min(results, key = lambda result: result['cost'])['schedule'])
+
+        # Return results
+        return results
+
+    def stream(self, n_updates = None, accumulators = None, save_every = None,
+               bkt = False):
+        """Stream observables
+
+        Generator that does updates with the default algorithm and
+        yields the observables after each one. The observables are
+        also pushed into the online accumulators in
+        self.accumulators, whose states are saved with every
+        configuration. Runs forever if n_updates is None
+
+        Attributes:
+           n_updates (int or None): Number of updates
+           accumulators (list or None): Accumulators to attach
+           save_every (int or None): Save when conf. num. is a multiple
+           bkt (bool): Measure BKT observables too
+           obs (dict): Observables after update
+        """
+
+        # Attach accumulators if given
+        self.accumulators = list(accumulators) if accumulators is not None else self.accumulators
+
+        # Initialize number of updates done
+        n = 0
+
+        # Keep updating
+        while (n_updates is None) or (n < n_updates):
+            # Do update
+            self.update(); n += 1;
+
+            # Get observables
+            obs = self.observables(bkt)
+
+            # Push observables into accumulators
+            [acc.push_obs(obs) for acc in self.accumulators]
+
+            # Save configuration if due
+            if (save_every is not None) and (self.conf_num % save_every == 0):
+                # Save configuration and accumulators
+                self._save_conf(self.alg, False)
+
+            # Hand observables to caller
+            yield obs
+
+    def run(self, n_therm = None, n_updates = 1000, measure_every = 1, save_every = None,
+            accumulators = None, bkt = False, resume = True, therm_window = 50,
+            therm_max = 100000, callback = None, autotune = False):
+        """Run simulation
+
+        Thermalize, then do n_updates updates with the default
+        algorithm, measuring every measure_every updates (observables
+        go into the accumulators and to callback) and saving every
+        save_every updates. Updates between measurements and saves
+        are done in tight batches. Measurements and saves happen
+        when the configuration number is a multiple of measure_every
+        and save_every, so a resumed run does exactly what an
+        uninterrupted one would have done.
+
+        If n_therm is None, thermalization continues until the means
+        of the energy over the last two windows of therm_window
+        measurements agree within two standard errors (at most
+        therm_max updates).
+
+        With save_every, the start of the run and the end of
+        thermalization are kept in a .run file next to the trajectory.
+        If resume is True and the trajectory in save_loc holds a later
+        configuration than the current one, the run picks up from its
+        last complete record (lattice, RNG states and accumulators),
+        finishing thermalization if it was cut short. The run ends n_updates
+        updates after the end of thermalization, so calling run again
+        with a larger n_updates extends it.
+
+        With autotune, thermalization starts by picking a schedule
+        of updates (see autotune; a list of schedules to try can be
+        given instead of True). The schedule and metro_delta are kept
+        in the .run file and set again when the run is resumed.
+
+        Attributes:
+           n_therm (int or None): Number of thermalization updates (None for automatic)
+           n_updates (int): Number of updates after thermalization
+           measure_every (int): Updates between measurements
+           save_every (int or None): Updates between saves (None for no saves)
+           accumulators (list or None): Accumulators to attach
+           bkt (bool): Measure BKT observables too
+           resume (bool): Resume from last configuration in save_loc
+           therm_window (int): Measurements per window of automatic thermalization
+           therm_max (int): Largest number of automatic thermalization updates
+           callback (callable or None): Called with observables of every measurement
+           autotune (bool or list): Pick schedule of updates during thermalization
+           traj (XYTrajectory): Trajectory of this ensemble in save_loc
+           state (dict): Start of run and end of thermalization
+           resumed_from (int or None): Configuration run resumed from
+           n_meas (int): Number of measurements
+        """
+
+        """ Resume if possible """
+        # Attach accumulators if given
+        self.accumulators = list(accumulators) if accumulators is not None else self.accumulators
+
+        # Get trajectory and state of run
+        traj = self._get_traj(self.save_loc, self.alg); state = self._get_run_state(traj);
+
+        # Initialize configuration run resumed from
+        resumed_from = None
+
+        # Check if there is a later configuration to resume from
+        if (resume is True) and (traj.n_records > 0) and (traj.conf_nums()[-1] > self.conf_num):
+            # Resume from last configuration
+            resumed_from = self.__resume(traj, int(traj.conf_nums()[-1]))
+
+        # Start new run unless resuming a run this configuration belongs to
+        if (resume is not True) or (state is None) or (state['conf_start'] > self.conf_num):
+            # Save start of run
+            state = {'conf_start' : self.conf_num, 'therm_end' : None}
+            self._save_run_state(traj, state) if save_every is not None else None
+
+        # Set schedule of updates picked earlier in this run
+        if 'schedule' in state:
+            # Set schedule and width of Metropolis proposals
+            self.set_schedule(state['schedule']); self.metro_delta = state['metro_delta'];
+
+        """ Thermalize """
+        # Check if thermalization still has to be done
+        if state['therm_end'] is None:
+            # Tell user
+            logger.info('Thermalizing from conf. num. %d', self.conf_num)
+
+            # Pick schedule of updates if requested and not picked yet
+            if (autotune is not False) and ('schedule' not in state):
+                # Try schedules
+                self.autotune(None if autotune is True else autotune)
+
+                # Save schedule and width of Metropolis proposals
+                state['schedule'] = self.schedule; state['metro_delta'] = self.metro_delta;
+                self._save_run_state(traj, state) if save_every is not None else None
+
+            # Thermalize for fixed number of updates or until energy stops drifting
+            if n_therm is not None:
+                # Do remaining thermalization updates
+                self.__advance(state['conf_start'] + n_therm, measure_every, save_every)
+            else: # Otherwise, thermalize automatically
+                # Thermalize until converged
+                self.__thermalize(measure_every, save_every, therm_window, therm_max)
+
+            # Save end of thermalization
+            state['therm_end'] = self.conf_num
+            self._save_run_state(traj, state) if save_every is not None else None
+
+            # Tell user
+            logger.info('Thermalized after %d updates', state['therm_end'] - state['conf_start'])
+
+        """ Measure """
+        # Measure until end of run
+        n_meas = self.__advance(state['therm_end'] + n_updates, measure_every, save_every,
+                                bkt, callback)
+
+        # Save last configuration if it was not saved yet
+        if (save_every is not None) and (self.conf_num % save_every != 0):
+            # Save configuration and accumulators
+            self._save_conf(self.alg, False)
+
+        # Wait for saves
+        self.flush()
+
+        # Return summary of run
+        return {'conf_start' : state['conf_start'], 'therm_end' : state['therm_end'],
+                'n_therm' : state['therm_end'] - state['conf_start'], 'conf_num' : self.conf_num,
+                'n_meas' : n_meas, 'resumed_from' : resumed_from}
+
+    def flush(self):
+        """Flush saves
+
+        Wait until every configuration saved so far is on disk. Does
+        nothing unless saves are written in the background
+
+        Attributes:
+        """
+
+        # Wait for background writer
+        self._writer.flush() if self._writer is not None else None
+
+        # Return nothing
+        return None
+
+    def set_coupling(self, J):
+        """Set coupling
+
+        Set spin-spin coupling and rename ensemble to match. Used
+        when couplings are exchanged between replicas
+
+        Attributes:
+           J (float): New value of spin-spin coupling
+        """
+
+        # Set coupling
+        self.J = J
+
+        # Rename ensemble
+        self._set_ens_name()
+
+        # Remeasure energy at new coupling if tracking observables
+        self.energ() if self.track_obs is True else None
+
+        # Return nothing
+        return None
+
     """ Protected methods """
+    def _set_ens_name(self):
+        """Set ensemble name
+
+        Set ensemble name from lattice shape, boundary conditions,
+        coupling and storage, e.g. xyl16t16J1p0, xyl16x16t16J1p0open2
+        (open boundaries along axis 2), xyl16t16J1p0f32 (float32 angles)
+        or xyl16t16J1p0q6 (6-state clock model)
+
+        Attributes:
+           bc (tuple): Boundary condition along each axis
+        """
+
+        # Define name for ensemble
+        self.ens_name = 'xyl' + 'x'.join(str(L) for L in self.shape[:-1]) + 't' + str(self.shape[-1])
+        self.ens_name += 'J' + str(self.J)
+
+        # Add axes with open boundaries
+        bc = (self.bc,) * len(self.shape) if isinstance(self.bc, str) else tuple(self.bc)
+        self.ens_name += ('open' + ''.join(str(mu) for mu, b in enumerate(bc) if b == 'open')
+                          if 'open' in bc else '')
+
+        # Add storage of angles
+        self.ens_name += {'float64' : '', 'float32' : 'f32'}.get(self.storage, 'q' + str(self.q)) + '_'
+
+        # Replace any periods with 'p'
+        self.ens_name = self.ens_name.replace('.', 'p')
+
+        # Return nothing
+        return None
+
     def _rand_site(self):
         """Sample lattice sites
 
         Sample lattice sites
 
         Attributes:
+           prev (str or None): Phase of instrumentation before drawing
         """
+        # Time draw
+        prev = self.instruments.enter('rng')
+
+        # Draw lattice site
+        site = self._site_rng.randint(self.size)
+
+        # Back to previous phase
+        self.instruments.enter(prev)
+
         # Return lattice site
-        return self._site_rng.randint(0, self.size - 1)
+        return site
 
-    def _rand_angle(self):
+    def _rand_angle(self, n = None):
         """Sample angle
         
         Sample angle from uniform distribution
 
         Attributes:
+           n (int or None): Number of angles to draw (None for one)
+           prev (str or None): Phase of instrumentation before drawing
         """
+        # Time draw
+        prev = self.instruments.enter('rng')
+
+        # Draw angle
+        angle = self._angl_rng.uniform(0., 2. * np.pi, size = n)
+
+        # Back to previous phase
+        self.instruments.enter(prev)
+
         # Return angle
-        return self._angl_rng.uniform(0., 2. * np.pi)
+        return angle
 
-    def _rand_zero_to_one(self):
+    def _rand_zero_to_one(self, n = None):
         """Sample randum number for test
         
         Sample random number between 0 and 1
 
         Attributes:
+           n (int or None): Number of random numbers to draw (None for one)
+           prev (str or None): Phase of instrumentation before drawing
         """
+        # Time draw
+        prev = self.instruments.enter('rng')
+
+        # Draw random number between zero and one
+        rand_num = self._prob_rng.uniform(0., 1., size = n)
+
+        # Back to previous phase
+        self.instruments.enter(prev)
+
         # Return random number between zero and one
-        return self._prob_rng.uniform(0., 1.)
+        return rand_num
 
     def _init_rngs(self, prnt = True):
         """Initializes RNG random states
 
-        Initializes RNG random states
+        Initializes buffered RNG's for sites, angles and MC tests,
+        each with its own seed
 
         Attributes:
         """
 
         """ Initialize RNG's """
         # Initialize RNG for sites
-        self._site_rng = np.random.RandomState(seed = self.seeds['sites'])
+        self._site_rng = BufferedRNG(seed = self.seeds['sites'])
         
         # Initialize RNG for angles
-        self._angl_rng = np.random.RandomState(seed = self.seeds['angles'])
+        self._angl_rng = BufferedRNG(seed = self.seeds['angles'])
 
         # Initialize RNG for MC
-        self._prob_rng = np.random.RandomState(seed = self.seeds['probabilities'])
+        self._prob_rng = BufferedRNG(seed = self.seeds['probabilities'])
 
         """ Extra information """
-        # Check if print is true
+        # Check if logging is requested
         if prnt is True:
             # Cycle through seed keys
             for key in self.seeds.keys():
-                # Print out name of seed
-                print('Initialized ' + key + ' state w/',
-                      str(self.seeds[key]) + ' integer')
+                # Log name of seed
+                logger.info('Initialized %s state w/ %s integer', key, self.seeds[key])
         
         # Return nothing
         return None
     
+    def _get_traj(self, loc, alg):
+        """Get trajectory
+
+        Get trajectory store of this ensemble and algorithm in
+        directory loc. Stores are kept open between calls
+
+        Attributes:
+           loc (str): Directory of trajectory
+           alg (str): MC algorithm that generated configurations
+        """
+
+        # Create name of trajectory
+        traj_name = loc + self.ens_name + alg + '.traj'
+
+        # Initialize open trajectories if necessary
+        self._trajs = {} if not hasattr(self, '_trajs') else self._trajs
+
+        # Open trajectory if necessary
+        if traj_name not in self._trajs:
+            # Open trajectory
+            self._trajs[traj_name] = XYTrajectory(traj_name, N = self.N, J = self.J,
+                                                  alg = alg, seeds = self.seeds,
+                                                  dtype = self.storage, shape = self.shape,
+                                                  q = self.q)
+
+        # Return trajectory
+        return self._trajs[traj_name]
+
     def _save_conf(self, alg, prnt):
         """Save configuration
 
-        Save configuration
+        Save configuration and rng states as a new record of the
+        trajectory store of this ensemble. With a background writer,
+        only copies of the angles and states are taken here and the
+        record is written by the writer thread
 
         Attributes:
            alg (str): MC algorithm that generated configuration
+           prnt (bool): Log at INFO level instead of DEBUG
+           prev (str or None): Phase of instrumentation before saving
+           rng_states (list): States of site, angle and prob rng's
+           acc_json (str or None): States of accumulators as JSON
         """
 
         """ General information """
-        # Create configuration name
-        full_conf_name = self.ens_name + alg + '.' + str(self.conf_num)
-        
-        """ First, save information about the lattice """
-        # Define lattice name
-        lat_name = self.save_loc + full_conf_name + '.lat'
-        
+        # Time saving
+        prev = self.instruments.enter('io')
+
+        # Get trajectory
+        traj = self._get_traj(self.save_loc, alg)
+
+        """ Get information about RNG and accumulator states """
+        # Get states of site, angle and prob rng's
+        rng_states = [self._site_rng.get_state(), self._angl_rng.get_state(),
+                      self._prob_rng.get_state()]
+
+        # Get states of accumulators if there are any
+        acc_json = (json.dumps({'conf_num' : self.conf_num,
+                                'accumulators' : [acc.get_state() for acc in self.accumulators]})
+                    if len(self.accumulators) > 0 else None)
+
+        """ Save lattice and rng states """
+        # Check if saves are written in background
+        if self._writer is None:
+            # Write configuration
+            self._write_conf(traj, self.conf_num, self.lattice.angles, rng_states, acc_json)
+        else: # Otherwise, hand copy of configuration to writer
+            # Queue write
+            self._writer.submit(self._write_conf, traj, self.conf_num,
+                                self.lattice.angles.copy(), rng_states, acc_json)
+
+        # Tell user what you did
+        logger.log(logging.INFO if prnt is True else logging.DEBUG,
+                   ('Saved' if self._writer is None else 'Queued')
+                   + ' lattice and rng states to %s', traj.path)
+
+        # Back to previous phase
+        self.instruments.enter(prev)
+
+        # Return nothing
+        return None
+
+    def _write_conf(self, traj, conf_num, angles, rng_states, acc_json):
+        """Write configuration
+
+        Append configuration to trajectory and save accumulators
+        next to it. Runs in the writer thread with async_save
+
+        Attributes:
+           traj (XYTrajectory): Trajectory to append to
+           conf_num (int): Configuration number
+           angles (array): Angle of every lattice site
+           rng_states (list): States of rng's
+           acc_json (str or None): States of accumulators as JSON
+        """
+
+        # Append record to trajectory
+        traj.append(conf_num, angles, rng_states)
+
+        # Save accumulators alongside rng states if there are any
+        self._save_accumulators(traj, acc_json) if acc_json is not None else None
+
+        # Return nothing
+        return None
+
+    def _save_accumulators(self, traj, acc_json):
+        """Save accumulators
+
+        Save states of accumulators, tagged with configuration
+        number, next to trajectory. File is replaced atomically
+
+        Attributes:
+           traj (XYTrajectory): Trajectory configuration was saved to
+           acc_json (str): Configuration number and states as JSON
+        """
+
+        # Define accumulator file name
+        acc_name = traj.path[:-len('.traj')] + '.acc'
+
+        # Write states to temporary file
+        with open(acc_name + '.tmp', 'w') as out_file:
+            # Save configuration number and states
+            out_file.write(acc_json)
+
+        # Replace old file
+        os.replace(acc_name + '.tmp', acc_name)
+
+        # Return nothing
+        return None
+
+    def _save_run_state(self, traj, state):
+        """Save state of run
+
+        Save start of run and end of thermalization next to
+        trajectory. File is replaced atomically
+
+        Attributes:
+           traj (XYTrajectory): Trajectory of run
+           state (dict): Start of run and end of thermalization
+        """
+
+        # Define run file name
+        run_name = traj.path[:-len('.traj')] + '.run'
+
+        # Write state to temporary file
+        with open(run_name + '.tmp', 'w') as out_file:
+            # Save state
+            json.dump(state, out_file)
+
+        # Replace old file
+        os.replace(run_name + '.tmp', run_name)
+
+        # Return nothing
+        return None
+
+    def _get_run_state(self, traj):
+        """Grabs state of run
+
+        Grabs state of run saved next to trajectory, if any
+
+        Attributes:
+           traj (XYTrajectory): Trajectory of run
+        """
+
+        # Define run file name
+        run_name = traj.path[:-len('.traj')] + '.run'
+
+        # Check if state was saved
+        if not os.path.exists(run_name):
+            # No state
+            return None
+
         # Open file
-        with open(lat_name, 'wb+') as out_file:
-            # Get angles of configuration
-            angles = [site.angle for site in self.lattice]
+        with open(run_name, 'r') as in_file:
+            # Return saved state
+            return json.load(in_file)
 
-            # Save angles to file
-            pickle.dump(angles, out_file)
+    def _get_accumulators(self, traj):
+        """Grabs accumulators
 
-            # Tell user what you did
-            print('Saved lattice to ' + lat_name) if prnt is True else None
+        Grabs accumulators saved with this configuration, if any
 
-        """ Now, save information about RNG state """
-        # Define rng name
-        rng_name = self.save_loc + full_conf_name + '.rng'
-        
-        # Get state of site rng
-        site_state = self._site_rng.get_state()
+        Attributes:
+           traj (XYTrajectory): Trajectory configuration was read from
+        """
 
-        # Get state of angle rng
-        angl_state = self._angl_rng.get_state()
+        # Define accumulator file name
+        acc_name = traj.path[:-len('.traj')] + '.acc'
 
-        # Get state of prob rng
-        prob_state = self._prob_rng.get_state()
+        # Check if accumulators were saved
+        if os.path.exists(acc_name):
+            # Open file
+            with open(acc_name, 'r') as in_file:
+                # Get saved states
+                saved = json.load(in_file)
 
-        # Open file to set rng states
-        with open(rng_name, 'wb+') as out_file:
-            # Put states in numpy array
-            state_arr = [site_state, angl_state, prob_state]
+            # Check if states belong to this configuration
+            if saved['conf_num'] == self.conf_num:
+                # Rebuild accumulators
+                self.accumulators = [accumulator_from_state(state)
+                                     for state in saved['accumulators']]
 
-            # Save array of states to rng file
-            pickle.dump(state_arr, out_file)
+                # Tell user what you did
+                logger.info('Grabbed accumulators from %s', acc_name)
 
-            # Tell user what you did
-            print('Saved rng states to ' + rng_name) if prnt is True else None
-            
         # Return nothing
         return None
 
-    def _get_conf(self):
-        """Grabs configuration
+    def _get_legacy_conf(self):
+        """Grabs legacy configuration
 
-        Grabs configuration
+        Grabs configuration saved as pickled .lat and .rng files
 
         Attributes:
         """
@@ -223,37 +906,67 @@ class XYSimulation(XYCluster, XYMeas):
         with open(lat_name, 'rb') as in_file:
             # Get angles
             angles = pickle.load(in_file)
-            
-            # Reconstruct lattice
-            self.lattice = [XYLattice(angle, site, self.N)
-                            for site, angle in enumerate(angles)]
 
             # Tell user what you did
-            print('Grabbed lattice from ' + lat_name)
+            logger.info('Grabbed lattice from %s', lat_name)
 
         """ Grab information on RNG state """
         # Define rng name
         rng_name = self.load_loc + full_conf_name + '.rng'
 
-        # Initialize RNG states (a bit redundant)
-        self._init_rngs(prnt = False)
-        
         # Open file containing information about lattice
         with open(rng_name, 'rb') as in_file:
             # Define state array
             state_arr = pickle.load(in_file)
 
-            # Set state for site rng
-            self._site_rng.set_state(state_arr[0])
+            # Tell user what you did
+            logger.info('Grabbed rng states from %s', rng_name)
+            
+        # Return angles and rng states
+        return angles, state_arr
 
-            # Set state for angle rng
-            self._angl_rng.set_state(state_arr[1])
+    def _get_conf(self):
+        """Grabs configuration
+
+        Grabs configuration from trajectory store of this ensemble,
+        or from legacy pickled files if there is no trajectory
+
+        Attributes:
+        """
 
-            # Set state for probability rng
-            self._prob_rng.set_state(state_arr[-1])
+        """ Grab lattice configuration and RNG state """
+        # Get trajectory
+        traj = self._get_traj(self.load_loc, self.alg)
+
+        # Check if trajectory exists
+        if os.path.exists(traj.path):
+            # Read record
+            angles, state_arr = traj.read(self.conf_num, raw = True)
 
             # Tell user what you did
-            print('Grabbed rng states from ' + rng_name)
+            logger.info('Grabbed lattice and rng states from %s', traj.path)
+        else: # Otherwise, fall back to legacy files
+            # Read legacy files
+            angles, state_arr = self._get_legacy_conf()
+
+        # Reconstruct lattice
+        self.lattice = XYLattice(angles, self.shape, self.bc, self.storage, self.q)
+
+        # Restore accumulators saved with this configuration
+        self._get_accumulators(traj)
+
+        """ Set RNG states """
+        # Initialize RNG states (a bit redundant)
+        self._init_rngs(prnt = False)
+
+        # Set state for site rng
+        self._site_rng.set_state(state_arr[0])
+
+        # Set state for angle rng
+        self._angl_rng.set_state(state_arr[1])
+
+        # Set state for probability rng
+        self._prob_rng.set_state(state_arr[-1])
             
         # Return nothing
         return None
@@ -274,19 +987,19 @@ class XYSimulation(XYCluster, XYMeas):
             start_rng = np.random.RandomState(seed = self.seeds['start'])
             
             # Set lattice with hot start
-            self.lattice = [XYLattice(start_rng.uniform(0., 2. * np.pi),
-                                      site, self.N)
-                            for site in range(self.size)]
+            self.lattice = XYLattice(start_rng.uniform(0., 2. * np.pi,
+                                                       size = self.size),
+                                     self.shape, self.bc, self.storage, self.q)
 
             # Tell user what you did
-            print('Initialized lattice with hot start')
+            logger.info('Initialized lattice with hot start')
         elif start['start'] == 'cold':
             # Set lattice with cold start
-            self.lattice = [XYLattice(start['angle'], site, self.N)
-                            for site in range(self.size)]
+            self.lattice = XYLattice(np.full(self.size, start['angle']),
+                                     self.shape, self.bc, self.storage, self.q)
 
             # Tell user what you did
-            print('Initialized lattice with hot start')
+            logger.info('Initialized lattice with cold start')
             
         """ Last housekeeping """
         # Initialize RNG states
@@ -299,6 +1012,163 @@ class XYSimulation(XYCluster, XYMeas):
         return None
 
     """ Private methods """
+    def __default_schedules(self):
+        """Default schedules
+
+        Schedules autotune tries by default: one Wolff update with
+        0, 1, 2, 4 or 8 sweeps (over-relaxation, or Metropolis with
+        uint16 storage), and Metropolis plus four over-relaxation
+        sweeps. Only Wolff updates if checkerboard sweeps are not
+        possible
+
+        Attributes:
+           sweep (str): Kind of sweep added to Wolff updates
+        """
+
+        # Check if checkerboard sweeps are possible
+        if self.lattice.geometry.bipartite is False:
+            # Only Wolff updates
+            return [[('cluster', 1)]]
+
+        # Get kind of sweep that keeps stored angles
+        sweep = 'overrelax' if self.storage != 'uint16' else 'metropolis'
+
+        # Return schedules
+        return ([[('cluster', 1), (sweep, k)] for k in (0, 1, 2, 4, 8)]
+                + [[('metropolis', 1), ('overrelax', 4 if sweep == 'overrelax' else 0)]])
+
+    def __advance(self, conf_end, measure_every, save_every, bkt = None, callback = None):
+        """Advance simulation
+
+        Do updates until conf_end in batches between measurements
+        and saves. Measurements are only done if bkt is not None
+
+        Attributes:
+           conf_end (int): Configuration number to stop at
+           measure_every (int): Updates between measurements
+           save_every (int or None): Updates between saves
+           bkt (bool or None): Measure BKT observables too (None for no measurements)
+           callback (callable or None): Called with observables of every measurement
+           step (method): Update with default algorithm (or schedule)
+           n_meas (int): Number of measurements
+        """
+
+        # Get update with default algorithm (or schedule)
+        step = ({'cluster' : self.cluster_update, 'sw' : self.sw_update}.get(self.alg, self.sweep_update)
+                if self.schedule is None else self.update)
+
+        # Get updates between events
+        every = [n for n in (measure_every if bkt is not None else None, save_every) if n is not None]
+
+        # Initialize number of measurements
+        n_meas = 0
+
+        # Keep updating until end
+        while self.conf_num < conf_end:
+            # Do updates until next measurement, save or end
+            for _ in range(min([conf_end] + [(self.conf_num // n + 1) * n for n in every])
+                           - self.conf_num):
+                step()
+
+            # Measure if due
+            if (bkt is not None) and (self.conf_num % measure_every == 0):
+                # Get observables
+                obs = self.observables(bkt); n_meas += 1;
+
+                # Push observables into accumulators
+                [acc.push_obs(obs) for acc in self.accumulators]
+
+                # Hand observables to caller
+                callback(obs) if callback is not None else None
+
+            # Save configuration if due
+            if (save_every is not None) and (self.conf_num % save_every == 0):
+                # Save configuration and accumulators
+                self._save_conf(self.alg, False)
+
+        # Return number of measurements
+        return n_meas
+
+    def __thermalize(self, measure_every, save_every, therm_window, therm_max):
+        """Thermalize automatically
+
+        Update until the means of the energy over the last two
+        windows of therm_window measurements agree within two
+        standard errors, or therm_max updates were done
+
+        Attributes:
+           measure_every (int): Updates between measurements
+           save_every (int or None): Updates between saves
+           therm_window (int): Measurements per window
+           therm_max (int): Largest number of updates
+           conf_max (int): Configuration number to stop at
+           energies (list): Energy at each measurement
+        """
+
+        # Get configuration number to stop at
+        conf_max = self.conf_num + therm_max
+
+        # Initialize energies
+        energies = []
+
+        # Keep updating until converged
+        while self.conf_num < conf_max:
+            # Update until next measurement
+            self.__advance(min((self.conf_num // measure_every + 1) * measure_every, conf_max),
+                           measure_every, save_every)
+
+            # Measure energy (running value if tracked)
+            self.energ() if self.track_obs is not True else None; energies.append(self.energy);
+
+            # Check if two full windows are done
+            if (len(energies) >= 2 * therm_window) and (len(energies) % therm_window == 0):
+                # Get last two windows
+                old = np.array(energies[-2 * therm_window:-therm_window])
+                new = np.array(energies[-therm_window:])
+
+                # Stop if means agree within two standard errors
+                if (abs(new.mean() - old.mean())
+                    <= 2. * np.sqrt((old.var() + new.var()) / therm_window)):
+                    break
+
+        # Return nothing
+        return None
+
+    def __resume(self, traj, conf_num):
+        """Resume run
+
+        Pick simulation up from configuration of trajectory,
+        including RNG states and accumulators
+
+        Attributes:
+           traj (XYTrajectory): Trajectory to resume from
+           conf_num (int): Configuration to resume from
+           accumulators (list): Accumulators attached before resuming
+        """
+
+        # Wait for saves
+        self.flush()
+
+        # Keep accumulators attached before resuming
+        accumulators = self.accumulators
+
+        # Load configuration from save location
+        self.load_loc = self.save_loc; self.__setup_lattice(conf_num, None);
+
+        # Copy restored states into attached accumulators
+        if (self.accumulators is not accumulators) and (len(self.accumulators) == len(accumulators)):
+            # Restore state of each accumulator
+            [acc.set_state(saved.get_state()) for acc, saved in zip(accumulators, self.accumulators)]
+
+            # Keep attached accumulators
+            self.accumulators = accumulators
+
+        # Tell user
+        logger.info('Resumed from conf. num. %d of %s', conf_num, traj.path)
+
+        # Return configuration resumed from
+        return conf_num
+
     def __setup_lattice(self, config, start):
         """Set lattice up
         
@@ -330,6 +1200,12 @@ class XYSimulation(XYCluster, XYMeas):
             
             # Load configuration
             self._get_conf()
+
+        # Initialize cluster mask
+        self._init_cluster_mask()
+
+        # Initialize running observables if requested
+        self._init_tracking() if self.track_obs is True else None
         
         # Return nothing
         return None
@@ -0,0 +1,203 @@
+""" External modules """
+# Numpy for number crunching operations
+import numpy as np
+
+""" Buffered RNG class """
+class BufferedRNG(object):
+    """Buffered random number generator
+
+    Hands out uniform random numbers from a preallocated block
+    drawn from a numpy.random.Generator, so single draws in hot
+    loops do not call into NumPy. Numbers are handed out in the
+    same order as the underlying bit generator produces them,
+    however they are requested (one at a time or in batches).
+
+    The state saved by get_state is the bit generator state just
+    before the current block was drawn, plus the position in the
+    block, so a restored generator continues bit-for-bit.
+
+    Attributes:
+        block (int): Number of random numbers drawn per block
+        bit_gen (BitGenerator): Underlying bit generator
+        gen (Generator): Generator wrapping bit generator
+        buffer (array): Current block of uniform random numbers
+        pos (int): Position of next number in block
+    """
+    def __init__(self, seed = None, block = 4096, bit_gen = 'PCG64'):
+        # Save number of random numbers per block
+        self.block = block
+
+        # Create bit generator
+        self.bit_gen = getattr(np.random, bit_gen)(seed)
+
+        # Create generator
+        self.gen = np.random.Generator(self.bit_gen)
+
+        # Draw first block
+        self.refill()
+
+        # Return nothing
+        return None
+
+    """ Public methods """
+    def refill(self):
+        """Refill buffer
+
+        Save bit generator state and draw a new block. Called
+        when the block is used up, including by compiled kernels
+        that read the block directly
+
+        Attributes:
+        """
+
+        # Save state of bit generator before drawing block
+        self._fill_state = self.bit_gen.state
+
+        # Draw block
+        self.buffer = self.gen.random(self.block)
+
+        # Keep copy as list for fast single draws
+        self._list = self.buffer.tolist()
+
+        # Reset position in block
+        self.pos = 0
+
+        # Return nothing
+        return None
+
+    def random(self, size = None):
+        """Sample uniform random numbers
+
+        Sample uniform random numbers in [0, 1)
+
+        Attributes:
+            size (int or None): Number of random numbers (None for one)
+            out (array): Batch of random numbers
+            take (int): Number of random numbers taken from buffer
+            n_blocks (int): Number of whole blocks drawn directly
+        """
+
+        """ Single draw """
+        # Check if only one number is requested
+        if size is None:
+            # Refill buffer if exhausted
+            self.refill() if self.pos == self.block else None
+
+            # Move on to next number
+            self.pos += 1
+
+            # Return number
+            return self._list[self.pos - 1]
+
+        """ Batch of draws """
+        # Allocate batch
+        out = np.empty(size)
+
+        # Take what is left in buffer
+        take = min(size, self.block - self.pos)
+        out[:take] = self.buffer[self.pos:self.pos + take]; self.pos += take;
+
+        # Check if more numbers are needed
+        if take < size:
+            # Get number of whole blocks to draw directly
+            n_blocks = (size - take) // self.block
+
+            # Draw whole blocks directly into batch
+            out[take:take + n_blocks * self.block] = self.gen.random(n_blocks * self.block)
+
+            # Move past whole blocks
+            take += n_blocks * self.block
+
+            # Refill buffer
+            self.refill()
+
+            # Take rest of batch from buffer
+            self.pos = size - take; out[take:] = self.buffer[:self.pos];
+
+        # Return batch
+        return out
+
+    def uniform(self, low = 0., high = 1., size = None):
+        """Sample uniform random numbers
+
+        Sample uniform random numbers in [low, high)
+
+        Attributes:
+            low (float): Lower bound
+            high (float): Upper bound
+            size (int or None): Number of random numbers (None for one)
+        """
+
+        # Return scaled random numbers
+        return low + (high - low) * self.random(size)
+
+    def randint(self, high, size = None):
+        """Sample random integers
+
+        Sample random integers in [0, high)
+
+        Attributes:
+            high (int): Upper bound
+            size (int or None): Number of random integers (None for one)
+        """
+
+        # Check if only one number is requested
+        if size is None:
+            # Return integer
+            return int(self.random() * high)
+
+        # Return batch of integers
+        return (self.random(size) * high).astype(np.int64)
+
+    def get_state(self):
+        """Get state
+
+        Get state of bit generator before current
+        block was drawn and position in block
+
+        Attributes:
+        """
+
+        # Return state
+        return {'bit_generator' : self._fill_state, 'pos' : self.pos,
+                'block' : self.block}
+
+    def set_state(self, state):
+        """Set state
+
+        Set state saved by get_state. The state of a legacy
+        np.random.RandomState (a tuple) is also accepted, in which
+        case the generator continues the legacy MT19937 stream
+
+        Attributes:
+            state (dict or tuple): State to restore
+        """
+
+        # Check if state is from legacy RandomState
+        if isinstance(state, tuple):
+            # Convert to state of fresh MT19937 block
+            state = {'bit_generator' : {'bit_generator' : 'MT19937',
+                                        'state' : {'key' : state[1],
+                                                   'pos' : state[2]}},
+                     'pos' : 0, 'block' : self.block}
+
+        # Create bit generator of right kind
+        self.bit_gen = getattr(np.random, state['bit_generator']['bit_generator'])()
+
+        # Set state of bit generator
+        self.bit_gen.state = state['bit_generator']
+
+        # Create generator
+        self.gen = np.random.Generator(self.bit_gen)
+
+        # Set number of random numbers per block
+        self.block = state['block']
+
+        # Redraw block
+        self.refill()
+
+        # Set position in block
+        self.pos = state['pos']
+
+        # Return nothing
+        return None
@@ -0,0 +1,38 @@
+""" External modules """
+# For locating source modules
+import os
+import sys
+
+# Pytest for fixtures
+import pytest
+
+""" Source modules """
+# Make modules in src importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+""" Fixtures """
+@pytest.fixture
+def seeds():
+    """Seeds of test simulations
+
+    Fixed seeds so every test sees the same chain
+
+    Attributes:
+    """
+
+    # Return seeds dictionary
+    return {'start' : 1, 'angles' : 2, 'probabilities' : 3, 'sites' : 4}
+
+@pytest.fixture
+def save_loc(tmp_path):
+    """Save location
+
+    Temporary directory for trajectories, with trailing slash as
+    XYSimulation expects
+
+    Attributes:
+        tmp_path (Path): Temporary directory of test
+    """
+
+    # Return directory
+    return str(tmp_path) + os.sep
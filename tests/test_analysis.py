@@ -0,0 +1,32 @@
+""" External modules """
+# Pytest for parametrizing
+import pytest
+
+""" Local modules """
+# Simulation class
+from xy_model import XYSimulation
+
+# Ensemble name parser
+from analysis import parse_ens_name
+
+""" Tests """
+@pytest.mark.parametrize('J', [1.0, 0.1, -1.0, 1e-05, 1.5e-07, 2e+20])
+@pytest.mark.parametrize('shape, bc, storage, q', [(4, 'periodic', 'float64', None),
+                                                   ((4, 6), ('periodic', 'open'), 'float32', None),
+                                                   ((3, 4, 5), ('open', 'periodic', 'open'), 'uint16', 6)])
+def test_ens_name_round_trip(J, shape, bc, storage, q):
+    # Create simulation and parse its ensemble name
+    sim = XYSimulation(J, shape, bc = bc, storage = storage, q = q)
+    params = parse_ens_name(sim.ens_name)
+
+    # Check parameters
+    assert params['J'] == J
+    assert params['shape'] == sim.shape
+    assert params['bc'] == ((bc,) * len(sim.shape) if isinstance(bc, str) else bc)
+    assert params['storage'] == storage
+    assert params['q'] == (sim.q if storage == 'uint16' else None)
+
+def test_parse_rejects_other_names():
+    # Check that a name that is not an ensemble name raises
+    with pytest.raises(ValueError):
+        parse_ens_name('xyl16t16Jeq')
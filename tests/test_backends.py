@@ -0,0 +1,52 @@
+""" External modules """
+# Numpy for comparing lattices
+import numpy as np
+
+# Pytest for parametrizing
+import pytest
+
+""" Local modules """
+# Simulation class
+from xy_model import XYSimulation
+
+# Skip if compiled backend is not available
+pytest.importorskip('numba')
+
+""" Tests """
+@pytest.mark.parametrize('storage, q', [('float64', None), ('float32', None), ('uint16', 7),
+                                        ('uint16', None)])
+@pytest.mark.parametrize('alg', ['cluster', 'sw', 'metropolis'])
+def test_numba_matches_numpy(seeds, alg, storage, q):
+    """numba and numpy backends give the same chain bit-for-bit"""
+
+    # Create one simulation per backend
+    sims = [XYSimulation(1.0, 16, alg = alg, storage = storage, q = q, backend = backend,
+                         seeds = dict(seeds), track_obs = True)
+            for backend in ('numpy', 'numba')]
+
+    # Do the same updates
+    for _ in range(100):
+        [sim.update() for sim in sims]
+
+    # Check that lattices are identical
+    assert np.array_equal(sims[0].lattice.angles, sims[1].lattice.angles)
+
+    # Check that running observables agree (initial sums differ in order of summation)
+    assert sims[0].energy == pytest.approx(sims[1].energy, rel = 1e-12)
+    assert np.allclose(sims[0].mag, sims[1].mag, rtol = 0., atol = 1e-12)
+
+@pytest.mark.parametrize('N, dim, bc', [((6, 4, 5), 3, ('open', 'periodic', 'open')),
+                                        ((16, 12), 2, 'open')])
+def test_numba_matches_numpy_geometry(seeds, N, dim, bc):
+    """Backends agree on open and higher-dimensional lattices"""
+
+    # Create one simulation per backend
+    sims = [XYSimulation(1.0, N, dim = dim, bc = bc, backend = backend, seeds = dict(seeds))
+            for backend in ('numpy', 'numba')]
+
+    # Do the same updates
+    for _ in range(100):
+        [sim.update() for sim in sims]
+
+    # Check that lattices are identical
+    assert np.array_equal(sims[0].lattice.angles, sims[1].lattice.angles)
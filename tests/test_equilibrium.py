@@ -0,0 +1,53 @@
+""" External modules """
+# Numpy for averages
+import numpy as np
+
+# Pytest for parametrizing
+import pytest
+
+""" Local modules """
+# Simulation class
+from xy_model import XYSimulation
+
+""" Helpers """
+def mean_energy(alg, seeds, n_updates = 4000, n_blocks = 20):
+    """Mean energy
+
+    Mean energy per site and its error from blocks of an
+    equilibrium run on an 8 x 8 lattice at J = 1
+
+    Attributes:
+        alg (str): MC algorithm
+        seeds (dict): Seeds of simulation
+        n_updates (int): Number of measured updates
+        n_blocks (int): Number of blocks for error
+        energies (array): Energy per site after every update
+        blocks (array): Mean energy of each block
+    """
+
+    # Create simulation and thermalize
+    sim = XYSimulation(1.0, 8, alg = alg, seeds = seeds, track_obs = True)
+    [sim.update() for _ in range(500)]
+
+    # Measure energy after every update
+    energies = np.empty(n_updates)
+    for n in range(n_updates):
+        sim.update(); energies[n] = sim.energy / sim.size;
+
+    # Get means of blocks
+    blocks = energies.reshape(n_blocks, -1).mean(axis = 1)
+
+    # Return mean and error
+    return blocks.mean(), blocks.std(ddof = 1) / np.sqrt(n_blocks)
+
+""" Tests """
+@pytest.mark.parametrize('alg', ['sw', 'metropolis'])
+def test_energy_agrees_with_wolff(seeds, alg):
+    """Swendsen-Wang and Metropolis sample the same energy as Wolff updates"""
+
+    # Get mean energies with Wolff updates and with alg
+    wolff, wolff_err = mean_energy('cluster', seeds)
+    other, other_err = mean_energy(alg, {key : seed + 10 for key, seed in seeds.items()})
+
+    # Check that means agree within four standard errors
+    assert abs(wolff - other) < 4. * np.hypot(wolff_err, other_err)
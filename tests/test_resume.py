@@ -0,0 +1,111 @@
+""" External modules """
+# Numpy for comparing lattices
+import numpy as np
+
+# Pytest for parametrizing
+import pytest
+
+""" Local modules """
+# Simulation class
+from xy_model import XYSimulation
+
+# Trajectory store
+from trajectory import XYTrajectory
+
+# Online accumulators
+from accumulators import RunningMean, LogBinning
+
+""" Helpers """
+def rng_states(sim):
+    """Get RNG states
+
+    States of the buffered RNG's of a simulation, including the
+    position in the current block
+
+    Attributes:
+        sim (XYSimulation): Simulation
+    """
+
+    # Return states of site, angle and probability RNG's
+    return [sim._site_rng.get_state(), sim._angl_rng.get_state(), sim._prob_rng.get_state()]
+
+""" Tests """
+@pytest.mark.parametrize('alg', ['cluster', 'sw', 'metropolis'])
+@pytest.mark.parametrize('async_save', [False, True])
+def test_resume_from_trajectory(seeds, save_loc, alg, async_save):
+    """Loading a saved configuration restores lattice and RNG states exactly"""
+
+    # Run simulation, saving configuration 20
+    sim = XYSimulation(1.0, 8, alg = alg, seeds = dict(seeds), save_loc = save_loc,
+                       async_save = async_save)
+    [sim.update(save = (n == 19)) for n in range(20)]
+    sim.flush()
+
+    # Keep lattice and RNG states at save
+    angles = sim.lattice.angles.copy(); states = rng_states(sim);
+
+    # Check that trajectory holds the configuration
+    traj = XYTrajectory(sim._get_traj(save_loc, alg).path)
+    assert list(traj.conf_nums()) == [20]
+    assert np.array_equal(traj.read(20, raw = True)[0], angles)
+
+    # Load saved configuration
+    resumed = XYSimulation(1.0, 8, alg = alg, seeds = dict(seeds), config = 20,
+                           load_loc = save_loc, save_loc = save_loc)
+
+    # Check that lattice and RNG states are restored
+    assert resumed.conf_num == 20
+    assert np.array_equal(resumed.lattice.angles, angles)
+    assert rng_states(resumed) == states
+
+    # Check that both continue with the same chain
+    for _ in range(30):
+        sim.update(); resumed.update();
+    assert np.array_equal(sim.lattice.angles, resumed.lattice.angles)
+    assert rng_states(sim) == rng_states(resumed)
+
+@pytest.mark.parametrize('alg', ['cluster', 'metropolis'])
+def test_resume_run(seeds, tmp_path, alg):
+    """An interrupted and resumed run ends where an uninterrupted one does"""
+
+    # Get directories of uninterrupted and interrupted runs
+    (tmp_path / 'full').mkdir(); (tmp_path / 'cut').mkdir();
+    full_loc = str(tmp_path / 'full') + '/'; cut_loc = str(tmp_path / 'cut') + '/';
+
+    # Get arguments of runs
+    kwargs = {'n_therm' : 30, 'measure_every' : 3, 'save_every' : 20}
+
+    # Do uninterrupted run
+    full = XYSimulation(1.0, 8, alg = alg, seeds = dict(seeds), save_loc = full_loc)
+    full_accs = [RunningMean('energy'), LogBinning('energy')]
+    full.run(n_updates = 200, accumulators = full_accs, **kwargs)
+
+    # Do part of run, then updates that are never saved (lost in a crash)
+    cut = XYSimulation(1.0, 8, alg = alg, seeds = dict(seeds), save_loc = cut_loc)
+    cut.run(n_updates = 80, accumulators = [RunningMean('energy'), LogBinning('energy')],
+            **kwargs)
+    [cut.update() for _ in range(7)]
+
+    # Resume run in a new simulation
+    resumed = XYSimulation(1.0, 8, alg = alg, seeds = dict(seeds), save_loc = cut_loc)
+    resumed_accs = [RunningMean('energy'), LogBinning('energy')]
+    resumed.run(n_updates = 200, accumulators = resumed_accs, **kwargs)
+
+    # Check that runs end in the same state
+    assert resumed.conf_num == full.conf_num
+    assert np.array_equal(resumed.lattice.angles, full.lattice.angles)
+    assert rng_states(resumed) == rng_states(full)
+    assert [acc.get_state() for acc in resumed_accs] == [acc.get_state() for acc in full_accs]
+
+def test_append_checks_header(seeds, save_loc):
+    """Appending to a trajectory of another chain is refused"""
+
+    # Save a configuration
+    sim = XYSimulation(1.0, 8, seeds = dict(seeds), save_loc = save_loc)
+    sim.update(save = True)
+
+    # Try to save a configuration with other seeds to the same trajectory
+    other = XYSimulation(1.0, 8, seeds = {key : seed + 10 for key, seed in seeds.items()},
+                         save_loc = save_loc)
+    with pytest.raises(ValueError):
+        other.update(save = True)
@@ -0,0 +1,61 @@
+""" External modules """
+# Numpy for grids
+import numpy as np
+
+# Pytest for fixtures
+import pytest
+
+""" Local modules """
+# Simulation class
+from xy_model import XYSimulation
+
+# Reweighting class
+from reweighting import XYReweighting
+
+""" Fixtures """
+@pytest.fixture(scope = 'module')
+def reweighting():
+    """Reweighting
+
+    Reweighting of short Wolff runs on an 8 x 8 lattice at
+    couplings around the specific heat peak
+
+    Attributes:
+        rw (XYReweighting): Reweighting of runs
+        sim (XYSimulation): Simulation at one coupling
+    """
+
+    # Create reweighting
+    rw = XYReweighting(64)
+
+    # Cycle through couplings
+    for J in [0.8, 0.9, 1.0]:
+        # Create simulation and thermalize
+        sim = XYSimulation(J, 8, seeds = {'start' : 1, 'angles' : 2, 'probabilities' : 3, 'sites' : 4})
+        [sim.update() for _ in range(300)]
+
+        # Add run
+        rw.add_observables(J, list(sim.stream(4000)))
+
+    # Return reweighting
+    return rw
+
+""" Tests """
+def test_peak_matches_fine_grid(reweighting):
+    # Get peak and estimate on a fine grid
+    peak = reweighting.peak('specific_heat')
+    Js = np.linspace(0.8, 1.0, 2001)
+    values = reweighting.estimate('specific_heat', Js, errors = False)
+
+    # Check peak is inside the range of runs
+    assert 0.8 < peak['J'] < 1.0
+
+    # Check location and height against maximum on grid
+    step = Js[1] - Js[0]
+    assert abs(peak['J'] - Js[np.argmax(values)]) <= 3 * peak['J_err'] + 2 * step
+    assert abs(peak['height'] - values.max()) <= 3 * peak['height_err']
+
+def test_peak_at_edge_of_range(reweighting):
+    # Energy decreases with the coupling, so its maximum is at the lower edge
+    peak = reweighting.peak('energy', J_range = (0.85, 0.95))
+    assert peak['J'] == pytest.approx(0.85)
@@ -0,0 +1,31 @@
+""" External modules """
+# Numpy for counting marked sites
+import numpy as np
+
+# Pytest for comparing floats
+import pytest
+
+""" Local modules """
+# Simulation class
+from xy_model import XYSimulation
+
+""" Tests """
+def test_mixed_schedule_keeps_mask_clean(seeds):
+    """Wolff updates mixed with Swendsen-Wang updates mark only the new cluster"""
+
+    # Create simulation alternating Wolff and Swendsen-Wang updates
+    sim = XYSimulation(1.0, 16, seeds = seeds, track_obs = True)
+    sim.set_schedule([('cluster', 1), ('sw', 1)])
+
+    # Cycle through updates
+    for _ in range(400):
+        # Do update
+        sim.update()
+
+        # Check that mask marks exactly the last Wolff cluster
+        if sim.conf_num % 2 == 1:
+            assert np.count_nonzero(sim._in_cluster) == len(sim.cluster_sites)
+
+    # Check that running energy matches a full measurement
+    energy = sim.energy; sim.energ();
+    assert energy == pytest.approx(sim.energy, abs = 1e-9)